@@ -1,17 +1,38 @@
 import os
 import json
-import io
-from excel_utils import create_excel_report, create_pdf_report
+import base64
+import zlib
+import gzip
+import hashlib
+import hmac
+import uuid
+import time
+import shutil
+
+# Đo thời gian nạp module (import thư viện + dựng app), xem ở /metrics: app_startup_seconds
+_import_started = time.perf_counter()
+from collections import namedtuple, Counter
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+from excel_utils import create_excel_report, create_pdf_report, create_batch_report, write_rows_to_excel, create_tickets_pdf, TICKET_PDF_CHUNK, PDF_FONT_PATH, REPORT_TEMPLATE
+from cache_utils import TTLCache, FileCache
+from metrics_utils import metrics, Histogram, COUNT_BUCKETS, SIZE_BUCKETS
+from snapshot_utils import SnapshotRow, TableSnapshot, SnapshotCache
+from compress_utils import COMPRESSIBLE_MIMETYPES, choose_encoding, compress_bytes, compress_stream
+from stats_utils import extract_arrays, column_stats, group_stats, day_mask, daily_sums
+from search_utils import build_search_text, search_terms
+from import_utils import IMPORT_EXTENSIONS, split_cell_value, iter_import_rows, find_header_row, parse_import_row
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from functools import wraps
-import openpyxl
-from openpyxl import load_workbook
-from xhtml2pdf import pisa 
+import ijson
 
 app = Flask(__name__)
 app.secret_key = 'bi_mat_cua_teo_v7_final' 
@@ -23,7 +44,188 @@ if db_url and db_url.startswith("postgres://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Pool kết nối Postgres: giữ sẵn vài kết nối để request không phải bắt tay TCP + SSL lại với server ở xa.
+# DB_POOL_RECYCLE (giây): kết nối cũ hơn thì mở lại, tránh dùng trúng kết nối đã bị pooler / NAT cắt ngầm.
+# gunicorn gthread (gunicorn.conf.py): mỗi process có WEB_THREADS thread phục vụ request + JOB_WORKERS thread chạy job,
+# mỗi thread giữ 1 kết nối lúc đang chạy; pool mặc định đủ cho tất cả để không thread nào phải chờ kết nối.
+# Session database thì Flask-SQLAlchemy đã tách riêng theo từng request (app context) nên chạy nhiều thread an toàn.
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 1))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', max(5, WEB_THREADS + int(os.environ.get('JOB_WORKERS', 2)))))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_PRE_PING = os.environ.get('DB_PRE_PING', '1') != '0'
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+# Câu SQL chạy quá lâu thì Postgres tự hủy (ms, 0 = không giới hạn). Job chạy nền (xuất file, backup) được lâu hơn.
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+DB_JOB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_JOB_STATEMENT_TIMEOUT_MS', 0))
+statement_timeout_ms = ContextVar('statement_timeout_ms', default=DB_STATEMENT_TIMEOUT_MS)
+
+def is_transaction_pooler(url):
+    # Pooler chế độ transaction (PgBouncer / Supavisor cổng 6543): mỗi transaction có thể sang 1 kết nối server khác,
+    # nên không được dùng gì gắn với session (SET, prepared statement, tham số "options" lúc kết nối)
+    flag = os.environ.get('DB_PGBOUNCER', '').strip()
+    if flag:
+        return flag != '0'
+    return url.port == 6543
+
+def build_engine_options(db_url):
+    # Lưu JSON giữ nguyên tiếng Việt (không \uXXXX) để database tìm/sắp xếp theo key và giá trị được
+    options = {'json_serializer': lambda obj: json.dumps(obj, ensure_ascii=False)}
+    if not db_url:
+        return options
+    url = make_url(db_url)
+    if url.get_backend_name() != 'postgresql':
+        return options
+
+    # TCP keepalive (tham số libpq, psycopg2 và psycopg 3 đều nhận): kết nối nằm chờ trong pool không bị tường lửa cắt ngầm
+    connect_args = {'connect_timeout': DB_CONNECT_TIMEOUT, 'application_name': 'ghichu',
+                    'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3}
+    if is_transaction_pooler(url):
+        if url.get_dialect().driver == 'psycopg':
+            connect_args['prepare_threshold'] = None  # psycopg 3 tự prepare câu lặp lại -> lỗi qua PgBouncer
+    elif DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_PRE_PING,
+        pool_use_lifo=True,  # dùng lại kết nối vừa trả, kết nối thừa nằm yên tới lúc recycle
+        connect_args=connect_args
+    )
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(db_url)
+
 db = SQLAlchemy(app)
+
+def set_statement_timeout(conn):
+    # Đầu mỗi transaction: SET LOCAL chỉ sống tới hết transaction nên an toàn qua pooler.
+    # Kết nối thẳng đã có timeout mặc định từ lúc kết nối, chỉ SET khi job cần giá trị khác.
+    timeout = statement_timeout_ms.get()
+    if timeout != db_session_timeout:
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+with app.app_context():
+    if db.engine.dialect.name == 'postgresql':
+        db_session_timeout = 0 if is_transaction_pooler(db.engine.url) else DB_STATEMENT_TIMEOUT_MS
+        event.listen(db.engine, 'begin', set_statement_timeout)
+
+# --- ĐO HIỆU NĂNG: THỜI GIAN ROUTE, SỐ CÂU SQL, CỠ RESPONSE ---
+# Số liệu nằm trong RAM của từng process, xem ở /metrics (Prometheus) hoặc /admin/metrics.
+# 1 câu SQL (cùng câu lệnh, khác tham số) chạy từ N_PLUS_ONE_THRESHOLD lần trở lên trong 1 request / job -> cảnh báo N+1.
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 20))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+metrics.describe('http_requests_total', 'counter', 'So request theo route, method, ma tra ve')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Thoi gian xu ly request (response stream: toi luc bat dau gui)')
+metrics.describe('http_response_size_bytes', 'histogram', 'Co response (khong tinh response stream)')
+metrics.describe('db_queries_per_request', 'histogram', 'So cau SQL moi request / job')
+metrics.describe('db_seconds_per_request', 'histogram', 'Tong thoi gian SQL moi request / job')
+metrics.describe('db_query_duration_seconds', 'histogram', 'Thoi gian tung cau SQL')
+metrics.describe('n_plus_one_warnings_total', 'counter', 'So lan 1 cau SQL bi lap qua N_PLUS_ONE_THRESHOLD lan')
+metrics.describe('job_duration_seconds', 'histogram', 'Thoi gian chay job nen')
+metrics.describe('report_render_seconds', 'histogram', 'Thoi gian tao file Excel / PDF')
+metrics.describe('file_cache_requests_total', 'counter', 'Xuat Excel / backup / bao cao: lay lai file cache (hit) hay phai tao moi (miss)')
+metrics.describe('app_startup_seconds', 'gauge', 'Thoi gian nap app.py (import + kiem tra database)')
+
+def start_sql_tracking():
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+    g.sql_statements = Counter()
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    metrics.observe('db_query_duration_seconds', elapsed)
+    if has_app_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+        g.sql_statements[statement] += 1
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+
+def record_sql_usage(endpoint, check_repeats=True):
+    if 'sql_count' not in g:
+        return
+    metrics.observe('db_queries_per_request', g.sql_count, buckets=COUNT_BUCKETS, endpoint=endpoint)
+    metrics.observe('db_seconds_per_request', g.sql_seconds, endpoint=endpoint)
+    if check_repeats and g.sql_statements:
+        statement, repeats = g.sql_statements.most_common(1)[0]
+        if repeats >= N_PLUS_ONE_THRESHOLD:
+            sql = ' '.join(statement.split())[:300]
+            print(f"Cảnh báo N+1: {endpoint} chạy 1 câu SQL {repeats} lần (tổng {g.sql_count} câu): {sql}")
+            metrics.inc('n_plus_one_warnings_total', endpoint=endpoint)
+            metrics.warn(sql, endpoint=endpoint, repeats=repeats, queries=g.sql_count)
+    g.pop('sql_count')
+    g.pop('sql_seconds')
+    g.pop('sql_statements')
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    start_sql_tracking()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    endpoint = request.endpoint or 'not_found'  # URL lạ gộp chung, không để mỗi URL 1 nhãn
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_started, endpoint=endpoint)
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    if response.content_length is not None:
+        metrics.observe('http_response_size_bytes', response.content_length, buckets=SIZE_BUCKETS, endpoint=endpoint)
+    record_sql_usage(endpoint)
+    return response
+
+# --- NÉN RESPONSE (gzip / brotli) ---
+# Trang chính (HTML + data_map JSON), /api/rows, file backup JSON... là chữ, nén nhỏ đi 5-10 lần.
+# gunicorn không tự nén nên nén ngay trong app; COMPRESS=0 để tắt (khi đã có nginx / CDN nén phía trước).
+COMPRESS = os.environ.get('COMPRESS', '1') != '0'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+
+def closing_compressed(body, encoding):
+    # Body là file (send_file) hoặc generator: nén dần từng khối, xong / client ngắt giữa chừng thì đóng file gốc
+    try:
+        yield from compress_stream(buffer_chunks(body), encoding)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+# Đăng ký sau record_request_metrics nên chạy trước nó (after_request chạy ngược thứ tự): cỡ response đo được là cỡ sau khi nén
+@app.after_request
+def compress_response(response):
+    if not COMPRESS or request.method == 'HEAD' or response.status_code != 200 \
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_sequence and not response.direct_passthrough:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    else:
+        if response.content_length is not None and response.content_length < COMPRESS_MIN_BYTES:
+            return response
+        response.response = closing_compressed(response.response, encoding)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+        response.headers.pop('Accept-Ranges', None)  # vị trí byte sau khi nén khác file gốc
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)  # bản nén khác từng byte với bản gốc, chỉ còn "cùng nội dung"
+    return response
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -34,29 +236,165 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), default='user')
+    deleted_at = db.Column(db.DateTime)  # đã bấm xóa, dữ liệu đang được dọn dần ở nền (xem PURGE_*)
 
 class AppTable(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
+    deleted_at = db.Column(db.DateTime)
 
 class TableColumn(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     width = db.Column(db.String(20), default='150px')
     order_index = db.Column(db.Integer, default=0)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    table_id = db.Column(db.Integer, db.ForeignKey('app_table.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    table_id = db.Column(db.Integer, db.ForeignKey('app_table.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_table_column_user_table', 'user_id', 'table_id', 'order_index'),
+    )
+
+# Khóa sắp xếp so theo byte (collation "C" trên Postgres) để khớp thứ tự sort của Python
+SORT_KEY_TYPE = db.Text().with_variant(db.Text(collation='C'), 'postgresql')
 
 class DataRow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.JSON, nullable=False) 
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    table_id = db.Column(db.Integer, db.ForeignKey('app_table.id'), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    table_id = db.Column(db.Integer, db.ForeignKey('app_table.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow) 
+    sort_key = db.Column(SORT_KEY_TYPE, default='')
+    content_hash = db.Column(db.String(64))
+    search_text = db.Column(db.Text)
+    version = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.Index('ix_data_row_owner_table_created', 'created_by', 'table_id', 'created_at'),
+        db.Index('ix_data_row_owner_table_sort', 'created_by', 'table_id', 'sort_key', 'id'),
+        db.Index('ix_data_row_owner_table_hash', 'created_by', 'table_id', 'content_hash'),
+        db.Index('ix_data_row_owner_table_version', 'created_by', 'table_id', 'version'),
+        db.Index('ix_data_row_table', 'table_id', 'id'),  # xóa cả bảng (mọi user) theo từng lô
+    )
+
+# Số phiên bản dữ liệu của từng (user, bảng): mỗi lần ghi tăng 1, dòng được ghi mang số đó
+class TableVersion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    table_id = db.Column(db.Integer, db.ForeignKey('app_table.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    columns_version = db.Column(db.Integer, nullable=False, default=0)  # lần đổi cột gần nhất
+    min_version = db.Column(db.Integer, nullable=False, default=0)  # dấu xóa cũ hơn số này đã bị dọn
+
+# Dấu vết dòng đã xóa, để client đang mở bảng biết mà gỡ dòng đó đi
+class DeletedRow(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    row_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    table_id = db.Column(db.Integer, db.ForeignKey('app_table.id', ondelete='CASCADE'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_deleted_row_owner_table_version', 'user_id', 'table_id', 'version'),
+        db.Index('ix_deleted_row_deleted_at', 'deleted_at'),
+    )
+
+class Job(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / done / error
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    params = db.Column(db.JSON, default=dict)
+    filename = db.Column(db.String(255))
+    mimetype = db.Column(db.String(100))
+    result_path = db.Column(db.String(500))
+    error = db.Column(db.Text)
+    progress = db.Column(db.Integer)        # job dài (xóa bảng / user): đã làm bao nhiêu / tổng bao nhiêu
+    progress_total = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_user_created', 'user_id', 'created_at'),
+        db.Index('ix_job_status_created', 'status', 'created_at'),
+    )
+
+# Dấu của cấu trúc database đã nâng cấp (upgrade_schema ghi lại), để lúc khởi động chỉ cần 1 câu SELECT để biết có phải nâng cấp không
+class SchemaInfo(db.Model):
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(100))
+
+# --- CACHE THÔNG TIN BẢNG / CỘT / USER ---
+# Cache trong từng process; ghi xong phải gọi invalidate_* để lần đọc sau lấy lại từ DB.
+# Process khác (nếu chạy nhiều worker) sẽ thấy thay đổi chậm nhất sau METADATA_CACHE_TTL giây.
+metadata_cache = TTLCache(
+    maxsize=int(os.environ.get('METADATA_CACHE_SIZE', 2048)),
+    ttl=float(os.environ.get('METADATA_CACHE_TTL', 30))
+)
+
+# Bản sao chỉ-đọc (không gắn session) để giữ trong cache qua nhiều request
+TableInfo = namedtuple('TableInfo', 'id name')
+ColumnInfo = namedtuple('ColumnInfo', 'id name width order_index')
+
+class CachedUser(UserMixin):
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+
+def get_all_tables():
+    return metadata_cache.get('tables', lambda: [
+        TableInfo(t.id, t.name) for t in AppTable.query.filter(AppTable.deleted_at.is_(None)).order_by(AppTable.id).all()
+    ])
+
+def get_table(table_id):
+    try:
+        table_id = int(table_id)
+    except (TypeError, ValueError):
+        return None
+    return next((t for t in get_all_tables() if t.id == table_id), None)
+
+def get_table_or_404(table_id):
+    table = get_table(table_id)
+    if table is None:
+        abort(404)
+    return table
+
+def load_columns(user_id, table_id):
+    return [
+        ColumnInfo(c.id, c.name, c.width, c.order_index)
+        for c in TableColumn.query.filter_by(user_id=user_id, table_id=table_id).order_by(TableColumn.order_index, TableColumn.id).all()
+    ]
+
+def get_columns(user_id, table_id):
+    return metadata_cache.get(('columns', int(user_id), int(table_id)), lambda: load_columns(user_id, table_id))
+
+def get_columns_for_write(user_id, table_id):
+    # Ghi dữ liệu thì đọc cột thẳng từ database, không tin cache: worker khác vừa thêm / đổi tên cột mà cache ở đây còn cũ
+    # (tới METADATA_CACHE_TTL giây) thì sẽ mất giá trị cột mới hoặc lưu dưới tên cột cũ. Không ghi vào cache vì có thể đang
+    # ở giữa transaction sửa cột chưa commit. Gọi SAU bump_table_version: các route sửa cột cũng lấy khóa table_version
+    # ĐẦU TIÊN (trước khi đọc cột / đụng tới dòng nào), nên không chen vào giữa lúc đọc cột và lúc commit được,
+    # và mọi đường ghi đều khóa theo cùng 1 thứ tự (table_version rồi mới tới data_row) -> không deadlock.
+    return load_columns(user_id, table_id)
+
+def invalidate_tables():
+    metadata_cache.invalidate('tables')
+
+def invalidate_columns(user_id=None, table_id=None):
+    metadata_cache.invalidate(match=lambda k: k[0] == 'columns'
+                              and (user_id is None or k[1] == int(user_id))
+                              and (table_id is None or k[2] == int(table_id)))
+
+def invalidate_user(user_id):
+    metadata_cache.invalidate(('user', int(user_id)))
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    def load():
+        user = User.query.get(int(user_id))
+        return CachedUser(user) if user and user.deleted_at is None else None
+    return metadata_cache.get(('user', int(user_id)), load)
 
 def admin_required(f):
     @wraps(f)
@@ -67,135 +405,1419 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# --- KHÓA SẮP XẾP (SORT KEY) ---
+# Ghép giá trị các cột theo thứ tự hiển thị, ngăn bằng ký tự \x1f (nhỏ hơn mọi ký tự in được)
+# nên so sánh chuỗi cho kết quả y như so sánh tuple từng cột.
+SORT_KEY_SEP = '\x1f'
+SORT_KEY_MAX = 500
+
+def build_sort_key(content, col_names):
+    content = content or {}
+    sort_values = []
+    for name in col_names:
+        val = content.get(name, '')
+        if isinstance(val, list):
+            val = " ".join(str(v) for v in val)
+        sort_values.append(str(val).lower().strip())
+    return SORT_KEY_SEP.join(sort_values)[:SORT_KEY_MAX]
+
+def get_col_names(user_id, table_id):
+    return [c.name for c in get_columns_for_write(user_id, table_id)]
+
+# Mã băm nội dung: 2 dòng trùng nội dung (không tính thứ tự key) có cùng mã -> chống trùng bằng index
+def build_content_hash(content):
+    canonical = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def build_row_keys(content, col_names):
+    # Các cột tính sẵn từ content, phải ghi kèm mỗi khi thêm/sửa 1 dòng
+    return {
+        'sort_key': build_sort_key(content, col_names),
+        'content_hash': build_content_hash(content),
+        'search_text': build_search_text(content, col_names)
+    }
+
+def rename_content_key(user_id, table_id, old_name, new_name):
+    # Đổi tên 1 key trong content của mọi dòng bằng 1 câu UPDATE duy nhất.
+    # content_hash đặt về NULL: người gọi phải fill_content_hashes trước khi commit, không thì khôi phục backup không nhận ra dòng trùng.
+    dialect = db.engine.dialect.name
+    params = {'uid': user_id, 'tid': table_id, 'old': old_name, 'new': new_name}
+    if dialect == 'postgresql':
+        sql = """
+            UPDATE data_row
+            SET content = ((content::jsonb - CAST(:old AS text))
+                           || jsonb_build_object(CAST(:new AS text), content::jsonb -> CAST(:old AS text)))::json,
+                content_hash = NULL
+            WHERE created_by = :uid AND table_id = :tid AND (content::jsonb -> CAST(:old AS text)) IS NOT NULL
+        """
+    elif dialect == 'sqlite':
+        # JSON1: dựng lại object từ json_each, giữ nguyên vị trí key (không cần JSON path nên tên cột có dấu " vẫn đúng)
+        sql = """
+            UPDATE data_row
+            SET content = (
+                    SELECT json_group_object(
+                        CASE WHEN key = :old THEN :new ELSE key END,
+                        CASE type WHEN 'true' THEN json('true') WHEN 'false' THEN json('false') ELSE value END)
+                    FROM json_each(data_row.content) WHERE key <> :new),
+                content_hash = NULL
+            WHERE created_by = :uid AND table_id = :tid
+              AND EXISTS (SELECT 1 FROM json_each(data_row.content) WHERE key = :old)
+        """
+    else:
+        # Database khác: làm kiểu cũ trên Python
+        count = 0
+        for row in DataRow.query.filter_by(created_by=user_id, table_id=table_id).all():
+            if row.content and old_name in row.content:
+                updated = dict(row.content)
+                updated[new_name] = updated.pop(old_name)
+                row.content = updated
+                row.content_hash = build_content_hash(updated)
+                count += 1
+        db.session.flush()
+        return count
+    return db.session.execute(db.text(sql), params).rowcount
+
+def fill_content_hashes(user_id, table_id, batch_size=1000):
+    # Tính content_hash cho các dòng đang NULL (sau khi đổi tên cột)
+    updates = [{'id': row_id, 'content_hash': build_content_hash(content)}
+               for row_id, content in db.session.query(DataRow.id, DataRow.content)
+               .filter_by(created_by=user_id, table_id=table_id)
+               .filter(DataRow.content_hash.is_(None)).yield_per(batch_size)]
+    for i in range(0, len(updates), batch_size):
+        db.session.execute(db.update(DataRow), updates[i:i + batch_size])
+    return len(updates)
+
+def refresh_row_keys(user_id, table_id, batch_size=1000):
+    # Gọi sau khi cột bị thêm/xóa/đổi tên/đổi thứ tự: tính lại sort_key, content_hash, search_text, chỉ ghi những dòng bị đổi
+    db.session.flush()
+    col_names = get_col_names(user_id, table_id)
+    updates = []
+    rows = db.session.query(DataRow.id, DataRow.content, DataRow.sort_key, DataRow.content_hash, DataRow.search_text) \
+        .filter_by(created_by=user_id, table_id=table_id).yield_per(batch_size)
+    for row_id, content, old_key, old_hash, old_search in rows:
+        keys = build_row_keys(content, col_names)
+        if (keys['sort_key'], keys['content_hash'], keys['search_text']) != (old_key, old_hash, old_search):
+            keys['id'] = row_id
+            updates.append(keys)
+    for i in range(0, len(updates), batch_size):
+        db.session.execute(db.update(DataRow), updates[i:i + batch_size])
+    return len(updates)
+
+# --- PHÂN TRANG DỮ LIỆU (KEYSET) ---
+ROW_PAGE_SIZE = 100
+ROW_PAGE_MAX = 500
+# Chế độ cuộn ảo: mỗi lần cuộn gần hết thì tải thêm chừng này dòng
+VIRTUAL_PAGE_SIZE = 200
+# Bảng lớn hơn mức này thì dashboard tự chuyển sang chế độ cuộn ảo
+LARGE_TABLE_ROWS = 2000
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except Exception:
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    return values
+
+def row_to_dict(row):
+    return {
+        'id': row.id,
+        'content': row.content,
+        'created_at': row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None
+    }
+
+def query_row_page(user_id, table_id, columns, sort=None, desc=False, q='', after=None, limit=ROW_PAGE_SIZE):
+    # Lọc + sắp xếp + cắt trang đều đẩy xuống database, không kéo cả bảng lên Python
+    col_names = [col.name for col in columns]
+    conditions, by_id = search_conditions(q)
+    if by_id:
+        # Đã có sẵn danh sách id từ FTS: viết điều kiện chủ sở hữu dạng biểu thức (cột + 0) để SQLite
+        # tra thẳng theo khóa chính thay vì quét cả index chủ sở hữu rồi dò từng id
+        query = DataRow.query.filter(DataRow.created_by + 0 == user_id, DataRow.table_id + 0 == table_id)
+    else:
+        query = DataRow.query.filter_by(created_by=user_id, table_id=table_id)
+    query = query.filter(*conditions)
+
+    # Mặc định sắp theo sort_key (có index), sort=id theo thứ tự nhập, hoặc theo 1 cột bất kỳ
+    if sort == 'id':
+        sort_expr = None
+    elif sort in col_names:
+        sort_expr = db.func.coalesce(db.func.lower(DataRow.content[sort].as_string()), '')
+    else:
+        sort_expr = DataRow.sort_key
+
+    cursor = decode_cursor(after)
+    if cursor:
+        last_val, last_id = cursor
+        if sort_expr is None:
+            query = query.filter(DataRow.id < last_id if desc else DataRow.id > last_id)
+        elif desc:
+            query = query.filter(db.or_(sort_expr < last_val, db.and_(sort_expr == last_val, DataRow.id < last_id)))
+        else:
+            query = query.filter(db.or_(sort_expr > last_val, db.and_(sort_expr == last_val, DataRow.id > last_id)))
+
+    if sort_expr is None:
+        query = query.order_by(DataRow.id.desc() if desc else DataRow.id)
+        page = query.limit(limit + 1).all()
+    else:
+        query = query.add_columns(sort_expr).order_by(sort_expr.desc() if desc else sort_expr,
+                                                       DataRow.id.desc() if desc else DataRow.id)
+        result = query.limit(limit + 1).all()
+        page = [r[0] for r in result]
+        sort_values = [r[1] for r in result]
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_cursor = None
+    if has_more and page:
+        last = page[-1]
+        next_cursor = encode_cursor([sort_values[len(page) - 1] if sort_expr is not None else None, last.id])
+    return page, next_cursor
+
+# --- ĐỒNG BỘ THAY ĐỔI (DELTA SYNC) ---
+# Mỗi lần ghi vào 1 bảng: bump_table_version() lấy số phiên bản mới, dòng thêm/sửa ghi số đó vào DataRow.version,
+# dòng xóa để lại dấu trong DeletedRow. Trang chính chỉ cần hỏi "có gì đổi từ phiên bản N" thay vì tải lại cả bảng.
+# Đổi cột (thêm/xóa/đổi tên/đổi thứ tự) thì ghi columns_version -> client tải lại trang.
+SYNC_MAX_ROWS = ROW_PAGE_MAX
+SYNC_KEEP_HOURS = float(os.environ.get('SYNC_KEEP_HOURS', 72))
+
+def bump_table_version(user_id, table_id, columns=False):
+    # UPDATE ... RETURNING giữ khóa dòng table_version tới lúc commit, nên 2 lần ghi cùng bảng
+    # commit đúng thứ tự số phiên bản -> client không bao giờ bỏ sót thay đổi
+    invalidate_file_cache(user_id, table_id)  # file xuất / backup tạo trước lần ghi này không dùng lại nữa
+    values = {'version': TableVersion.version + 1}
+    if columns:
+        values['columns_version'] = TableVersion.version + 1
+    version = db.session.execute(
+        db.update(TableVersion).where(TableVersion.user_id == user_id, TableVersion.table_id == table_id)
+        .values(**values).returning(TableVersion.version)
+    ).scalar()
+    if version is not None:
+        return version
+    try:
+        with db.session.begin_nested():
+            db.session.add(TableVersion(user_id=user_id, table_id=table_id, version=1, columns_version=1 if columns else 0))
+        return 1
+    except IntegrityError:
+        return bump_table_version(user_id, table_id, columns)  # request khác vừa tạo dòng phiên bản trước
+
+def record_deleted_rows(user_id, table_id, row_ids, version):
+    if not row_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(db.insert(DeletedRow), [
+        {'row_id': row_id, 'user_id': user_id, 'table_id': table_id, 'version': version, 'deleted_at': now}
+        for row_id in row_ids
+    ])
+    prune_deleted_rows()
+
+def prune_deleted_rows():
+    # Dấu xóa cũ hơn SYNC_KEEP_HOURS giờ thì dọn; client nào còn đứng ở phiên bản trước đó sẽ được bảo tải lại trang
+    cutoff = datetime.utcnow() - timedelta(hours=SYNC_KEEP_HOURS)
+    old = db.session.query(DeletedRow.user_id, DeletedRow.table_id, db.func.max(DeletedRow.version)) \
+        .filter(DeletedRow.deleted_at < cutoff).group_by(DeletedRow.user_id, DeletedRow.table_id).all()
+    if not old:
+        return
+    for user_id, table_id, version in old:
+        db.session.execute(db.update(TableVersion).where(
+            TableVersion.user_id == user_id, TableVersion.table_id == table_id, TableVersion.min_version < version
+        ).values(min_version=version))
+    db.session.execute(db.delete(DeletedRow).where(DeletedRow.deleted_at < cutoff))
+
+def get_table_version(user_id, table_id):
+    return db.session.get(TableVersion, (user_id, table_id))
+
+# --- ẢNH CHỤP BẢNG TRONG RAM (SNAPSHOT) ---
+# Trang chính, xuất Excel, backup, in phiếu đều cần "mọi dòng của user trong bảng, theo thứ tự hiển thị".
+# Giữ sẵn 1 ảnh chụp cho mỗi (user, bảng) kèm số phiên bản; mỗi lần đọc chỉ hỏi số phiên bản hiện tại (1 câu tra khóa chính):
+# - trùng phiên bản: dùng luôn
+# - dòng đổi: chỉ lấy các dòng có version mới hơn + dấu xóa (giống /api/rows/<id>/changes) rồi vá vào ảnh cũ
+# - cột đổi / dấu xóa đã dọn / đổi quá nhiều dòng: chụp lại từ đầu
+# Mỗi process có bộ riêng, nhưng luôn so phiên bản trong database nên không trả dữ liệu cũ.
+# Chỉ thấy được thay đổi đi qua bump_table_version(); sửa tay trong database thì chậm nhất SNAPSHOT_MAX_AGE giây sau mới thấy.
+SNAPSHOT_MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', 600))
+SNAPSHOT_MAX_ROWS = int(os.environ.get('SNAPSHOT_MAX_ROWS', 50000))
+SNAPSHOT_TABLE_MAX_ROWS = int(os.environ.get('SNAPSHOT_TABLE_MAX_ROWS', 20000))
+SNAPSHOT_PATCH_MAX = SYNC_MAX_ROWS
+table_snapshots = SnapshotCache(SNAPSHOT_MAX_ROWS)
+
+def snapshot_query(user_id, table_id):
+    return db.session.query(DataRow.id, DataRow.created_at, DataRow.content, DataRow.sort_key) \
+        .filter_by(created_by=user_id, table_id=table_id)
+
+def snapshot_row(row):
+    return SnapshotRow(row.id, row.created_at, row.content, row.sort_key or '')
+
+def get_table_snapshot(user_id, table_id, columns=None):
+    # Ảnh chụp đúng phiên bản hiện tại, hoặc None nếu tắt (SNAPSHOT_MAX_ROWS=0) / bảng lớn hơn SNAPSHOT_TABLE_MAX_ROWS
+    if SNAPSHOT_MAX_ROWS <= 0:
+        return None
+    tv = get_table_version(user_id, table_id)
+    version = tv.version if tv else 0
+    col_names = [col.name for col in (columns if columns is not None else get_columns(user_id, table_id))]
+    key = (user_id, table_id)
+    snapshot = table_snapshots.get(key)
+
+    if snapshot is not None and snapshot.col_names == col_names and snapshot.age() < SNAPSHOT_MAX_AGE:
+        if snapshot.version == version:
+            table_snapshots.count('hits')
+            return snapshot if snapshot.rows is not None else None
+        if snapshot.rows is not None and tv and tv.columns_version <= snapshot.version < version \
+                and tv.min_version <= snapshot.version:
+            changed = snapshot_query(user_id, table_id).filter(DataRow.version > snapshot.version) \
+                .limit(SNAPSHOT_PATCH_MAX + 1).all()
+            if len(changed) <= SNAPSHOT_PATCH_MAX:
+                deleted = db.session.query(DeletedRow.row_id).filter(
+                    DeletedRow.user_id == user_id, DeletedRow.table_id == table_id, DeletedRow.version > snapshot.version)
+                snapshot = snapshot.apply_changes(version, [snapshot_row(r) for r in changed], [r for (r,) in deleted])
+                table_snapshots.put(key, snapshot)
+                table_snapshots.count('patches')
+                return snapshot
+        if snapshot.rows is None:
+            # Lần trước đã quá lớn: đếm trước (dùng index) cho khỏi kéo cả bảng lên rồi lại bỏ
+            if snapshot_query(user_id, table_id).count() > SNAPSHOT_TABLE_MAX_ROWS:
+                table_snapshots.put(key, TableSnapshot(version, col_names, None))
+                return None
+
+    rows = snapshot_query(user_id, table_id).order_by(DataRow.sort_key, DataRow.id) \
+        .limit(SNAPSHOT_TABLE_MAX_ROWS + 1).all()
+    too_big = len(rows) > SNAPSHOT_TABLE_MAX_ROWS
+    snapshot = TableSnapshot(version, col_names, None if too_big else [snapshot_row(r) for r in rows])
+    table_snapshots.put(key, snapshot)
+    table_snapshots.count('rebuilds')
+    return None if too_big else snapshot
+
+def invalidate_snapshots(user_id=None, table_id=None):
+    # Bảng / user bị xóa hẳn (TableVersion mất theo, số phiên bản đếm lại từ đầu) -> bỏ ảnh cũ trong process này
+    table_snapshots.invalidate(lambda key: (user_id is None or key[0] == user_id) and (table_id is None or key[1] == table_id))
+
+# --- THỐNG KÊ CỘT SỐ ---
+# Cột như "Nhiệt lò nung", "Cơ tính" lưu số dạng chữ trong content. Rút cả bảng ra mảng NumPy 1 lượt (từ ảnh chụp nếu có),
+# giữ theo (user, bảng, phiên bản): bảng chưa đổi thì các lần thống kê sau chỉ tính trên mảng sẵn có.
+STATS_CACHE_SIZE = int(os.environ.get('STATS_CACHE_SIZE', 32))
+STATS_BINS_MAX = 100
+VN_UTC_OFFSET_HOURS = 7
+table_arrays_cache = TTLCache(maxsize=STATS_CACHE_SIZE, ttl=SNAPSHOT_MAX_AGE)
+
+def get_table_arrays(user_id, table_id, columns=None):
+    columns = columns if columns is not None else get_columns(user_id, table_id)
+    col_names = [col.name for col in columns]
+    snapshot = get_table_snapshot(user_id, table_id, columns)
+    if snapshot is not None:
+        version, rows = snapshot.version, snapshot.rows
+    else:
+        # Bảng quá lớn để chụp: đọc thẳng từng lô (bản rút ra vẫn được giữ theo phiên bản)
+        tv = get_table_version(user_id, table_id)
+        version = tv.version if tv else 0
+        rows = snapshot_query(user_id, table_id).yield_per(BACKUP_BATCH_SIZE)
+    key = ('arrays', user_id, table_id, version, tuple(col_names))
+    return table_arrays_cache.get(key, lambda: extract_arrays(rows, col_names))
+
+def parse_day(text, field):
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{field} phải có dạng YYYY-MM-DD!')
+
+def report_daily_outputs(user_id, table_id, column, start, end):
+    # Tổng cột sản lượng theo từng ngày (giờ VN) để điền báo cáo ca; None nếu bảng / cột không dùng được
+    table = get_table(table_id)
+    if table is None or not column:
+        return None
+    arrays = get_table_arrays(user_id, table.id)
+    if column not in arrays.numeric:
+        return None
+    return daily_sums(arrays, column, start, end, VN_UTC_OFFSET_HOURS)
+
+# --- TÌM KIẾM PHÍA SERVER ---
+# Mỗi dòng có search_text (giá trị các cột, đã bỏ dấu + chữ thường) được ghi cùng lúc với dòng.
+# Postgres: index GIN trigram trên search_text -> LIKE '%từ%' dùng index.
+# SQLite: bảng FTS5 (tokenizer trigram) đồng bộ bằng trigger, tự cập nhật khi thêm/sửa/xóa dòng.
+# Không có 2 thứ trên thì vẫn tìm được bằng LIKE (quét theo index chủ sở hữu + bảng).
+search_backend = 'like'
+data_row_fts = db.table('data_row_fts', db.column('rowid'), db.column('search_text'))
+
+SEARCH_ID_LIMIT = 5000
+
+def search_conditions(q):
+    # Trả về (điều kiện lọc, có phải lọc theo danh sách id lấy từ FTS không)
+    terms = search_terms(q)
+    conditions = []
+    by_id = False
+    fts_terms = [term for term in terms if search_backend == 'fts5' and len(term) >= 3]
+    if fts_terms:
+        # Trigram cần từ >= 3 ký tự; mỗi cụm trong ngoặc kép = tìm đúng chuỗi con, các cụm phải có đủ.
+        # Ít dòng khớp: lấy id từ FTS rồi tra thẳng theo khóa chính. Khớp quá nhiều (> SEARCH_ID_LIMIT):
+        # dòng khớp dày đặc nên quét theo thứ tự sắp xếp + LIKE sẽ đủ 1 trang rất sớm, nhanh hơn.
+        phrase = ' '.join('"' + term.replace('"', '""') + '"' for term in fts_terms)
+        ids = db.session.execute(
+            db.select(data_row_fts.c.rowid).where(data_row_fts.c.search_text.op('MATCH')(phrase)).limit(SEARCH_ID_LIMIT + 1)
+        ).scalars().all()
+        if len(ids) <= SEARCH_ID_LIMIT:
+            conditions.append(DataRow.id.in_(ids))
+            terms = [term for term in terms if term not in fts_terms]
+            by_id = True
+    conditions.extend(DataRow.search_text.contains(term, autoescape=True) for term in terms)
+    return conditions, by_id
+
+def setup_search_index():
+    global search_backend
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        try:
+            with engine.begin() as conn:
+                conn.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(db.text("CREATE INDEX IF NOT EXISTS ix_data_row_search_trgm ON data_row USING gin (search_text gin_trgm_ops)"))
+            search_backend = 'trigram'
+        except Exception as e:
+            print(f"Không tạo được index trigram (tìm kiếm sẽ chậm hơn): {e}")
+        return
+
+    if engine.dialect.name == 'sqlite':
+        try:
+            with engine.begin() as conn:
+                has_trigger = conn.execute(db.text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'data_row_fts_ai'")).first()
+                if not has_trigger:
+                    conn.execute(db.text(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS data_row_fts USING fts5("
+                        "search_text, content='data_row', content_rowid='id', tokenize='trigram')"))
+                    conn.execute(db.text(
+                        "CREATE TRIGGER data_row_fts_ai AFTER INSERT ON data_row BEGIN "
+                        "INSERT INTO data_row_fts(rowid, search_text) VALUES (new.id, new.search_text); END"))
+                    conn.execute(db.text(
+                        "CREATE TRIGGER data_row_fts_ad AFTER DELETE ON data_row BEGIN "
+                        "INSERT INTO data_row_fts(data_row_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); END"))
+                    conn.execute(db.text(
+                        "CREATE TRIGGER data_row_fts_au AFTER UPDATE OF search_text ON data_row BEGIN "
+                        "INSERT INTO data_row_fts(data_row_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+                        "INSERT INTO data_row_fts(rowid, search_text) VALUES (new.id, new.search_text); END"))
+                    # Bảng FTS mới (hoặc trigger bị mất sau khi drop data_row) -> dựng lại từ dữ liệu hiện có
+                    conn.execute(db.text("INSERT INTO data_row_fts(data_row_fts) VALUES ('rebuild')"))
+                    print("Đã tạo bảng tìm kiếm data_row_fts")
+            search_backend = 'fts5'
+        except Exception as e:
+            print(f"SQLite không hỗ trợ FTS5 trigram (tìm kiếm sẽ chậm hơn): {e}")
+
+def detect_search_backend():
+    # Index tìm kiếm do setup_search_index tạo lúc nâng cấp; process khởi động trên database đã nâng cấp (bỏ qua upgrade_schema)
+    # vẫn phải biết có FTS5 / trigram để dùng, chỉ cần 1 câu tra catalog
+    global search_backend
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        sql, backend = "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_data_row_search_trgm'", 'trigram'
+    elif dialect == 'sqlite':
+        sql, backend = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'data_row_fts_ai'", 'fts5'
+    else:
+        return
+    try:
+        with db.engine.connect() as conn:
+            found = conn.execute(db.text(sql)).first() is not None
+    except Exception as e:
+        print(f"Không kiểm được index tìm kiếm (tìm bằng LIKE): {e}")
+        found = False
+    search_backend = backend if found else 'like'
+
+# Số dòng đọc mỗi lần khi xuất file
+EXPORT_BATCH_SIZE = 1000
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def iter_export_rows(user_id, table_id, col_names):
+    # Có ảnh chụp thì lấy từ RAM; bảng lớn thì chỉ lấy 3 cột cần thiết, đọc từng lô EXPORT_BATCH_SIZE dòng thay vì .all()
+    snapshot = get_table_snapshot(user_id, table_id)
+    if snapshot is not None:
+        rows = ((row.id, row.created_at, row.content) for row in snapshot.rows_by_id(reverse=True))
+    else:
+        rows = db.session.query(DataRow.id, DataRow.created_at, DataRow.content) \
+            .filter_by(created_by=user_id, table_id=table_id) \
+            .order_by(DataRow.id.desc()) \
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for row_id, created_at, content in rows:
+        vn_time = created_at + timedelta(hours=7) if created_at else datetime.now()
+        row_data = [row_id, vn_time.strftime('%d/%m/%Y %H:%M')]
+        for name in col_names:
+            cell_value = content.get(name, '')
+            if isinstance(cell_value, list):
+                cell_value = "\n".join(cell_value)
+            row_data.append(cell_value)
+        yield row_data
+
+# --- HÀNG ĐỢI VIỆC NẶNG (BACKGROUND JOB) ---
+# Xuất Excel, backup, báo cáo, in phiếu không chạy trong request nữa: request chỉ ghi 1 dòng Job
+# rồi trả mã job, thread pool của process làm phần nặng và ghi kết quả ra file trong JOB_DIR.
+# Job lưu trong database nên worker nào cũng xem được trạng thái / tải file (cùng 1 máy, chung ổ đĩa).
+# JOB_WORKERS=0: chạy luôn trong request như cũ (tiện debug).
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_DIR = os.environ.get('JOB_DIR') or os.path.join(app.instance_path, 'jobs')
+JOB_KEEP_HOURS = float(os.environ.get('JOB_KEEP_HOURS', 24))
+JOB_STALE_MINUTES = float(os.environ.get('JOB_STALE_MINUTES', 60))
+JOB_LABELS = {
+    'export_excel': 'Xuất Excel',
+    'backup_json': 'Sao lưu dữ liệu',
+    'generate_report': 'Báo cáo ca',
+    'print_row': 'In phiếu',
+    'print_rows': 'In nhiều phiếu',
+    'batch_report': 'Báo cáo nhiều ngày',
+    'purge_table': 'Xóa bảng',
+    'purge_user': 'Xóa tài khoản',
+}
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job') if JOB_WORKERS > 0 else None
+
+# --- CACHE FILE KẾT QUẢ TRÊN ĐĨA ---
+# Xuất Excel / backup / báo cáo ca: dữ liệu chưa đổi thì tải lại lấy luôn file lần trước (vài ms) thay vì tạo lại.
+# Khóa gồm phiên bản dữ liệu trong database (table_version) + danh sách cột + tham số, nên process nào cũng biết file còn đúng không;
+# ghi vào bảng (bump_table_version: save_row, delete_row, restore_json, sửa cột...) thì xóa luôn file của bảng đó cho nhẹ đĩa.
+# Mã băm của khóa làm ETag: trình duyệt gửi lại If-None-Match trùng thì trả 304, không gửi lại file.
+FILE_CACHE_MAX_MB = float(os.environ.get('FILE_CACHE_MAX_MB', 200))
+file_cache = FileCache(os.environ.get('FILE_CACHE_DIR') or os.path.join(JOB_DIR, 'cache'), int(FILE_CACHE_MAX_MB * 1024 * 1024))
+
+def cache_group(user_id, table_id=None):
+    return f'u{user_id}' if table_id is None else f'u{user_id}_t{table_id}'
+
+def invalidate_file_cache(user_id=None, table_id=None):
+    # Có cả 2: file xuất của bảng + file backup của user. Chỉ user: mọi file của user. Chỉ bảng: file xuất bảng đó của mọi user
+    if user_id is not None and table_id is not None:
+        groups = {cache_group(user_id), cache_group(user_id, table_id)}
+        file_cache.invalidate(lambda group: group in groups)
+    elif user_id is not None:
+        file_cache.invalidate(lambda group: group == cache_group(user_id) or group.startswith(cache_group(user_id) + '_'))
+    elif table_id is not None:
+        file_cache.invalidate(lambda group: group.endswith(f'_t{table_id}'))
+
+def database_id():
+    # Mã riêng của database (upgrade_schema tạo 1 lần): reset_db.py / đổi DATABASE_URL thì số phiên bản đếm lại từ đầu,
+    # có mã này trong khóa thì file cache của database cũ không bị nhận nhầm
+    def load():
+        info = db.session.get(SchemaInfo, 'database_id')
+        return info.value if info else ''
+    return metadata_cache.get('database_id', load)
+
+def table_data_version(user_id, table_id):
+    table_version = get_table_version(user_id, table_id)
+    return table_version.version if table_version else 0
+
+def export_cache_key(user_id, table_id):
+    cols = [col.name for col in get_columns(user_id, table_id)]
+    return cache_group(user_id, table_id), ('export_excel', user_id, table_id, table_data_version(user_id, table_id), cols)
+
+def backup_cache_key(user_id, params):
+    # Backup lấy mọi bảng: phiên bản của tất cả bảng lấy bằng 1 câu
+    versions = dict(db.session.query(TableVersion.table_id, TableVersion.version).filter_by(user_id=user_id).all())
+    tables = [(t.id, t.name, versions.get(t.id, 0), backup_columns(get_columns(user_id, t.id))) for t in get_all_tables()]
+    return cache_group(user_id), ('backup_json', user_id, params, tables)
+
+def report_cache_key(user_id, params):
+    # Báo cáo không đọc bảng (sản lượng từ dữ liệu đã điền sẵn vào params), chỉ phụ thuộc tham số + file mẫu
+    try:
+        template_mtime = os.path.getmtime(REPORT_TEMPLATE)
+    except OSError:
+        template_mtime = None
+    return f'{cache_group(user_id)}_report', ('generate_report', user_id, params, template_mtime)
+
+def not_modified(digest):
+    response = app.response_class(status=304)
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def send_result_file(path, filename, mimetype, as_attachment=True, digest=None):
+    # Có digest (file từ cache): kèm ETag + Last-Modified, trình duyệt hỏi lại bằng If-None-Match / If-Modified-Since thì trả 304
+    response = send_file(path, download_name=filename, as_attachment=as_attachment, mimetype=mimetype, etag=digest or True)
+    if digest:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def cached_job_response(kind, cache_key, params, filename, mimetype):
+    # Như enqueue_job + job_response, nhưng trúng cache thì trả luôn file cũ thay vì tạo job chạy lại
+    group, key = cache_key
+    digest = file_cache.digest([database_id(), key])
+    if request.if_none_match.contains_weak(digest):  # ETag bị đổi sang W/"..." khi response được nén
+        return not_modified(digest)  # cùng khóa = cùng nội dung, file cache có bị dọn cũng không sao
+    params = dict(params, cache={'group': group, 'digest': digest})
+    path = file_cache.get(group, digest)
+    metrics.inc('file_cache_requests_total', kind=kind, result='hit' if path else 'miss')
+    if path is None:
+        return job_response(enqueue_job(kind, current_user.id, params, filename, mimetype))
+    if wants_json():
+        return job_response(finished_job(kind, current_user.id, params, filename, mimetype, path))
+    return send_result_file(path, filename, mimetype, digest=digest)
+
+def finished_job(kind, user_id, params, filename, mimetype, cached_path):
+    # Job "đã xong" trỏ tới bản sao (hard link) của file cache, cho client chờ job kiểu fetch vẫn chạy như cũ
+    now = datetime.utcnow()
+    job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, params=params, filename=filename, mimetype=mimetype,
+              status='done', started_at=now, finished_at=now)
+    os.makedirs(JOB_DIR, exist_ok=True)
+    path = os.path.join(JOB_DIR, job.id)
+    try:
+        os.link(cached_path, path)
+    except OSError:
+        shutil.copyfile(cached_path, path)
+    job.result_path = path
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def job_write_excel(user_id, params, path):
+    col_names = [col.name for col in get_columns(user_id, params['table_id'])]
+    output = write_rows_to_excel(["ID", "Ngày tạo"] + col_names, iter_export_rows(user_id, params['table_id'], col_names))
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(output, f)
+
+def job_write_backup(user_id, params, path):
+    if params.get('format') == 'ndjson':
+        chunks = iter_backup_ndjson(user_id, params['username'])
+    else:
+        chunks = iter_backup_json(user_id, params['username'])
+    if params.get('gzip'):
+        chunks = gzip_chunks(chunks)
+    with open(path, 'wb') as f:
+        for chunk in buffer_chunks(chunks):
+            f.write(chunk)
+
+def job_write_report(user_id, params, path):
+    create_report = create_excel_report if params['action'] == 'excel' else create_pdf_report
+    file_stream, err = create_report(params['date'], params['supervisor'], params['output'], params['notes'])
+    if err:
+        raise RuntimeError(err)
+    with open(path, 'wb') as f:
+        f.write(file_stream.getvalue())
+
+def job_write_batch_report(user_id, params, path):
+    reports = params['reports']
+    started = time.perf_counter()
+    file_stream, err = create_batch_report(params['format'], reports, params['bundle'])
+    if err:
+        raise RuntimeError(err)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file_stream, f)
+    elapsed = time.perf_counter() - started
+    print(f"Báo cáo nhiều ngày: {len(reports)} báo cáo trong {elapsed:.2f}s ({len(reports) / max(elapsed, 1e-6):.1f} báo cáo/giây)")
+
+def job_write_ticket(user_id, params, path):
+    # Job cũ (trước khi có table_id trong params) hoặc bảng quá lớn thì đọc thẳng database
+    snapshot = get_table_snapshot(user_id, params['table_id']) if params.get('table_id') else None
+    if snapshot is not None:
+        row = snapshot.get(params['row_id'])
+        table_id = params['table_id']
+    else:
+        row = db.session.get(DataRow, params['row_id'])
+        if row is not None and row.created_by != user_id:
+            row = None
+        table_id = row.table_id if row is not None else None
+    if row is None:
+        raise RuntimeError("Dòng dữ liệu không còn nữa!")
+    columns = get_columns(user_id, table_id)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(render_template('print_ticket.html', row=row, columns=columns, today=params['today']))
+
+# --- XÓA BẢNG / USER Ở NỀN ---
+# Xóa 1 lần cả bảng lớn thì transaction giữ khóa trên data_row suốt lúc xóa, mọi người khác lưu không được.
+# Nên: bấm xóa chỉ ẩn bảng / user (deleted_at) rồi giao job xóa dần từng lô PURGE_BATCH_SIZE dòng,
+# mỗi lô 1 transaction ngắn, nghỉ PURGE_PAUSE_MS giữa các lô cho request khác chen vào. Admin xem tiến độ ở trang quản trị.
+# Job chết giữa chừng thì chạy lại an toàn (chỉ xóa phần còn lại).
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 2000))
+PURGE_PAUSE_MS = float(os.environ.get('PURGE_PAUSE_MS', 50))
+
+def deleted_name(name, row_id):
+    # Đổi tên bảng / user đã ẩn để tên cũ dùng lại được ngay (cột name / username là unique, tối đa 100 ký tự)
+    return f'{name[:80]}~xoa~{row_id}'
+
+def set_job_progress(done, total):
+    if g.get('job_id'):
+        db.session.execute(db.update(Job).where(Job.id == g.job_id).values(progress=done, progress_total=total))
+
+def purge_in_batches(model, *conditions, total=None):
+    done = 0
+    while True:
+        ids = [row_id for (row_id,) in db.session.query(model.id).filter(*conditions).order_by(model.id).limit(PURGE_BATCH_SIZE)]
+        if not ids:
+            return done
+        db.session.execute(db.delete(model).where(model.id.in_(ids)))
+        done += len(ids)
+        if total is not None:
+            set_job_progress(min(done, total), total)
+        db.session.commit()
+        if PURGE_PAUSE_MS > 0:
+            time.sleep(PURGE_PAUSE_MS / 1000)
+
+def count_rows(*conditions):
+    return db.session.query(db.func.count(DataRow.id)).filter(*conditions).scalar()
+
+def job_purge_table(user_id, params, path):
+    table_id = params['table_id']
+    total = count_rows(DataRow.table_id == table_id)
+    set_job_progress(0, total)
+    db.session.commit()
+    purge_in_batches(DataRow, DataRow.table_id == table_id, total=total)
+    purge_in_batches(DeletedRow, DeletedRow.table_id == table_id)
+    # Phần còn lại nhỏ, xóa 1 lần. Dòng lọt vào sau lô cuối (process khác chưa hết cache danh sách bảng) cũng xóa luôn ở đây
+    DataRow.query.filter_by(table_id=table_id).delete()
+    TableColumn.query.filter_by(table_id=table_id).delete()
+    TableVersion.query.filter_by(table_id=table_id).delete()
+    AppTable.query.filter_by(id=table_id).delete()
+    db.session.commit()
+    invalidate_columns(table_id=table_id)
+    invalidate_snapshots(table_id=table_id)
+    invalidate_file_cache(table_id=table_id)
+
+def job_purge_user(user_id, params, path):
+    target_id = params['target_user_id']
+    total = count_rows(DataRow.created_by == target_id)
+    set_job_progress(0, total)
+    db.session.commit()
+    purge_in_batches(DataRow, DataRow.created_by == target_id, total=total)
+    purge_in_batches(DeletedRow, DeletedRow.user_id == target_id)
+    for job in Job.query.filter_by(user_id=target_id).all():
+        remove_job_file(job.result_path)
+        db.session.delete(job)
+    DataRow.query.filter_by(created_by=target_id).delete()
+    TableColumn.query.filter_by(user_id=target_id).delete()
+    TableVersion.query.filter_by(user_id=target_id).delete()
+    User.query.filter_by(id=target_id).delete()
+    db.session.commit()
+    invalidate_user(target_id)
+    invalidate_columns(target_id)
+    invalidate_snapshots(target_id)
+    invalidate_file_cache(target_id)
+
+def start_purge(kind, item, params):
+    # Ẩn ngay (cùng transaction với lúc tạo job), xóa thật để job làm
+    name = item.name if isinstance(item, AppTable) else item.username
+    item.deleted_at = datetime.utcnow()
+    if isinstance(item, AppTable):
+        item.name = deleted_name(item.name, item.id)
+    else:
+        item.username = deleted_name(item.username, item.id)
+    return enqueue_job(kind, current_user.id, dict(params, name=name), name, None)
+
+def job_write_tickets(user_id, params, path):
+    # Nhiều phiếu -> 1 file PDF: cột lấy từ cache, mọi dòng lấy bằng 1 câu (theo thứ tự hiển thị)
+    columns = get_columns(user_id, params['table_id'])
+    rows = snapshot_query(user_id, params['table_id']).filter(DataRow.id.in_(params['row_ids'])) \
+        .order_by(DataRow.sort_key, DataRow.id).all()
+    if not rows:
+        raise RuntimeError("Các dòng cần in không còn nữa!")
+    chunks = [render_template('print_tickets_pdf.html', rows=rows[i:i + TICKET_PDF_CHUNK], columns=columns, today=params['today'],
+                              font_path=PDF_FONT_PATH)
+              for i in range(0, len(rows), TICKET_PDF_CHUNK)]
+    file_stream, err = create_tickets_pdf(chunks)
+    if err:
+        raise RuntimeError(err)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file_stream, f)
+    print(f"In {len(rows)} phiếu ({len(chunks)} lô)")
+
+PURGE_HANDLERS = {
+    'purge_table': job_purge_table,
+    'purge_user': job_purge_user,
+}
+
+JOB_HANDLERS = {
+    'export_excel': job_write_excel,
+    'backup_json': job_write_backup,
+    'generate_report': job_write_report,
+    'print_row': job_write_ticket,
+    'print_rows': job_write_tickets,
+    'batch_report': job_write_batch_report,
+    **PURGE_HANDLERS,
+}
+
+def enqueue_job(kind, user_id, params, filename, mimetype):
+    purge_old_jobs()
+    job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, params=params, filename=filename, mimetype=mimetype)
+    db.session.add(job)
+    db.session.commit()
+    submit_job(job.id)
+    if job_executor is None:
+        db.session.refresh(job)  # đã chạy xong ngay trong request, lấy lại trạng thái mới
+    return job
+
+def submit_job(job_id):
+    if job_executor is None:
+        run_job(job_id)
+    else:
+        job_executor.submit(run_job, job_id)
+
+def run_job(job_id):
+    # Job được chạy câu SQL lâu hơn request thường (DB_JOB_STATEMENT_TIMEOUT_MS)
+    token = statement_timeout_ms.set(DB_JOB_STATEMENT_TIMEOUT_MS)
+    try:
+        run_job_claimed(job_id)
+    finally:
+        statement_timeout_ms.reset(token)
+
+def run_job_claimed(job_id):
+    with app.app_context():
+        try:
+            # Giành job bằng 1 câu UPDATE có điều kiện: nhiều process cùng submit thì chỉ 1 process chạy
+            claimed = db.session.execute(
+                db.update(Job).where(Job.id == job_id, Job.status == 'queued')
+                .values(status='running', started_at=datetime.utcnow())
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                return
+            job = db.session.get(Job, job_id)
+            os.makedirs(JOB_DIR, exist_ok=True)
+            path = os.path.join(JOB_DIR, job_id)
+            kind = job.kind
+            started = time.perf_counter()
+            start_sql_tracking()
+            g.job_id = job_id
+            try:
+                JOB_HANDLERS[kind](job.user_id, job.params or {}, path)
+                job.status = 'done'
+                job.result_path = path if os.path.exists(path) else None  # job xóa dữ liệu không có file
+                cache = (job.params or {}).get('cache')
+                if cache and job.result_path:
+                    file_cache.put(cache['group'], cache['digest'], path)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Lỗi job {job_id}: {e}")
+                remove_job_file(path)
+                job = db.session.get(Job, job_id)
+                job.status = 'error'
+                job.error = str(e)
+            metrics.observe('job_duration_seconds', time.perf_counter() - started, kind=kind, status=job.status)
+            record_sql_usage(f'job:{kind}', check_repeats=kind not in PURGE_HANDLERS)  # xóa theo lô cố ý lặp 1 câu
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Lỗi hàng đợi job {job_id}: {e}")
+
+def remove_job_file(path):
+    try:
+        os.remove(path)
+    except (OSError, TypeError):
+        pass
+
+def purge_old_jobs():
+    # Xóa job (và file kết quả) cũ hơn JOB_KEEP_HOURS giờ
+    cutoff = datetime.utcnow() - timedelta(hours=JOB_KEEP_HOURS)
+    old = db.session.query(Job.id, Job.result_path) \
+        .filter(Job.status.in_(('done', 'error')), Job.created_at < cutoff).all()
+    if not old:
+        return
+    for _, path in old:
+        remove_job_file(path)
+    db.session.execute(db.delete(Job).where(Job.id.in_([job_id for job_id, _ in old])))
+    db.session.commit()
+
+def resume_jobs():
+    # Lúc khởi động: job "running" quá lâu (process cũ chết giữa chừng) cho chạy lại, job còn chờ thì nhận làm tiếp
+    stale = datetime.utcnow() - timedelta(minutes=JOB_STALE_MINUTES)
+    db.session.execute(
+        db.update(Job).where(Job.status == 'running', Job.started_at < stale).values(status='queued')
+    )
+    db.session.commit()
+    for (job_id,) in db.session.query(Job.id).filter_by(status='queued').order_by(Job.created_at).all():
+        submit_job(job_id)
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'label': JOB_LABELS.get(job.kind, job.kind),
+        'state': job.status,
+        'filename': job.filename,
+        'error': job.error,
+        'progress': job.progress,
+        'progress_total': job.progress_total,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+        'status_url': url_for('api_job', job_id=job.id),
+        'download_url': url_for('download_job', job_id=job.id) if job.status == 'done' and job.result_path else None
+    }
+
+def wants_json():
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def job_response(job):
+    # Gọi bằng fetch (Accept: application/json) thì trả JSON; trình duyệt thì sang trang chờ
+    if wants_json():
+        return jsonify({'status': 'success', 'job': job_to_dict(job)}), 202
+    return redirect(url_for('job_page', job_id=job.id))
+
+def get_user_job_or_404(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    # Job xóa bảng / user: admin nào cũng xem được tiến độ
+    if job.user_id != current_user.id and not (job.kind in PURGE_HANDLERS and current_user.role == 'admin'):
+        abort(404)
+    return job
+
+# --- SAO LƯU DẠNG STREAM ---
+# Đọc từng lô, viết ra từng mảnh: RAM không phụ thuộc số dòng
+BACKUP_BATCH_SIZE = 1000
+BACKUP_CHUNK_BYTES = 64 * 1024
+
+def iter_backup_tables(user_id):
+    # Trả về (bảng, danh sách cột, iterator các dòng) cho những bảng user có cột hoặc có dữ liệu
+    for table in get_all_tables():
+        cols = get_columns(user_id, table.id)
+        snapshot = get_table_snapshot(user_id, table.id, cols)
+        if snapshot is not None:
+            rows = iter([(row.content, row.created_at) for row in snapshot.rows_by_id()])
+        else:
+            rows = iter(db.session.query(DataRow.content, DataRow.created_at)
+                        .filter_by(created_by=user_id, table_id=table.id)
+                        .order_by(DataRow.id)
+                        .execution_options(yield_per=BACKUP_BATCH_SIZE))
+        first = next(rows, None)
+        if not cols and first is None:
+            continue
+        yield table, cols, (first, rows)
+
+def iter_table_rows(first, rows):
+    if first is None:
+        return
+    yield first
+    yield from rows
+
+def backup_row_dict(content, created_at):
+    return {
+        "content": content,
+        "created_at": created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else None
+    }
+
+def backup_columns(cols):
+    return [{"name": c.name, "order": c.order_index, "width": c.width} for c in cols]
+
+def iter_backup_json(user_id, username):
+    # Cùng cấu trúc với bản backup cũ (restore_json đọc được như trước)
+    header = {
+        "version": "2.0",
+        "timestamp": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        "user": username,
+    }
+    yield json.dumps(header, ensure_ascii=False)[:-1] + ',\n"tables": ['
+    for t_idx, (table, cols, (first, rows)) in enumerate(iter_backup_tables(user_id)):
+        yield (',' if t_idx else '') + '\n{"name": ' + json.dumps(table.name, ensure_ascii=False)
+        yield ', "columns": ' + json.dumps(backup_columns(cols), ensure_ascii=False) + ', "rows": ['
+        for r_idx, (content, created_at) in enumerate(iter_table_rows(first, rows)):
+            yield (',\n' if r_idx else '\n') + json.dumps(backup_row_dict(content, created_at), ensure_ascii=False)
+        yield '\n]}'
+    yield '\n]}\n'
+
+def iter_backup_ndjson(user_id, username):
+    yield json.dumps({
+        "type": "backup",
+        "version": "2.0",
+        "timestamp": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        "user": username
+    }, ensure_ascii=False) + '\n'
+    for table, cols, (first, rows) in iter_backup_tables(user_id):
+        yield json.dumps({"type": "table", "name": table.name, "columns": backup_columns(cols)}, ensure_ascii=False) + '\n'
+        for content, created_at in iter_table_rows(first, rows):
+            record = {"type": "row", "table": table.name}
+            record.update(backup_row_dict(content, created_at))
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+
+def buffer_chunks(chunks, size=BACKUP_CHUNK_BYTES):
+    # Gom các mảnh nhỏ thành khối ~64KB trước khi gửi, tránh ghi socket lắt nhắt
+    buf = []
+    buf_len = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        buf.append(chunk)
+        buf_len += len(chunk)
+        if buf_len >= size:
+            yield b''.join(buf)
+            buf = []
+            buf_len = 0
+    if buf:
+        yield b''.join(buf)
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in buffer_chunks(chunks):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# --- KHÔI PHỤC DẠNG STREAM ---
+RESTORE_BATCH_SIZE = 1000
+
+def iter_backup_records(file):
+    # Đọc file backup (JSON hoặc NDJSON, có/không nén gzip) thành chuỗi bản ghi:
+    # ('table', tên bảng, danh sách cột) rồi ('row', tên bảng, dòng) - không nạp cả file vào RAM
+    stream = file.stream
+    magic = stream.read(2)
+    stream.seek(0)
+    if magic == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+
+    name = (file.filename or '').lower()
+    if name.endswith('.ndjson') or name.endswith('.ndjson.gz'):
+        return iter_ndjson_records(stream)
+    return iter_json_records(stream)
+
+def iter_ndjson_records(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if record.get('type') == 'table':
+            yield 'table', record['name'], record.get('columns', [])
+        elif record.get('type') == 'row':
+            yield 'row', record['table'], record
+
+def iter_json_records(stream):
+    table_name = None
+    builder = None
+    builder_prefix = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == builder_prefix and event in ('end_map', 'end_array'):
+                yield ('table' if prefix == 'tables.item.columns' else 'row'), table_name, builder.value
+                builder = None
+            continue
+
+        if prefix == 'tables.item.name' and event == 'string':
+            table_name = value
+        elif (prefix == 'tables.item.columns' and event == 'start_array') or \
+             (prefix == 'tables.item.rows.item' and event == 'start_map'):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            builder_prefix = prefix
+
+def insert_new_rows(user_id, table_id, pending):
+    # Thêm 1 lô dòng bằng 1 câu INSERT nhiều giá trị, bỏ những dòng đã có trong bảng. Trả về số dòng thêm được.
+    hashes = [v['content_hash'] for v in pending]
+    # Tra trùng theo index (created_by, table_id, content_hash) thay vì so từng dòng
+    in_db = {h for (h,) in db.session.query(DataRow.content_hash).filter(
+        DataRow.created_by == user_id, DataRow.table_id == table_id, DataRow.content_hash.in_(hashes))}
+    values = [v for v in pending if v['content_hash'] not in in_db]
+    if values:
+        db.session.execute(db.insert(DataRow), values)
+    return len(values)
+
+def restore_backup(records, user_id):
+    system_tables = {t.name: t.id for t in get_all_tables()}
+    added_count = 0
+    skipped_count = 0
+    prepared = {}
+    pending = []
+    current = {}
+
+    def prepare_table(table_id, columns_data):
+        # Khóa phiên bản bảng trước rồi mới đọc cột (xem get_columns_for_write). columns=True luôn: chưa biết có thêm cột hay không
+        version = bump_table_version(user_id, table_id, columns=True)
+        existing = {c.name for c in get_columns_for_write(user_id, table_id)}
+        for col_data in columns_data:
+            if col_data['name'] not in existing:
+                db.session.add(TableColumn(
+                    name=col_data['name'], 
+                    order_index=col_data['order'], 
+                    width=col_data.get('width', '150px'),
+                    user_id=user_id, 
+                    table_id=table_id
+                ))
+                existing.add(col_data['name'])
+        db.session.flush()
+        fill_content_hashes(user_id, table_id)
+        return {'table_id': table_id, 'col_names': get_col_names(user_id, table_id), 'seen': set(), 'version': version}
+
+    def flush_pending():
+        nonlocal added_count, skipped_count
+        if not pending:
+            return
+        added = insert_new_rows(user_id, current['table_id'], pending)
+        added_count += added
+        skipped_count += len(pending) - added
+        pending.clear()
+
+    for kind, table_name, data in records:
+        table_id = system_tables.get(table_name)
+        if not table_id:
+            continue
+
+        if current.get('table_id') != table_id:
+            flush_pending()
+            if table_id not in prepared:
+                prepared[table_id] = prepare_table(table_id, data if kind == 'table' else [])
+            current = prepared[table_id]
+        if kind == 'table':
+            continue
+
+        content = data['content']
+        row_keys = build_row_keys(content, current['col_names'])
+        c_hash = row_keys['content_hash']
+        if c_hash in current['seen']:
+            skipped_count += 1
+            continue
+        current['seen'].add(c_hash)
+
+        c_at = datetime.utcnow()
+        if data.get('created_at'):
+            try: c_at = datetime.strptime(data['created_at'], '%Y-%m-%d %H:%M:%S')
+            except: pass
+
+        pending.append({
+            'content': content,
+            'created_by': user_id,
+            'table_id': table_id,
+            'created_at': c_at,
+            'version': current['version'],
+            **row_keys
+        })
+        if len(pending) >= RESTORE_BATCH_SIZE:
+            flush_pending()
+
+    flush_pending()
+    return added_count, skipped_count
+
+# --- NHẬP DỮ LIỆU TỪ EXCEL / CSV ---
+IMPORT_BATCH_SIZE = 1000
+IMPORT_REJECT_SHOW = 50
+
+def import_table_rows(rows, user_id, table_id):
+    # Nhập các dòng của 1 file Excel/CSV vào bảng: ghép tiêu đề với tên cột, mỗi IMPORT_BATCH_SIZE dòng 1 câu INSERT.
+    # Dòng hỏng bị bỏ qua (ghi lại số dòng + lý do) chứ không hủy cả file; dòng trùng dữ liệu đã có cũng bỏ qua như khôi phục.
+    started = time.perf_counter()
+    version = bump_table_version(user_id, table_id)  # lỗi thì nơi gọi rollback, số phiên bản không bị tăng
+    col_names = get_col_names(user_id, table_id)
+    rows = iter(rows)
+    header = find_header_row(rows, col_names)
+    if header is None:
+        raise ValueError('Không thấy dòng tiêu đề nào khớp tên cột của bảng (' + ', '.join(col_names) + ')')
+    header_line, mapping, created_idx, unknown, width = header
+    fill_content_hashes(user_id, table_id)
+
+    result = {
+        'header_line': header_line,
+        'columns': list(mapping.values()),
+        'unknown_headers': unknown,
+        'added': 0,
+        'duplicates': 0,
+        'rejected': 0,
+        'errors': []
+    }
+    seen = set()
+    pending = []
+
+    def flush_pending():
+        if not pending:
+            return
+        added = insert_new_rows(user_id, table_id, pending)
+        result['added'] += added
+        result['duplicates'] += len(pending) - added
+        pending.clear()
+
+    for line_no, values in rows:
+        try:
+            parsed = parse_import_row(values, mapping, created_idx, width)
+        except ValueError as e:
+            result['rejected'] += 1
+            if len(result['errors']) < IMPORT_REJECT_SHOW:
+                result['errors'].append({'line': line_no, 'reason': str(e)})
+            continue
+        if parsed is None:
+            continue
+
+        content, created_at = parsed
+        # Cột giờ cập nhật / ngày tạo: file có thì giữ giờ cũ, để trống thì bơm giờ nhập như save_row
+        row_data = stamp_time_columns({name: content.get(name, '') for name in col_names}, only_empty=True)
+        row_keys = build_row_keys(row_data, col_names)
+        if row_keys['content_hash'] in seen:
+            result['duplicates'] += 1
+            continue
+        seen.add(row_keys['content_hash'])
+
+        pending.append({
+            'content': row_data,
+            'created_by': user_id,
+            'table_id': table_id,
+            'created_at': created_at - timedelta(hours=7) if created_at else datetime.utcnow(),
+            'version': version,
+            **row_keys
+        })
+        if len(pending) >= IMPORT_BATCH_SIZE:
+            flush_pending()
+
+    flush_pending()
+    elapsed = time.perf_counter() - started
+    total = result['added'] + result['duplicates'] + result['rejected']
+    result['seconds'] = round(elapsed, 3)
+    result['rows_per_sec'] = round(total / max(elapsed, 1e-6), 1)
+    return result
+
 # --- ROUTES CHÍNH ---
 
 @app.route('/')
 @app.route('/table/<int:table_id>')
 @login_required
 def index(table_id=None):
-    all_tables = AppTable.query.order_by(AppTable.id).all()
+    all_tables = get_all_tables()
     
     if not all_tables:
         default_table = AppTable(name="DATA XƯỞNG THÉP")
         db.session.add(default_table)
         db.session.commit()
+        invalidate_tables()
         return redirect(url_for('index'))
 
     current_table = None
     if table_id:
-        current_table = AppTable.query.get(table_id)
+        current_table = get_table(table_id)
     if not current_table:
         current_table = all_tables[0]
         return redirect(url_for('index', table_id=current_table.id))
 
-    columns = TableColumn.query.filter_by(user_id=current_user.id, table_id=current_table.id).order_by(TableColumn.order_index).all()
+    columns = get_columns(current_user.id, current_table.id)
     
     if not columns:
-        defaults = ["Sản phẩm", "Mác thép", "Bộ gap", "Nhiệt lò nung", "Cơ tính"]
-        for idx, name in enumerate(defaults):
-            db.session.add(TableColumn(name=name, order_index=idx, user_id=current_user.id, table_id=current_table.id))
+        # Khóa phiên bản trước rồi xem lại trong database (xem get_columns_for_write): 2 tab mở cùng lúc không thêm cột mặc định 2 lần
+        bump_table_version(current_user.id, current_table.id, columns=True)
+        if not get_columns_for_write(current_user.id, current_table.id):
+            defaults = ["Sản phẩm", "Mác thép", "Bộ gap", "Nhiệt lò nung", "Cơ tính"]
+            for idx, name in enumerate(defaults):
+                db.session.add(TableColumn(name=name, order_index=idx, user_id=current_user.id, table_id=current_table.id))
         db.session.commit()
+        invalidate_columns(current_user.id, current_table.id)
         return redirect(url_for('index', table_id=current_table.id))
 
-    rows = DataRow.query.filter_by(created_by=current_user.id, table_id=current_table.id).all()
-
-    if columns and rows:
-        col_names = [col.name for col in columns]
-        
-        def sort_key(row):
-            sort_values = []
-            for name in col_names:
-                val = row.content.get(name, '')
-                if isinstance(val, list):
-                    val = " ".join(val)
-                sort_values.append(str(val).lower().strip())
-            return tuple(sort_values)
+    # Cách hiển thị: all = cả bảng, paged = từng trang + nút "Tải thêm",
+    # virtual = cuộn ảo (JS giữ dữ liệu, chỉ vẽ những dòng đang nhìn thấy, cuộn tới đâu tải tới đó)
+    # Ảnh chụp có sẵn số phiên bản đọc TRƯỚC các dòng; bảng quá lớn (None) thì đọc database như cũ
+    snapshot = get_table_snapshot(current_user.id, current_table.id, columns)
+    view = request.args.get('view')
+    if view not in ('all', 'paged', 'virtual'):
+        if request.args.get('paged') is not None:  # link cũ ?paged=0 / ?paged=1
+            view = 'paged' if request.args.get('paged') == '1' else 'all'
+        else:
+            if snapshot is not None:
+                row_count = snapshot.size
+            else:
+                row_count = DataRow.query.filter_by(created_by=current_user.id, table_id=current_table.id).count()
+            view = 'virtual' if row_count > LARGE_TABLE_ROWS else 'all'
+    paged = view != 'all'
 
-        rows.sort(key=sort_key)
+    # Đọc số phiên bản TRƯỚC khi đọc dòng: có ai ghi xen giữa thì lần đồng bộ đầu tiên sẽ lấy lại
+    if snapshot is not None:
+        table_version = snapshot.version
+    else:
+        tv = get_table_version(current_user.id, current_table.id)
+        table_version = tv.version if tv else 0
+    next_cursor = None
+    first_page = []
+    if paged:
+        limit = VIRTUAL_PAGE_SIZE if view == 'virtual' else ROW_PAGE_SIZE
+        if snapshot is not None:
+            rows, has_more = snapshot.page(limit=limit)
+            next_cursor = encode_cursor([rows[-1].sort_key, rows[-1].id]) if has_more else None
+        else:
+            rows, next_cursor = query_row_page(current_user.id, current_table.id, columns, limit=limit)
+        if view == 'virtual':
+            # Không vẽ dòng nào bằng Jinja, không nhúng data_map: trang đầu gửi dạng list cho JS tự vẽ
+            first_page = [row_to_dict(row) for row in rows]
+            rows = []
+    elif snapshot is not None:
+        rows = snapshot.rows
+    else:
+        rows = DataRow.query.filter_by(created_by=current_user.id, table_id=current_table.id).order_by(DataRow.sort_key, DataRow.id).all()
 
     data_map = {row.id: row.content for row in rows}
 
     all_users = []
+    purges = []
     if current_user.role == 'admin':
-        all_users = User.query.order_by(User.role, User.id).all()
+        all_users = User.query.filter(User.deleted_at.is_(None)).order_by(User.role, User.id).all()
+        purges = [job_to_dict(job) for job in Job.query.filter(Job.kind.in_(PURGE_HANDLERS), Job.status != 'done')
+                  .order_by(Job.created_at.desc()).limit(20).all()]
 
     return render_template('dashboard.html', 
                            columns=columns, 
                            rows=rows, 
                            data_map=data_map, 
                            all_users=all_users,
+                           purges=purges,
                            all_tables=all_tables,
-                           current_table=current_table)
+                           current_table=current_table,
+                           paged=paged,
+                           view=view,
+                           first_page=first_page,
+                           virtual_page_size=VIRTUAL_PAGE_SIZE,
+                           next_cursor=next_cursor,
+                           table_version=table_version)
+
+@app.route('/api/rows/<int:table_id>')
+@login_required
+def api_rows(table_id):
+    table = get_table_or_404(table_id)
+    columns = get_columns(current_user.id, table.id)
 
-@app.route('/export_excel/<int:table_id>')
+    try:
+        limit = int(request.args.get('limit', ROW_PAGE_SIZE))
+    except ValueError:
+        limit = ROW_PAGE_SIZE
+    limit = max(1, min(limit, ROW_PAGE_MAX))
+
+    sort = request.args.get('sort')
+    desc = request.args.get('desc') == '1'
+    q = request.args.get('q', '')
+    snapshot = None
+    if not sort and not desc and not search_terms(q):
+        # Thứ tự mặc định, không lọc: cắt trang thẳng từ ảnh chụp
+        snapshot = get_table_snapshot(current_user.id, table.id, columns)
+    after = decode_cursor(request.args.get('after'))
+    if after and not (isinstance(after[0], str) and isinstance(after[1], int)):
+        snapshot = None  # con trỏ của kiểu sắp xếp khác: để database xử lý
+    if snapshot is not None:
+        rows, has_more = snapshot.page(after=after, limit=limit)
+        next_cursor = encode_cursor([rows[-1].sort_key, rows[-1].id]) if has_more and rows else None
+    else:
+        rows, next_cursor = query_row_page(
+            current_user.id, table.id, columns, sort=sort, desc=desc, q=q,
+            after=request.args.get('after'), limit=limit
+        )
+    return jsonify({
+        'status': 'success',
+        'rows': [row_to_dict(r) for r in rows],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+@app.route('/api/search/<int:table_id>')
 @login_required
-def export_excel(table_id):
-    table = AppTable.query.get_or_404(table_id)
-    columns = TableColumn.query.filter_by(user_id=current_user.id, table_id=table.id).order_by(TableColumn.order_index).all()
-    rows = DataRow.query.filter_by(created_by=current_user.id, table_id=table.id).order_by(DataRow.id.desc()).all()
+def api_search(table_id):
+    # Giống /api/rows?q=... nhưng bắt buộc có từ khóa, trả thêm thời gian tra cứu
+    table = get_table_or_404(table_id)
+    columns = get_columns(current_user.id, table.id)
+    q = request.args.get('q', '')
+    if not search_terms(q):
+        return jsonify({'status': 'error', 'message': 'Nhập từ khóa cần tìm!'})
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Du Lieu"
-    
-    headers = ["ID", "Ngày tạo"] + [col.name for col in columns]
-    ws.append(headers)
-
-    for row in rows:
-        vn_time = row.created_at + timedelta(hours=7) if row.created_at else datetime.now()
-        row_data = [row.id, vn_time.strftime('%d/%m/%Y %H:%M')]
-        for col in columns:
-            cell_value = row.content.get(col.name, '')
-            if isinstance(cell_value, list):
-                cell_value = "\n".join(cell_value)
-            row_data.append(cell_value)
-        ws.append(row_data)
+    try:
+        limit = int(request.args.get('limit', ROW_PAGE_SIZE))
+    except ValueError:
+        limit = ROW_PAGE_SIZE
+    limit = max(1, min(limit, ROW_PAGE_MAX))
+
+    started = time.perf_counter()
+    rows, next_cursor = query_row_page(current_user.id, table.id, columns, q=q, after=request.args.get('after'), limit=limit)
+    return jsonify({
+        'status': 'success',
+        'rows': [row_to_dict(r) for r in rows],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+        'backend': search_backend,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+
+@app.route('/api/rows/<int:table_id>/changes')
+@login_required
+def api_row_changes(table_id):
+    # ?since=N: các dòng thêm/sửa và id dòng bị xóa sau phiên bản N. reload=true: client phải tải lại cả trang
+    # (cột đã đổi, dấu xóa đã dọn, hoặc đổi quá nhiều dòng)
+    table = get_table_or_404(table_id)
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Thiếu số phiên bản (since)!'})
+
+    tv = get_table_version(current_user.id, table.id)
+    version = tv.version if tv else 0
+    result = {'status': 'success', 'version': version, 'rows': [], 'deleted': [], 'reload': False}
+    if since == version:
+        return jsonify(result)
+    if since > version or (tv and (since < tv.columns_version or since < tv.min_version)):
+        result['reload'] = True
+        return jsonify(result)
+
+    rows = DataRow.query.filter_by(created_by=current_user.id, table_id=table.id) \
+        .filter(DataRow.version > since).order_by(DataRow.version, DataRow.id).limit(SYNC_MAX_ROWS + 1).all()
+    if len(rows) > SYNC_MAX_ROWS:
+        result['reload'] = True
+        return jsonify(result)
+    row_ids = {row.id for row in rows}
+    # SQLite có thể cấp lại id của dòng vừa xóa cho dòng mới: id còn sống thì không báo xóa
+    deleted = db.session.query(DeletedRow.row_id).filter(
+        DeletedRow.user_id == current_user.id, DeletedRow.table_id == table.id, DeletedRow.version > since).distinct()
+    result['rows'] = [row_to_dict(row) for row in rows]
+    result['deleted'] = sorted(row_id for (row_id,) in deleted if row_id not in row_ids)
+    return jsonify(result)
+
+@app.route('/api/stats/<int:table_id>')
+@login_required
+def api_stats(table_id):
+    # ?column=A&column=B (bỏ trống = mọi cột số) &group_by=Mác thép &date_from=&date_to= (YYYY-MM-DD, giờ VN)
+    # &percentiles=5,50,95 &bins=10
+    table = get_table_or_404(table_id)
+    columns = get_columns(current_user.id, table.id)
+    try:
+        start = parse_day(request.args.get('date_from'), 'date_from')
+        end = parse_day(request.args.get('date_to'), 'date_to')
+        try:
+            percentiles = [float(p) for p in (request.args.get('percentiles') or '5,25,50,75,95').split(',') if p.strip()]
+            bins = int(request.args.get('bins', 10))
+        except ValueError:
+            raise ValueError('percentiles / bins phải là số!')
+        if any(p < 0 or p > 100 for p in percentiles) or not 1 <= bins <= STATS_BINS_MAX:
+            raise ValueError(f'percentiles trong khoảng 0-100, bins từ 1 đến {STATS_BINS_MAX}!')
+        arrays = get_table_arrays(current_user.id, table.id, columns)
+        names = request.args.getlist('column') or arrays.numeric_names
+        unknown = [name for name in names if name not in arrays.numeric]
+        if unknown:
+            raise ValueError('Không phải cột số: ' + ', '.join(unknown))
+        group_by = request.args.get('group_by')
+        if group_by and group_by not in arrays.text:
+            raise ValueError(f'Không có cột: {group_by}')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
 
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+    mask = day_mask(arrays, start, end, VN_UTC_OFFSET_HOURS) if start or end else None
+    numeric = {name: arrays.numeric[name] if mask is None else arrays.numeric[name][mask] for name in names}
+    result = {
+        'status': 'success',
+        'rows': int(arrays.size if mask is None else mask.sum()),
+        'numeric_columns': arrays.numeric_names,
+        'columns': {name: column_stats(values, percentiles, bins) for name, values in numeric.items()}
+    }
+    if group_by:
+        groups = arrays.text[group_by] if mask is None else arrays.text[group_by][mask]
+        result['group_by'] = group_by
+        result['groups'] = group_stats(numeric, groups)
+    return jsonify(result)
+
+@app.route('/export_excel/<int:table_id>')
+@login_required
+def export_excel(table_id):
+    table = get_table_or_404(table_id)
     filename = f"{table.name}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-    return send_file(output, download_name=filename, as_attachment=True, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return cached_job_response('export_excel', export_cache_key(current_user.id, table.id), {'table_id': table.id}, filename, XLSX_MIMETYPE)
 
 @app.route('/backup_json')
 @login_required
 def backup_json():
-    backup_data = {
-        "version": "2.0",
-        "timestamp": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-        "user": current_user.username,
-        "tables": [] 
-    }
+    # ?format=ndjson: mỗi dòng 1 bản ghi JSON; ?gzip=1: nén gzip ngay khi đang gửi
+    fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'json'
+    use_gzip = request.args.get('gzip') == '1'
+    username = current_user.username
 
-    all_system_tables = AppTable.query.all()
-    
-    for table in all_system_tables:
-        cols = TableColumn.query.filter_by(user_id=current_user.id, table_id=table.id).order_by(TableColumn.order_index).all()
-        rows = DataRow.query.filter_by(created_by=current_user.id, table_id=table.id).order_by(DataRow.id).all()
-        
-        if cols or rows:
-            table_data = {
-                "name": table.name, 
-                "columns": [{"name": c.name, "order": c.order_index, "width": c.width} for c in cols],
-                "rows": []
-            }
-            
-            for r in rows:
-                table_data["rows"].append({
-                    "content": r.content,
-                    "created_at": r.created_at.strftime('%Y-%m-%d %H:%M:%S') if r.created_at else None
-                })
-            
-            backup_data["tables"].append(table_data)
+    filename = f"backup_{username}_FULL_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    if use_gzip:
+        filename += '.gz'
+        mimetype = 'application/gzip'
 
-    json_str = json.dumps(backup_data, indent=4, ensure_ascii=False)
-    output = io.BytesIO()
-    output.write(json_str.encode('utf-8'))
-    output.seek(0)
-    
-    filename = f"backup_{current_user.username}_FULL_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
-    return send_file(output, download_name=filename, as_attachment=True, mimetype='application/json')
+    params = {'format': fmt, 'gzip': use_gzip, 'username': username}
+    return cached_job_response('backup_json', backup_cache_key(current_user.id, params), params, filename, mimetype)
 
 @app.route('/restore_json', methods=['POST'])
 @login_required
@@ -211,60 +1833,62 @@ def restore_json():
 
     if file:
         try:
-            data = json.load(file)
-            added_count = 0
-            skipped_count = 0
-            
-            for tbl_data in data.get('tables', []):
-                sys_table = AppTable.query.filter_by(name=tbl_data['name']).first()
-                if not sys_table: continue 
-
-                for col_data in tbl_data['columns']:
-                    exists = TableColumn.query.filter_by(user_id=current_user.id, table_id=sys_table.id, name=col_data['name']).first()
-                    if not exists:
-                        db.session.add(TableColumn(
-                            name=col_data['name'], 
-                            order_index=col_data['order'], 
-                            width=col_data.get('width', '150px'),
-                            user_id=current_user.id, 
-                            table_id=sys_table.id
-                        ))
-
-                current_rows = DataRow.query.filter_by(table_id=sys_table.id, created_by=current_user.id).all()
-                existing_contents = [row.content for row in current_rows]
-
-                for row_data in tbl_data['rows']:
-                    content_to_check = row_data['content']
-                    
-                    if content_to_check in existing_contents:
-                        skipped_count += 1
-                        continue 
-
-                    c_at = datetime.utcnow()
-                    if row_data.get('created_at'):
-                        try: c_at = datetime.strptime(row_data['created_at'], '%Y-%m-%d %H:%M:%S')
-                        except: pass
-                    
-                    new_row = DataRow(
-                        content=content_to_check, 
-                        created_by=current_user.id, 
-                        table_id=sys_table.id, 
-                        created_at=c_at
-                    )
-                    db.session.add(new_row)
-                    
-                    existing_contents.append(content_to_check)
-                    added_count += 1
-            
+            added_count, skipped_count = restore_backup(iter_backup_records(file), current_user.id)
             db.session.commit()
+            invalidate_columns(current_user.id)
             flash(f'Xong! Đã thêm {added_count} dòng. Bỏ qua {skipped_count} dòng trùng lặp.', 'success')
             
         except Exception as e:
+            db.session.rollback()
             print(f"Lỗi restore: {e}")
             flash(f'Lỗi khi đọc file: {str(e)}', 'error')
 
     return redirect(url_for('index'))
 
+@app.route('/import_rows/<int:table_id>', methods=['POST'])
+@login_required
+def import_rows(table_id):
+    table = get_table_or_404(table_id)
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+    def fail(message):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': message})
+        flash(message, 'error')
+        return redirect(url_for('index', table_id=table.id))
+
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return fail('Chưa chọn file anh hai ơi!')
+    if not file.filename.lower().endswith(IMPORT_EXTENSIONS):
+        return fail('Chỉ nhập được file .xlsx hoặc .csv thôi!')
+
+    try:
+        result = import_table_rows(iter_import_rows(file), current_user.id, table.id)
+        db.session.commit()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return fail('File CSV phải lưu dạng UTF-8 (Excel: Lưu thành "CSV UTF-8")!')
+    except Exception as e:
+        db.session.rollback()
+        print(f"Lỗi nhập file: {e}")
+        return fail(f'Lỗi khi đọc file: {str(e)}')
+
+    print(f"Nhập file {file.filename}: {result['added']} dòng mới, {result['rejected']} dòng hỏng, "
+          f"{result['seconds']}s ({result['rows_per_sec']} dòng/giây)")
+    if wants_json:
+        return jsonify({'status': 'success', **result})
+
+    flash(f"Xong! Đã thêm {result['added']} dòng, bỏ qua {result['duplicates']} dòng trùng "
+          f"({result['rows_per_sec']:.0f} dòng/giây).", 'success')
+    if result['unknown_headers']:
+        flash('Cột không có trong bảng nên bỏ qua: ' + ', '.join(result['unknown_headers']), 'error')
+    if result['rejected']:
+        shown = '; '.join(f"dòng {e['line']}: {e['reason']}" for e in result['errors'][:5])
+        more = f" ... và {result['rejected'] - 5} dòng khác" if result['rejected'] > 5 else ''
+        flash(f"Bỏ qua {result['rejected']} dòng hỏng - {shown}{more}", 'error')
+    return redirect(url_for('index', table_id=table.id))
+
 @app.route('/admin/add_table', methods=['POST'])
 @login_required
 @admin_required
@@ -275,6 +1899,7 @@ def add_table():
         if not exists:
             db.session.add(AppTable(name=name))
             db.session.commit()
+            invalidate_tables()
             flash(f'Đã thêm mục: {name}', 'success')
         else: flash('Tên đã tồn tại!', 'error')
     return redirect(url_for('index'))
@@ -290,6 +1915,7 @@ def edit_table():
         if table:
             table.name = new_name
             db.session.commit()
+            invalidate_tables()
             flash('Đổi tên thành công!', 'success')
     return redirect(url_for('index', table_id=table_id))
 
@@ -298,12 +1924,11 @@ def edit_table():
 @admin_required
 def delete_table(table_id):
     table = AppTable.query.get(table_id)
-    if table:
-        DataRow.query.filter_by(table_id=table.id).delete()
-        TableColumn.query.filter_by(table_id=table.id).delete()
-        db.session.delete(table)
-        db.session.commit()
-        flash('Đã xóa bảng!', 'success')
+    if table and table.deleted_at is None:
+        start_purge('purge_table', table, {'table_id': table.id})
+        invalidate_tables()
+        invalidate_snapshots(table_id=table_id)
+        flash('Đã xóa bảng! Dữ liệu đang được dọn dần ở nền (xem tiến độ trong mục Quản trị).', 'success')
     return redirect(url_for('index'))
 
 @app.route('/add_column', methods=['POST'])
@@ -314,6 +1939,7 @@ def add_column():
     col_widths = request.form.getlist('col_width[]')
 
     if table_id and col_names:
+        bump_table_version(current_user.id, int(table_id), columns=True)  # khóa trước, xem get_columns_for_write
         added_count = 0
         max_order = db.session.query(db.func.max(TableColumn.order_index)).filter_by(user_id=current_user.id, table_id=table_id).scalar() or 0
         
@@ -330,9 +1956,12 @@ def add_column():
                 added_count += 1
         
         if added_count > 0:
+            refresh_row_keys(current_user.id, table_id)
             db.session.commit()
+            invalidate_columns(current_user.id, table_id)
             flash(f'Đã thêm thành công {added_count} cột mới!', 'success')
         else:
+            db.session.rollback()
             flash('Không có cột nào được thêm (có thể do bị trùng tên hoặc bỏ trống)!', 'error')
 
     return redirect(url_for('index', table_id=table_id))
@@ -343,40 +1972,51 @@ def delete_column(id):
     col = TableColumn.query.get(id)
     if col and col.user_id == current_user.id:
         tid = col.table_id
+        bump_table_version(current_user.id, tid, columns=True)  # khóa trước, xem get_columns_for_write
         db.session.delete(col)
+        refresh_row_keys(current_user.id, tid)
         db.session.commit()
+        invalidate_columns(current_user.id, tid)
         return redirect(url_for('index', table_id=tid))
     return redirect(url_for('index'))
 
+# === TÈO THÊM MỚI: BƠM GIỜ VÀO THẲNG DỮ LIỆU ===
+# Cột tên có "cập nhật" / "ngày tạo" tự điền giờ VN lúc lưu (only_empty: chỉ điền ô đang trống)
+def stamp_time_columns(row_data, only_empty=False):
+    vn_time = (datetime.utcnow() + timedelta(hours=7)).strftime('%d/%m/%Y %H:%M')
+    for key in list(row_data.keys()):
+        if "cập nhật" in key.lower() or "ngày tạo" in key.lower():
+            if not only_empty or not row_data[key]:
+                row_data[key] = vn_time
+    return row_data
+# ===============================================
+
 @app.route('/save_row', methods=['POST'])
 @login_required
 def save_row():
     row_id = request.form.get('row_id')
     table_id = request.form.get('table_id')
-    columns = TableColumn.query.filter_by(user_id=current_user.id, table_id=table_id).all()
-    row_data = {}
-    for col in columns:
-        raw_val = request.form.get(f'field_{col.id}', '')
-        if '\n' in raw_val:
-            lines = [line.strip() for line in raw_val.split('\n') if line.strip()]
-            row_data[col.name] = lines
-        else: row_data[col.name] = raw_val.strip()
-        
-    # === TÈO THÊM MỚI: BƠM GIỜ VÀO THẲNG DỮ LIỆU ===
-    vn_time = (datetime.utcnow() + timedelta(hours=7)).strftime('%d/%m/%Y %H:%M')
-    for key in list(row_data.keys()):
-        if "cập nhật" in key.lower() or "ngày tạo" in key.lower():
-            row_data[key] = vn_time
-    # ===============================================
-    
+
+    def form_row(table_id):
+        # Ô nhập trên form tên field_<id cột>: cột đổi tên vẫn khớp, giá trị lưu dưới tên mới nhất trong database
+        columns = get_columns_for_write(current_user.id, table_id) if get_table(table_id) else []
+        row_data = {col.name: split_cell_value(request.form.get(f'field_{col.id}', '')) for col in columns}
+        stamp_time_columns(row_data)
+        return row_data, build_row_keys(row_data, [col.name for col in columns])
+
     if row_id:
         row = DataRow.query.get(row_id)
         if row and row.created_by == current_user.id:
-            row.content = row_data
+            row.version = bump_table_version(current_user.id, row.table_id)
+            row.content, row_keys = form_row(row.table_id)
+            for key, value in row_keys.items():
+                setattr(row, key, value)
             db.session.commit()
             flash('Đã cập nhật!', 'success')
     else:
-        db.session.add(DataRow(content=row_data, created_by=current_user.id, table_id=table_id))
+        version = bump_table_version(current_user.id, int(table_id))
+        row_data, row_keys = form_row(table_id)
+        db.session.add(DataRow(content=row_data, created_by=current_user.id, table_id=table_id, version=version, **row_keys))
         db.session.commit()
         flash('Đã thêm dòng!', 'success')
     return redirect(url_for('index', table_id=table_id))
@@ -392,42 +2032,56 @@ def batch_update_columns():
         if not table_id:
              return jsonify({'status': 'error', 'message': 'Thiếu ID bảng!'})
 
-        current_db_columns = TableColumn.query.filter_by(user_id=current_user.id, table_id=table_id).all()
-        submitted_ids = [int(item['id']) for item in columns_data]
-
-        for db_col in current_db_columns:
-            if db_col.id not in submitted_ids:
-                db.session.delete(db_col)
-
-        my_rows = DataRow.query.filter_by(created_by=current_user.id, table_id=table_id).all()
-        
-        for item in columns_data:
-            col_id = int(item.get('id'))
+        # Khóa phiên bản bảng trước khi đọc cột / đụng tới dòng (xem get_columns_for_write); lỗi phía dưới thì rollback ở except
+        bump_table_version(current_user.id, int(table_id), columns=True)
+        current_db_columns = TableColumn.query.filter_by(user_id=current_user.id, table_id=table_id).order_by(TableColumn.order_index, TableColumn.id).all()
+        cols_by_id = {col.id: col for col in current_db_columns}
+        submitted = [item for item in columns_data if int(item['id']) in cols_by_id]
+        submitted_ids = [int(item['id']) for item in submitted]
+        deleted_ids = [col_id for col_id in cols_by_id if col_id not in submitted_ids]
+
+        # Kiểm tra trùng tên trên danh sách cột trong RAM thay vì query từng cột
+        renames = []
+        final_names = set()
+        for item in submitted:
+            col = cols_by_id[int(item['id'])]
             new_name = item.get('name')
-            new_order = item.get('order')
-            new_width = item.get('width', '150px') 
-
-            col = TableColumn.query.get(col_id)
-            if col and col.user_id == current_user.id:
-                if col.name != new_name:
-                    existing = TableColumn.query.filter_by(name=new_name, user_id=current_user.id, table_id=table_id).filter(TableColumn.id != col_id).first()
-                    if existing: return jsonify({'status': 'error', 'message': f'Tên "{new_name}" bị trùng!'})
-                    
-                    old_name = col.name
-                    col.name = new_name
-                    for row in my_rows:
-                        if row.content and old_name in row.content:
-                            updated = dict(row.content)
-                            updated[new_name] = updated.pop(old_name)
-                            row.content = updated
-                
-                col.order_index = new_order
-                col.width = new_width 
-
+            if new_name in final_names:
+                raise ValueError(f'Tên "{new_name}" bị trùng!')
+            final_names.add(new_name)
+            if col.name != new_name:
+                others = [c.name for c in current_db_columns if c.id != col.id and c.id in submitted_ids]
+                if new_name in others: raise ValueError(f'Tên "{new_name}" bị trùng!')
+                renames.append((col.name, new_name))
+
+        if deleted_ids:
+            TableColumn.query.filter(TableColumn.id.in_(deleted_ids)).delete(synchronize_session=False)
+
+        # Đổi tên key trong JSON bằng 1 câu UPDATE / cột, không kéo dữ liệu lên Python
+        for old_name, new_name in renames:
+            rename_content_key(current_user.id, table_id, old_name, new_name)
+
+        if submitted:
+            db.session.execute(db.update(TableColumn), [{
+                'id': int(item['id']),
+                'name': item.get('name'),
+                'order_index': item.get('order'),
+                'width': item.get('width', '150px')
+            } for item in submitted])
+
+        # Chỉ tính lại sort_key khi thứ tự cột thật sự đổi (đổi tên không làm đổi thứ tự)
+        old_order = [col.id for col in current_db_columns]
+        new_order = [int(item['id']) for item in sorted(submitted, key=lambda item: item.get('order') or 0)]
+        if old_order != new_order:
+            refresh_row_keys(current_user.id, table_id)
+        elif renames:
+            fill_content_hashes(current_user.id, table_id)
         db.session.commit()
+        invalidate_columns(current_user.id, table_id)
         return jsonify({'status': 'success'})
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)})
     
 @app.route('/delete_row/<int:id>')
@@ -437,18 +2091,179 @@ def delete_row(id):
     if row and row.created_by == current_user.id:
         tid = row.table_id
         db.session.delete(row)
+        record_deleted_rows(current_user.id, tid, [row.id], bump_table_version(current_user.id, tid))
         db.session.commit()
         return redirect(url_for('index', table_id=tid))
     return redirect(url_for('index'))
 
+# --- SỬA / XÓA / SAO CHÉP NHIỀU DÒNG 1 LẦN (JSON) ---
+BATCH_ROWS_MAX = 1000
+
+def batch_cell_value(value):
+    # Ô gửi lên là chuỗi (có xuống dòng = ô nhiều dòng, giống form) hoặc list các dòng
+    if isinstance(value, list):
+        value = "\n".join(str(v) for v in value)
+    return split_cell_value('' if value is None else str(value))
+
+@app.route('/api/rows/<int:table_id>/batch', methods=['POST'])
+@login_required
+def batch_rows(table_id):
+    # Body: {"upserts": [{"id": 5, "content": {...}}, {"content": {...}, "ref": "moi-1"}],
+    #        "copies": [6, {"id": 7, "content": {...}}], "deletes": [8, 9]}
+    # content theo tên cột, hoặc fields theo id cột {"12": "giá trị"} (form trên trang chính dùng cách này giống field_<id> của
+    # save_row: cột vừa bị đổi tên ở tab / máy khác vẫn ghi đúng cột); sửa dòng có sẵn / sao chép thì cột không gửi giữ giá trị cũ.
+    # Thứ tự: sửa -> sao chép (thấy nội dung vừa sửa) -> xóa.
+    # Ghi hết trong 1 transaction, sai 1 chỗ là không ghi gì. Trả về các dòng vừa thêm/sửa (kèm "ref" nếu có) + id đã xóa,
+    # trang chính tự vá bảng, không phải tải lại cả trang.
+    table = get_table_or_404(table_id)
+    req_data = request.get_json(silent=True)
+    if not isinstance(req_data, dict):
+        return jsonify({'status': 'error', 'message': 'Dữ liệu gửi lên phải là JSON!'})
+    upserts = req_data.get('upserts') or []
+    copies = req_data.get('copies') or []
+    deletes = req_data.get('deletes') or []
+    if not all(isinstance(items, list) for items in (upserts, copies, deletes)):
+        return jsonify({'status': 'error', 'message': 'upserts / copies / deletes phải là danh sách!'})
+    if len(upserts) + len(copies) + len(deletes) > BATCH_ROWS_MAX:
+        return jsonify({'status': 'error', 'message': f'Tối đa {BATCH_ROWS_MAX} dòng mỗi lần!'})
+
+    try:
+        copies = [item if isinstance(item, dict) else {'id': item} for item in copies]
+        edit_ids = [int(item['id']) for item in upserts if item.get('id')]
+        copy_ids = [int(item['id']) for item in copies]
+        delete_ids = {int(row_id) for row_id in deletes}
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return jsonify({'status': 'error', 'message': 'ID dòng không hợp lệ!'})
+    if len(set(edit_ids)) != len(edit_ids) or set(edit_ids) & delete_ids:
+        return jsonify({'status': 'error', 'message': 'Mỗi dòng chỉ được sửa hoặc xóa 1 lần!'})
+
+    # Kiểm tra quyền mọi dòng bằng 1 câu query: chỉ lấy được dòng của chính user, trong đúng bảng này
+    wanted = set(edit_ids) | set(copy_ids) | delete_ids
+    owned = {}
+    if wanted:
+        owned = dict(db.session.query(DataRow.id, DataRow.content).filter(
+            DataRow.id.in_(wanted), DataRow.created_by == current_user.id, DataRow.table_id == table.id))
+    missing = sorted(wanted - owned.keys())
+    if missing:
+        return jsonify({'status': 'error', 'message': f'Không tìm thấy dòng: {", ".join(map(str, missing))}'})
+
+    version = bump_table_version(current_user.id, table.id)
+    columns = get_columns_for_write(current_user.id, table.id)  # sau khi lấy phiên bản
+    col_names = [col.name for col in columns]
+    updates = []
+    inserts = []
+    refs = []
+    for item, copying in [(item, False) for item in upserts] + [(item, True) for item in copies]:
+        changes = item.get('content') or {}
+        fields = item.get('fields') or {}
+        if not isinstance(changes, dict):
+            return jsonify({'status': 'error', 'message': 'content phải là object {tên cột: giá trị}!'})
+        if not isinstance(fields, dict):
+            return jsonify({'status': 'error', 'message': 'fields phải là object {id cột: giá trị}!'})
+        if fields:
+            changes = dict(changes, **{col.name: fields[str(col.id)] for col in columns if str(col.id) in fields})
+        row_id = int(item['id']) if item.get('id') else None
+        base = owned[row_id] if row_id else {}
+        row_data = stamp_time_columns({
+            name: batch_cell_value(changes[name]) if name in changes else base.get(name, '') for name in col_names
+        })
+        values = {'content': row_data, 'version': version, **build_row_keys(row_data, col_names)}
+        if row_id and not copying:
+            updates.append({'id': row_id, **values})
+            owned[row_id] = row_data  # sao chép phía sau lấy nội dung đã sửa
+        else:
+            inserts.append({'created_by': current_user.id, 'table_id': table.id, 'created_at': datetime.utcnow(), **values})
+            refs.append(item.get('ref'))
+
+    try:
+        if updates:
+            db.session.execute(db.update(DataRow), updates)
+        new_ids = []
+        if inserts:
+            new_ids = db.session.scalars(db.insert(DataRow).returning(DataRow.id, sort_by_parameter_order=True), inserts).all()
+        # Xóa sau cùng để dòng mới không lấy lại id của dòng vừa xóa (SQLite)
+        if delete_ids:
+            db.session.execute(db.delete(DataRow).where(DataRow.id.in_(delete_ids)))
+            record_deleted_rows(current_user.id, table.id, sorted(delete_ids), version)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Lỗi ghi nhiều dòng: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
+    changed_ids = [item['id'] for item in updates] + list(new_ids)
+    ref_by_id = dict(zip(new_ids, refs))
+    rows_by_id = {row.id: row for row in DataRow.query.filter(DataRow.id.in_(changed_ids))} if changed_ids else {}
+    rows = []
+    for row_id in changed_ids:
+        row = row_to_dict(rows_by_id[row_id])
+        if ref_by_id.get(row_id) is not None:
+            row['ref'] = ref_by_id[row_id]
+        rows.append(row)
+    return jsonify({
+        'status': 'success',
+        'rows': rows,
+        'created': list(new_ids),
+        'deleted': sorted(delete_ids),
+        'version': version
+    })
+
 @app.route('/print_row/<int:id>')
 @login_required
 def print_row(id):
     row = DataRow.query.get_or_404(id)
     if row.created_by != current_user.id: return "Không có quyền!", 403
-    columns = TableColumn.query.filter_by(user_id=current_user.id, table_id=row.table_id).order_by(TableColumn.order_index).all()
     vn_time = datetime.utcnow() + timedelta(hours=7)
-    return render_template('print_ticket.html', row=row, columns=columns, today=vn_time.strftime('%d/%m/%Y'))
+    params = {'row_id': row.id, 'table_id': row.table_id, 'today': vn_time.strftime('%d/%m/%Y')}
+    job = enqueue_job('print_row', current_user.id, params, f"Phieu_{row.id}.html", 'text/html')
+    return job_response(job)
+
+PRINT_ROWS_MAX = 1000
+
+def parse_row_ids(value):
+    # [1, 5, 9] (JSON) hoặc "1, 5 9" (form)
+    if not value:
+        return []
+    items = value if isinstance(value, list) else str(value).replace(',', ' ').split()
+    try:
+        return [int(item) for item in items]
+    except (TypeError, ValueError):
+        raise ValueError('ID dòng không hợp lệ!')
+
+@app.route('/print_rows/<int:table_id>', methods=['POST'])
+@login_required
+def print_rows(table_id):
+    # In nhiều phiếu ra 1 file PDF. Form trên dashboard (q, date_from, date_to, ids) hoặc JSON {"ids": [...]} / {"q", "date_from", "date_to"}
+    table = get_table_or_404(table_id)
+    data = request.get_json(silent=True) or request.form
+    try:
+        ids = parse_row_ids(data.get('ids'))
+        start = parse_day(data.get('date_from'), 'date_from')
+        end = parse_day(data.get('date_to'), 'date_to')
+        conditions, _ = search_conditions(data.get('q') or '')
+        query = db.session.query(DataRow.id).filter(DataRow.created_by == current_user.id, DataRow.table_id == table.id, *conditions)
+        if ids:
+            query = query.filter(DataRow.id.in_(ids))
+        # Ngày theo giờ VN, created_at lưu giờ UTC
+        if start:
+            query = query.filter(DataRow.created_at >= datetime.combine(start, datetime.min.time()) - timedelta(hours=VN_UTC_OFFSET_HOURS))
+        if end:
+            query = query.filter(DataRow.created_at < datetime.combine(end, datetime.min.time()) + timedelta(days=1, hours=-VN_UTC_OFFSET_HOURS))
+        row_ids = [row_id for (row_id,) in query.order_by(DataRow.sort_key, DataRow.id).limit(PRINT_ROWS_MAX + 1)]
+        if not row_ids:
+            raise ValueError('Không có dòng nào khớp để in!')
+        if len(row_ids) > PRINT_ROWS_MAX:
+            raise ValueError(f'Tối đa {PRINT_ROWS_MAX} phiếu mỗi lần, lọc bớt giúp em!')
+    except ValueError as e:
+        if request.is_json:
+            return jsonify({'status': 'error', 'message': str(e)})
+        flash(str(e), 'error')
+        return redirect(url_for('index', table_id=table.id))
+
+    vn_time = datetime.utcnow() + timedelta(hours=VN_UTC_OFFSET_HOURS)
+    params = {'table_id': table.id, 'row_ids': row_ids, 'today': vn_time.strftime('%d/%m/%Y')}
+    job = enqueue_job('print_rows', current_user.id, params, f"Phieu_{len(row_ids)}_dong_{vn_time.strftime('%Y-%m-%d')}.pdf", 'application/pdf')
+    return job_response(job)
 
 @app.route('/admin/toggle_role/<int:user_id>')
 @login_required
@@ -459,6 +2274,7 @@ def toggle_role(user_id):
     if user:
         user.role = 'user' if user.role == 'admin' else 'admin'
         db.session.commit()
+        invalidate_user(user_id)
         flash('Đổi quyền thành công!', 'success')
     return redirect(url_for('index'))
 
@@ -478,20 +2294,108 @@ def admin_reset_password(user_id):
 @admin_required
 def admin_delete_user(user_id):
     user = User.query.get(user_id)
-    if user and user.role != 'admin':
-        DataRow.query.filter_by(created_by=user.id).delete()
-        TableColumn.query.filter_by(user_id=user.id).delete()
-        db.session.delete(user)
+    if user and user.role != 'admin' and user.deleted_at is None:
+        start_purge('purge_user', user, {'target_user_id': user.id})
+        invalidate_user(user_id)
+        invalidate_snapshots(user_id)
+        flash('Đã xóa tài khoản! Dữ liệu đang được dọn dần ở nền (xem tiến độ trong mục Quản trị).', 'success')
+    return redirect(url_for('index'))
+
+@app.route('/admin/purge/<job_id>/retry', methods=['POST'])
+@login_required
+@admin_required
+def retry_purge(job_id):
+    # Job xóa bị lỗi (mất kết nối, hết timeout...) thì chạy lại, phần đã xóa không làm lại
+    job = db.session.get(Job, job_id)
+    if job and job.kind in PURGE_HANDLERS and job.status == 'error':
+        job.status = 'queued'
+        job.error = None
         db.session.commit()
-        flash('Đã xóa tài khoản!', 'success')
+        submit_job(job.id)
+        flash('Đang chạy lại việc xóa!', 'success')
     return redirect(url_for('index'))
 
+@app.route('/admin/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify({'status': 'success', 'metadata_cache': metadata_cache.stats(), 'table_snapshots': table_snapshots.stats(),
+                    'table_arrays': table_arrays_cache.stats(), 'file_cache': file_cache.stats()})
+
+# Prometheus gọi bằng header "Authorization: Bearer <METRICS_TOKEN>"; admin đang đăng nhập thì xem thẳng
+def metrics_authorized():
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(auth, f'Bearer {METRICS_TOKEN}')
+    return token_ok or (current_user.is_authenticated and current_user.role == 'admin')
+
+@app.route('/metrics')
+def metrics_text():
+    if not metrics_authorized():
+        abort(403)
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def summarize_histograms(name, key='endpoint'):
+    # Gộp histogram theo 1 nhãn (bỏ qua nhãn khác) -> {giá trị nhãn: Histogram}
+    merged = {}
+    for labels, hist in metrics.histograms(name):
+        target = merged.setdefault(labels.get(key), Histogram(hist.buckets))
+        target.counts = [a + b for a, b in zip(target.counts, hist.counts)]
+        target.count += hist.count
+        target.sum += hist.sum
+    return merged
+
+@app.route('/admin/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    durations = summarize_histograms('http_request_duration_seconds')
+    for kind, hist in summarize_histograms('job_duration_seconds', key='kind').items():
+        durations[f'job:{kind}'] = hist
+    queries = summarize_histograms('db_queries_per_request')
+    sql_time = summarize_histograms('db_seconds_per_request')
+    sizes = summarize_histograms('http_response_size_bytes')
+    n_plus_one = Counter()
+    for labels, value in metrics.counters('n_plus_one_warnings_total'):
+        n_plus_one[labels['endpoint']] += value
+
+    routes = []
+    for endpoint, hist in durations.items():
+        q, t, size = queries.get(endpoint), sql_time.get(endpoint), sizes.get(endpoint)
+        routes.append({
+            'endpoint': endpoint,
+            'count': hist.count,
+            'avg_ms': hist.sum / hist.count * 1000 if hist.count else 0,
+            'p50_ms': hist.quantile(0.5) * 1000,
+            'p95_ms': hist.quantile(0.95) * 1000,
+            'p99_ms': hist.quantile(0.99) * 1000,
+            'queries': q.sum / q.count if q and q.count else 0,
+            'sql_ms': t.sum / t.count * 1000 if t and t.count else 0,
+            'size_kb': size.sum / size.count / 1024 if size and size.count else None,
+            'n_plus_one': n_plus_one.get(endpoint, 0),
+        })
+    routes.sort(key=lambda r: r['avg_ms'] * r['count'], reverse=True)  # route tốn nhiều thời gian nhất lên đầu
+
+    renders = [{'kind': kind, 'count': hist.count, 'avg_ms': hist.sum / hist.count * 1000 if hist.count else 0,
+                'p95_ms': hist.quantile(0.95) * 1000}
+               for kind, hist in sorted(summarize_histograms('report_render_seconds', key='kind').items())]
+    return render_template('metrics.html', routes=routes, renders=renders, warnings=list(metrics.warnings),
+                           started_at=datetime.fromtimestamp(metrics.started_at), threshold=N_PLUS_ONE_THRESHOLD)
+
+@app.route('/admin/metrics/reset', methods=['POST'])
+@login_required
+@admin_required
+def admin_metrics_reset():
+    metrics.clear()
+    flash('Đã xóa số liệu đo!', 'success')
+    return redirect(url_for('admin_metrics'))
+
 @app.route('/change_password', methods=['POST'])
 @login_required
 def change_password():
     new_pass = request.form.get('new_password')
     if new_pass:
-        current_user.password = generate_password_hash(new_pass)
+        user = User.query.get(current_user.id)
+        user.password = generate_password_hash(new_pass)
         db.session.commit()
         flash('Đổi mật khẩu thành công!', 'success')
     return redirect(url_for('index'))
@@ -507,7 +2411,7 @@ def login():
                 db.session.add(User(username=request.form.get('username'), password=generate_password_hash(request.form.get('password')), role=role))
                 db.session.commit()
                 flash('Tạo xong!', 'success')
-        elif user and check_password_hash(user.password, request.form.get('password')):
+        elif user and user.deleted_at is None and check_password_hash(user.password, request.form.get('password')):
             login_user(user)
             return redirect(url_for('index'))
         else: flash('Sai mật khẩu!', 'error')
@@ -517,12 +2421,30 @@ def login():
 @login_required
 def logout(): logout_user(); return redirect(url_for('login'))
 
+# Kiểm tra sống cho máy ping (giữ server thức): chỉ SELECT 1, không đếm bảng.
+# connect_ms = lấy kết nối từ pool (gồm cả pre-ping / mở kết nối mới nếu pool nguội), query_ms = chạy SELECT 1.
+# Route không cần đăng nhập nên tình trạng pool chỉ hiện cho người xem được /metrics (token hoặc admin).
 @app.route('/ping_db')
 def ping_db():
+    started = time.perf_counter()
     try:
-        count = User.query.count()
-        return f"Hello Robot! {count}", 200
-    except: return "Error", 500
+        with db.engine.connect() as conn:
+            connected = time.perf_counter()
+            conn.execute(db.text('SELECT 1')).scalar()
+    except Exception as e:
+        print(f"Lỗi ping database: {e}")
+        if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+            return jsonify({'status': 'error', 'message': 'Không kết nối được database'}), 500
+        return "Error", 500
+    finished = time.perf_counter()
+    connect_ms = round((connected - started) * 1000, 1)
+    query_ms = round((finished - connected) * 1000, 1)
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        result = {'status': 'success', 'connect_ms': connect_ms, 'query_ms': query_ms, 'total_ms': round(connect_ms + query_ms, 1)}
+        if metrics_authorized():
+            result['pool'] = db.engine.pool.status()
+        return jsonify(result)
+    return f"Hello Robot! {connect_ms + query_ms:.1f}ms", 200
 
 @app.route('/generate_report', methods=['POST'])
 @login_required
@@ -533,34 +2455,261 @@ def generate_report():
     notes = request.form.get('notes')
     action = request.form.get('action_type') 
 
+    if action not in ('excel', 'pdf'):
+        return redirect(url_for('index'))
+
+    params = {'action': action, 'date': r_date, 'supervisor': supervisor, 'output': output_val, 'notes': notes}
+    fill_report_outputs([params], request.form)
     if action == 'excel':
-        file_stream, err = create_excel_report(r_date, supervisor, output_val, notes)
-        if err:
-            flash(err, 'error')
-            return redirect(url_for('index'))
-        return send_file(file_stream, download_name=f"BaoCao_{r_date}.xlsx", as_attachment=True, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        filename, mimetype = f"BaoCao_{r_date}.xlsx", XLSX_MIMETYPE
+    else:
+        filename, mimetype = f"BaoCao_{r_date}.pdf", 'application/pdf'
+    return cached_job_response('generate_report', report_cache_key(current_user.id, params), params, filename, mimetype)
+
+def fill_report_outputs(reports, data):
+    # Ô sản lượng để trống + chọn cột sản lượng (output_table_id, output_column) -> điền tổng cột đó của các dòng tạo trong ngày
+    missing = []
+    for report in reports:
+        if report.get('output'):
+            continue
+        try:
+            day = parse_day(report.get('date'), 'date')
+        except ValueError:
+            continue
+        if day is not None:
+            missing.append((day, report))
+    if not missing or not data.get('output_column'):
+        return
+    days = [day for day, _ in missing]
+    sums = report_daily_outputs(current_user.id, data.get('output_table_id'), data.get('output_column'), min(days), max(days))
+    for day, report in missing:
+        if sums and day.isoformat() in sums:
+            report['output'] = str(sums[day.isoformat()])
+
+# --- BÁO CÁO NHIỀU NGÀY ---
+BATCH_REPORT_MAX_DAYS = 62
+BATCH_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d/%m')
+
+def parse_report_date(text, year):
+    for fmt in BATCH_DATE_FORMATS:
+        try:
+            day = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return (day.replace(year=year) if fmt == '%d/%m' else day).strftime('%Y-%m-%d')
+    raise ValueError(f'Ngày "{text}" không đúng dạng (vd: 2026-10-01 hoặc 01/10)!')
+
+def parse_batch_reports(data):
+    # Khoảng ngày + số liệu chung cho mọi ngày; mỗi dòng "ngày | ca/người phụ trách | sản lượng | ghi chú"
+    # trong daily_lines ghi đè riêng cho ngày đó (ô để trống thì giữ số liệu chung)
+    try:
+        start = datetime.strptime(data.get('date_from') or '', '%Y-%m-%d')
+        end = datetime.strptime(data.get('date_to') or '', '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Chọn ngày bắt đầu và ngày kết thúc giúp em!')
+    if end < start:
+        raise ValueError('Ngày kết thúc phải sau ngày bắt đầu!')
+    days = (end - start).days + 1
+    if days > BATCH_REPORT_MAX_DAYS:
+        raise ValueError(f'Tối đa {BATCH_REPORT_MAX_DAYS} ngày mỗi lần!')
+
+    reports = {}
+    for i in range(days):
+        day = (start + timedelta(days=i)).strftime('%Y-%m-%d')
+        reports[day] = {'date': day, 'supervisor': data.get('supervisor'), 'output': data.get('total_output'), 'notes': data.get('notes')}
+    for line in (data.get('daily_lines') or '').splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if not parts[0]:
+            continue
+        day = parse_report_date(parts[0], start.year)
+        if day not in reports:
+            raise ValueError(f'Ngày {parts[0]} nằm ngoài khoảng đã chọn!')
+        for key, value in zip(('supervisor', 'output', 'notes'), parts[1:]):
+            if value:
+                reports[day][key] = value
+    return list(reports.values())
+
+@app.route('/generate_batch_report', methods=['POST'])
+@login_required
+def generate_batch_report():
+    # Form trên dashboard, hoặc JSON {"format", "bundle", "reports": [{"date", "supervisor", "output", "notes"}, ...]}
+    data = request.get_json(silent=True) or request.form
+    action = data.get('action_type') or data.get('format')
+    bundle = 'merged' if data.get('bundle') == 'merged' else 'zip'
+    try:
+        if action not in ('excel', 'pdf'):
+            raise ValueError('Chọn Excel hoặc PDF giúp em!')
+        if isinstance(data.get('reports'), list):
+            reports = [{'date': str(r.get('date') or ''), 'supervisor': r.get('supervisor'), 'output': r.get('output'), 'notes': r.get('notes')}
+                       for r in data['reports'] if isinstance(r, dict)]
+            if not reports or len(reports) > BATCH_REPORT_MAX_DAYS:
+                raise ValueError(f'Cần từ 1 đến {BATCH_REPORT_MAX_DAYS} báo cáo!')
+        else:
+            reports = parse_batch_reports(data)
+        fill_report_outputs(reports, data)
+    except ValueError as e:
+        if request.is_json:
+            return jsonify({'status': 'error', 'message': str(e)})
+        flash(str(e), 'error')
+        return redirect(url_for('index'))
 
-    elif action == 'pdf':
-        file_stream, err = create_pdf_report(r_date, supervisor, output_val, notes)
-        if err:
-            flash(err, 'error') 
-            return redirect(url_for('index'))
-        return send_file(file_stream, download_name=f"BaoCao_{r_date}.pdf", as_attachment=True, mimetype='application/pdf')
+    name = f"BaoCao_{reports[0]['date']}_den_{reports[-1]['date']}"
+    if bundle == 'zip':
+        filename, mimetype = f"{name}.zip", 'application/zip'
+    elif action == 'excel':
+        filename, mimetype = f"{name}.xlsx", XLSX_MIMETYPE
+    else:
+        filename, mimetype = f"{name}.pdf", 'application/pdf'
+    params = {'format': action, 'bundle': bundle, 'reports': reports}
+    job = enqueue_job('batch_report', current_user.id, params, filename, mimetype)
+    return job_response(job)
 
-    return redirect(url_for('index'))
+# --- THEO DÕI / TẢI KẾT QUẢ JOB ---
+@app.route('/jobs/<job_id>')
+@login_required
+def job_page(job_id):
+    job = get_user_job_or_404(job_id)
+    return render_template('job_status.html', job=job_to_dict(job))
 
-# Đoạn code sửa lỗi "tiêm" cột width an toàn
-with app.app_context():
-    try:
-        from sqlalchemy import text
-        # Thử chèn cột width, nếu có rồi sẽ văng lỗi nhảy xuống except
-        db.session.execute(text("ALTER TABLE table_column ADD COLUMN width VARCHAR(20) DEFAULT '150px';"))
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-    
-    # Đảm bảo các bảng khác được tạo
+@app.route('/api/jobs')
+@login_required
+def api_jobs():
+    jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.created_at.desc()).limit(20).all()
+    return jsonify({'status': 'success', 'jobs': [job_to_dict(job) for job in jobs]})
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job(job_id):
+    job = get_user_job_or_404(job_id)
+    return jsonify({'status': 'success', 'job': job_to_dict(job)})
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def download_job(job_id):
+    job = get_user_job_or_404(job_id)
+    if job.status != 'done' or not job.result_path or not os.path.exists(job.result_path):
+        flash('File chưa xong hoặc đã bị dọn, anh tạo lại giúp em nhé!', 'error')
+        return redirect(url_for('job_page', job_id=job.id))
+    # Phiếu in mở thẳng trên trình duyệt, còn lại tải về
+    cache = (job.params or {}).get('cache')
+    return send_result_file(job.result_path, job.filename, job.mimetype, as_attachment=job.kind not in ('print_row', 'print_rows'),
+                            digest=cache['digest'] if cache else None)
+
+# --- NÂNG CẤP CẤU TRÚC DATABASE ---
+# Tạo bảng mới, bổ sung cột/index còn thiếu so với models, rồi điền dữ liệu cho cột mới.
+# Chạy lại nhiều lần vẫn an toàn (chỉ làm phần còn thiếu).
+def upgrade_schema():
     db.create_all()
+    engine = db.engine
+    inspector = db.inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote  # bảng "user" trùng từ khóa của Postgres
+    added = set()
+
+    for table in db.metadata.sorted_tables:
+        existing_cols = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_cols:
+                continue
+            col_type = column.type.compile(dialect=engine.dialect)
+            ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {column.name} {col_type}'
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT '{column.default.arg}'"
+            with engine.begin() as conn:
+                conn.execute(db.text(ddl))
+            added.add(f'{table.name}.{column.name}')
+            print(f"Đã thêm cột {table.name}.{column.name}")
+
+        existing_idx = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_idx:
+                index.create(bind=engine)
+                print(f"Đã tạo index {index.name}")
+
+    upgrade_foreign_keys(engine, inspector)
+    setup_search_index()
+
+    # Điền sort_key / content_hash / search_text cho các dòng cũ chưa có
+    pending = db.session.query(DataRow.created_by, DataRow.table_id)
+    if 'data_row.sort_key' not in added:
+        pending = pending.filter(db.or_(DataRow.sort_key.is_(None), DataRow.content_hash.is_(None), DataRow.search_text.is_(None)))
+    pending = pending.distinct().all()
+    for user_id, table_id in pending:
+        refresh_row_keys(user_id, table_id)
+    if db.session.get(SchemaInfo, 'database_id') is None:
+        db.session.add(SchemaInfo(key='database_id', value=uuid.uuid4().hex))  # xem database_id()
+    db.session.merge(SchemaInfo(key='fingerprint', value=schema_fingerprint()))
+    db.session.commit()
+
+def upgrade_foreign_keys(engine, inspector):
+    # Database cũ tạo khóa ngoại chưa có ON DELETE CASCADE: thay bằng khóa mới (chỉ Postgres, SQLite không sửa được khóa ngoại).
+    # NOT VALID rồi mới VALIDATE: không khóa bảng lúc kiểm tra dữ liệu cũ, web vẫn ghi được.
+    if engine.dialect.name != 'postgresql':
+        return
+    quote = engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        existing = {tuple(fk['constrained_columns']): fk for fk in inspector.get_foreign_keys(table.name)}
+        for fk in table.foreign_key_constraints:
+            cols = tuple(c.name for c in fk.columns)
+            current = existing.get(cols)
+            if not fk.ondelete or (current and (current.get('options') or {}).get('ondelete', '').upper() == fk.ondelete.upper()):
+                continue
+            name = current['name'] if current else f"{table.name}_{'_'.join(cols)}_fkey"
+            ref_cols = ', '.join(element.column.name for element in fk.elements)
+            with engine.begin() as conn:
+                if current:
+                    conn.execute(db.text(f'ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(name)}'))
+                conn.execute(db.text(
+                    f"ALTER TABLE {quote(table.name)} ADD CONSTRAINT {quote(name)} FOREIGN KEY ({', '.join(cols)}) "
+                    f"REFERENCES {quote(fk.referred_table.name)} ({ref_cols}) ON DELETE {fk.ondelete} NOT VALID"
+                ))
+            try:
+                with engine.begin() as conn:
+                    conn.execute(db.text(f'ALTER TABLE {quote(table.name)} VALIDATE CONSTRAINT {quote(name)}'))
+            except Exception as e:
+                # Còn dòng mồ côi (trỏ tới user / bảng đã mất): khóa vẫn áp cho dữ liệu mới, chỉ chưa kiểm được dữ liệu cũ
+                print(f"Chưa kiểm được khóa ngoại {name}: {e}")
+            print(f"Đã đặt ON DELETE {fk.ondelete} cho {table.name}({', '.join(cols)})")
+
+# Đổi khi models (bảng / cột / index) đổi. Sửa phần ngoài models (trigger, index tìm kiếm, khóa ngoại...) thì tăng SCHEMA_REVISION.
+SCHEMA_REVISION = 3
+
+def schema_fingerprint():
+    parts = [str(SCHEMA_REVISION)]
+    for table in db.metadata.sorted_tables:
+        parts.append(f"{table.name}({','.join(c.name for c in table.columns)})[{','.join(sorted(i.name for i in table.indexes))}]")
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+# Nâng cấp chạy riêng 1 lần lúc deploy: "python migrate_db.py" (Procfile: release).
+# Worker khởi động chỉ so dấu cấu trúc (1 câu SELECT); lệch thì tự nâng cấp luôn nếu AUTO_MIGRATE=1 (mặc định) cho khỏi sập
+# khi quên chạy migrate, AUTO_MIGRATE=0 thì chỉ báo.
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') != '0'
+
+def schema_is_current():
+    try:
+        info = db.session.get(SchemaInfo, 'fingerprint')
+        return info is not None and info.value == schema_fingerprint()
+    except Exception:
+        db.session.rollback()  # bảng schema_info chưa có
+        return False
+
+# Process con của pool báo cáo (kiểu spawn) nạp lại file này với tên __mp_main__ khi chạy "python app.py":
+# chúng chỉ render báo cáo, không được nâng cấp DB hay nhận job.
+# APP_SKIP_STARTUP=1: script chỉ mượn models (migrate_db.py, reset_db.py), không nhận job.
+if __name__ != '__mp_main__' and os.environ.get('APP_SKIP_STARTUP') != '1':
+    with app.app_context():
+        if not schema_is_current():
+            if AUTO_MIGRATE:
+                print("Cấu trúc database chưa nâng cấp, đang nâng cấp (lần sau nên chạy: python migrate_db.py)")
+                upgrade_schema()
+            else:
+                print("CẢNH BÁO: cấu trúc database chưa nâng cấp, chạy: python migrate_db.py")
+        detect_search_backend()
+        resume_jobs()
+
+STARTUP_SECONDS = time.perf_counter() - _import_started
+metrics.set('app_startup_seconds', round(STARTUP_SECONDS, 3))
+if __name__ != '__mp_main__':
+    print(f"Khởi động app trong {STARTUP_SECONDS:.2f}s")
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,959 @@
+# File: benchmark.py
+# Đo hiệu năng các chức năng nặng trên database tạm (mặc định SQLite, không đụng dữ liệu thật).
+# Mỗi phép đo chạy trong 1 process riêng để số RAM đỉnh (peak RSS) không bị lẫn nhau.
+#
+#   python benchmark.py export --rows 10000 100000 1000000
+#   python benchmark.py rename --rows 10000 100000
+#   python benchmark.py rename --rows 100000 --database-url postgresql://.../db_nhap   (database TRỐNG để thử)
+#   python benchmark.py report --count 200
+#   python benchmark.py search --rows 100000
+#   python benchmark.py import --rows 10000 100000
+#   python benchmark.py startup --repeat 5
+#   python benchmark.py tickets --count 500 1000 --chunk 50 1000 --workers 1 4
+#   python benchmark.py load --users 50 --duration 20   (chạy gunicorn thật, cần cài gunicorn)
+#   python benchmark.py suite --users 3 --tables 2 --rows 5000 --out ketqua.json   (thêm --compare ketqua_cu.json để so)
+import io
+import os
+import re
+import sys
+import csv
+import json
+import time
+import socket
+import argparse
+import threading
+import http.client
+import urllib.parse
+import resource
+import shutil
+import subprocess
+import tempfile
+import zipfile
+
+BENCH_USER = 'bench'
+BENCH_PASS = 'bench'
+BENCH_COLUMNS = ["Sản phẩm", "Mác thép", "Bộ gap", "Nhiệt lò nung", "Cơ tính"]
+
+
+def peak_rss_mb():
+    # Linux trả về KB, macOS trả về byte
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def load_app(db_url):
+    os.environ['DATABASE_URL'] = db_url
+    import app as app_module
+    return app_module
+
+
+def sqlite_url(db_path):
+    return f'sqlite:///{db_path}'
+
+
+def make_content(i):
+    return {
+        "Sản phẩm": f"Thép cuộn {i % 50}",
+        "Mác thép": f"SAE{1006 + i % 12}",
+        "Bộ gap": [f"G{i % 7}", f"G{(i + 3) % 7}"] if i % 4 == 0 else f"G{i % 7}",
+        "Nhiệt lò nung": str(1100 + i % 150),
+        "Cơ tính": f"{350 + i % 90} MPa",
+    }
+
+
+def seed(db_url, n_rows, batch=10000):
+    m = load_app(db_url)
+    from werkzeug.security import generate_password_hash
+    with m.app.app_context():
+        if m.AppTable.query.first() is not None:
+            raise SystemExit("Database đã có dữ liệu - chỉ chạy benchmark trên database trống!")
+        user = m.User(username=BENCH_USER, password=generate_password_hash(BENCH_PASS))
+        table = m.AppTable(name="DATA XƯỞNG THÉP")
+        m.db.session.add_all([user, table])
+        m.db.session.commit()
+        for idx, name in enumerate(BENCH_COLUMNS):
+            m.db.session.add(m.TableColumn(name=name, order_index=idx, user_id=user.id, table_id=table.id))
+        m.db.session.commit()
+
+        insert = m.db.insert(m.DataRow)
+        for start in range(0, n_rows, batch):
+            values = []
+            for i in range(start, min(start + batch, n_rows)):
+                content = make_content(i)
+                values.append({
+                    'content': content, 'created_by': user.id, 'table_id': table.id,
+                    **m.build_row_keys(content, BENCH_COLUMNS)
+                })
+            m.db.session.execute(insert, values)
+            m.db.session.commit()
+        return table.id
+
+
+def login(client):
+    client.post('/login', data={'username': BENCH_USER, 'password': BENCH_PASS})
+
+
+def run_job_request(client, url, method='get', **kwargs):
+    # Các endpoint nặng trả về job (202 + JSON): chờ job xong rồi tải file kết quả
+    resp = getattr(client, method)(url, headers={'Accept': 'application/json'}, **kwargs)
+    job = resp.get_json()['job']
+    while job['state'] in ('queued', 'running'):
+        time.sleep(0.02)
+        job = client.get(job['status_url']).get_json()['job']
+    if job['state'] != 'done':
+        raise RuntimeError(job['error'])
+    resp = client.get(job['download_url'])
+    size = sum(len(chunk) for chunk in resp.response)
+    resp.close()
+    return size
+
+
+def run_export(db_url, mode):
+    m = load_app(db_url)
+    with m.app.app_context():
+        table_id = m.AppTable.query.first().id
+    client = m.app.test_client()
+    login(client)
+    base_rss = peak_rss_mb()
+
+    started = time.perf_counter()
+    if mode == 'legacy':
+        size = legacy_export(m, table_id)
+    else:
+        size = run_job_request(client, f'/export_excel/{table_id}')
+    elapsed = time.perf_counter() - started
+    return {'mode': mode, 'seconds': round(elapsed, 2), 'bytes': size,
+            'base_rss_mb': base_rss, 'peak_rss_mb': peak_rss_mb()}
+
+
+def legacy_export(m, table_id):
+    # Cách xuất cũ (Workbook thường + .all() + BytesIO) để so sánh
+    import io
+    import openpyxl
+    with m.app.app_context():
+        user = m.User.query.filter_by(username=BENCH_USER).first()
+        columns = m.TableColumn.query.filter_by(user_id=user.id, table_id=table_id).order_by(m.TableColumn.order_index).all()
+        rows = m.DataRow.query.filter_by(created_by=user.id, table_id=table_id).order_by(m.DataRow.id.desc()).all()
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(["ID", "Ngày tạo"] + [col.name for col in columns])
+        for row in rows:
+            row_data = [row.id, row.created_at.strftime('%d/%m/%Y %H:%M')]
+            for col in columns:
+                cell_value = row.content.get(col.name, '')
+                if isinstance(cell_value, list):
+                    cell_value = "\n".join(cell_value)
+                row_data.append(cell_value)
+            ws.append(row_data)
+        output = io.BytesIO()
+        wb.save(output)
+        return output.getbuffer().nbytes
+
+
+def run_rename(db_url):
+    m = load_app(db_url)
+    client = m.app.test_client()
+    login(client)
+    with m.app.app_context():
+        user = m.User.query.filter_by(username=BENCH_USER).first()
+        table_id = m.AppTable.query.first().id
+        columns = m.TableColumn.query.filter_by(user_id=user.id, table_id=table_id).order_by(m.TableColumn.order_index).all()
+        payload = [{'id': c.id, 'name': c.name, 'order': c.order_index, 'width': c.width} for c in columns]
+
+    # Đường mới: /batch_update_columns đổi tên "Mác thép" -> "Mác thép (mới)"
+    payload[1]['name'] = "Mác thép (mới)"
+    started = time.perf_counter()
+    resp = client.post('/batch_update_columns', json={'table_id': table_id, 'columns': payload})
+    new_seconds = time.perf_counter() - started
+    assert resp.get_json()['status'] == 'success', resp.get_json()
+
+    # Đường cũ: nạp mọi dòng lên Python, sửa dict, UPDATE từng dòng (đổi tên ngược lại)
+    with m.app.app_context():
+        started = time.perf_counter()
+        for row in m.DataRow.query.filter_by(created_by=user.id, table_id=table_id).all():
+            if row.content and "Mác thép (mới)" in row.content:
+                updated = dict(row.content)
+                updated["Mác thép"] = updated.pop("Mác thép (mới)")
+                row.content = updated
+        m.db.session.commit()
+        legacy_seconds = time.perf_counter() - started
+    return {'dialect': db_url.split(':', 1)[0], 'new_seconds': round(new_seconds, 3),
+            'legacy_seconds': round(legacy_seconds, 3)}
+
+
+SEARCH_QUERIES = ["thép cuộn 7", "SAE1011", "G5", "1249", "khong co gi"]
+
+
+def run_search(db_url, repeat=20):
+    m = load_app(db_url)
+    client = m.app.test_client()
+    login(client)
+    with m.app.app_context():
+        user = m.User.query.filter_by(username=BENCH_USER).first()
+        table_id = m.AppTable.query.first().id
+        col_names = m.get_col_names(user.id, table_id)
+
+    results = []
+    for q in SEARCH_QUERIES:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            data = client.get(f'/api/search/{table_id}', query_string={'q': q}).get_json()
+        new_ms = (time.perf_counter() - started) / repeat * 1000
+
+        # Cách cũ: lower(content->cột) LIKE '%q%' trên từng cột JSON, không có index
+        with m.app.app_context():
+            legacy = m.DataRow.query.filter_by(created_by=user.id, table_id=table_id).filter(m.db.or_(*[
+                m.db.func.lower(m.DataRow.content[name].as_string()).contains(q.lower(), autoescape=True)
+                for name in col_names
+            ])).order_by(m.DataRow.sort_key, m.DataRow.id).limit(m.ROW_PAGE_SIZE + 1)
+            started = time.perf_counter()
+            for _ in range(max(1, repeat // 4)):
+                legacy.all()
+            legacy_ms = (time.perf_counter() - started) / max(1, repeat // 4) * 1000
+        results.append({'q': q, 'backend': data['backend'], 'hits_on_page': len(data['rows']),
+                        'search_ms': round(new_ms, 2), 'legacy_ms': round(legacy_ms, 2)})
+    return results
+
+
+def bench_search(sizes):
+    results = []
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = sqlite_url(os.path.join(tmp, 'bench.db'))
+            run_child('_seed', db_url, str(n_rows))
+            for res in run_child('_search', db_url):
+                res['rows'] = n_rows
+                results.append(res)
+                print(f"{n_rows:>9} dòng | {res['backend']:<7} | '{res['q']}' | {res['hits_on_page']:>3} kết quả/trang | "
+                      f"tìm mới {res['search_ms']:>8} ms | cách cũ {res['legacy_ms']:>8} ms")
+    return results
+
+
+def write_import_files(tmp, n_rows):
+    # File Excel + CSV giống file xuất ra: ô nhiều dòng ngăn bằng xuống dòng
+    import openpyxl
+    xlsx_path = os.path.join(tmp, 'import.xlsx')
+    csv_path = os.path.join(tmp, 'import.csv')
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(BENCH_COLUMNS)
+    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(BENCH_COLUMNS)
+        for i in range(n_rows):
+            content = make_content(i)
+            values = ["\n".join(v) if isinstance(v, list) else v for v in (content[name] for name in BENCH_COLUMNS)]
+            values[0] += f" #{i}"  # cho mọi dòng khác nhau, không bị bỏ vì trùng
+            ws.append(values)
+            writer.writerow(values)
+    wb.save(xlsx_path)
+    return xlsx_path, csv_path
+
+
+def run_import(db_url, xlsx_path, csv_path, legacy_rows=1000):
+    m = load_app(db_url)
+    client = m.app.test_client()
+    login(client)
+    with m.app.app_context():
+        table_id = m.AppTable.query.first().id
+        col_ids = [c.id for c in m.get_columns(m.User.query.filter_by(username=BENCH_USER).first().id, table_id)]
+
+    results = []
+    for path in (xlsx_path, csv_path):
+        with open(path, 'rb') as f:
+            started = time.perf_counter()
+            data = client.post(f'/import_rows/{table_id}', data={'file': (f, os.path.basename(path))},
+                               headers={'Accept': 'application/json'}).get_json()
+            seconds = time.perf_counter() - started
+        if data['status'] != 'success':
+            raise RuntimeError(data['message'])
+        with m.app.app_context():
+            m.db.session.execute(m.db.delete(m.DataRow))
+            m.db.session.commit()
+        results.append({'mode': os.path.splitext(path)[1][1:], 'added': data['added'], 'seconds': round(seconds, 3),
+                        'rows_per_sec': round(data['added'] / seconds, 1)})
+
+    # Cách cũ: nhập tay từng dòng qua form save_row (mỗi dòng 1 request + 1 commit)
+    with open(csv_path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        lines = [row for _, row in zip(range(legacy_rows), reader)]
+    started = time.perf_counter()
+    for values in lines:
+        form = {f'field_{col_id}': value for col_id, value in zip(col_ids, values)}
+        client.post('/save_row', data={'table_id': table_id, **form})
+    seconds = time.perf_counter() - started
+    results.append({'mode': 'save_row', 'added': len(lines), 'seconds': round(seconds, 3),
+                    'rows_per_sec': round(len(lines) / seconds, 1)})
+    return results
+
+
+def bench_import(sizes):
+    results = []
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = sqlite_url(os.path.join(tmp, 'bench.db'))
+            run_child('_seed', db_url, '0')
+            xlsx_path, csv_path = write_import_files(tmp, n_rows)
+            for res in run_child('_import', db_url, xlsx_path, csv_path):
+                res['rows'] = n_rows
+                results.append(res)
+                print(f"{n_rows:>9} dòng | {res['mode']:<8} | {res['added']:>9} dòng đã nhập | {res['seconds']:>8}s | "
+                      f"{res['rows_per_sec']:>9} dòng/giây")
+    return results
+
+
+def bench_rename(sizes, database_url=None):
+    results = []
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = database_url or sqlite_url(os.path.join(tmp, 'bench.db'))
+            run_child('_seed', db_url, str(n_rows))
+            res = run_child('_rename', db_url)
+            res['rows'] = n_rows
+            results.append(res)
+            print(f"{n_rows:>9} dòng | {res['dialect']:<10} | đổi tên mới {res['new_seconds']:>7}s | "
+                  f"cách cũ {res['legacy_seconds']:>7}s")
+        if database_url:
+            break
+    return results
+
+
+def report_template_copy(tmp):
+    # File mẫu hiện gộp ô A4:M4 / A5:M5 nên C4, C5 không điền được (cả code cũ lẫn mới đều báo lỗi).
+    # Để đo được tốc độ thì tạo bản sao tạm bỏ 2 vùng gộp đó, file mẫu thật giữ nguyên.
+    import excel_utils
+    src_path = excel_utils.REPORT_TEMPLATE
+    dst_path = os.path.join(tmp, 'mau_bao_cao.xlsx')
+    with zipfile.ZipFile(src_path) as src, zipfile.ZipFile(dst_path, 'w', zipfile.ZIP_DEFLATED) as dst:
+        sheet_path = excel_utils.active_sheet_path({name: src.read(name) for name in src.namelist()})
+        for info in src.infolist():
+            data = src.read(info.filename)
+            if info.filename == sheet_path:
+                data = re.sub(rb'<mergeCell ref="A[45]:M[45]"/>', b'', data)
+            dst.writestr(info, data)
+    return dst_path
+
+
+def time_reports(func, count):
+    started = time.perf_counter()
+    for i in range(count):
+        result, error = func(i)
+        assert error is None, error
+    elapsed = time.perf_counter() - started
+    return {'count': count, 'seconds': round(elapsed, 3), 'reports_per_sec': round(count / elapsed, 1)}
+
+
+def bench_batch_report(days, workers_list):
+    # Báo cáo nhiều ngày: cùng 1 lô PDF, render tuần tự (1 worker) so với pool nhiều process
+    import excel_utils
+    results = {}
+    for workers in workers_list:
+        excel_utils.REPORT_WORKERS = workers
+        reports = [{'date': f'2026-10-{d % 28 + 1:02d}', 'supervisor': f'Ca {d}', 'output': str(d), 'notes': f'w{workers} lần đầu'}
+                   for d in range(days)]
+        started = time.perf_counter()
+        excel_utils.create_batch_report('pdf', reports, 'merged')  # lần đầu: tính cả thời gian khởi động pool
+        warmup = time.perf_counter() - started
+        for report in reports:
+            report['notes'] = f'w{workers} lần hai'  # nội dung khác -> không trúng cache PDF
+        res = time_reports(lambda i: excel_utils.create_batch_report('pdf', reports, 'merged'), 1)
+        res.update({'reports': days, 'reports_per_sec': round(days / res['seconds'], 1), 'first_run_seconds': round(warmup, 3)})
+        results[f'batch_pdf_{workers}_workers'] = res
+        print(f"{days} ngày PDF gộp | {workers:>2} process | {res['seconds']:>7}s | {res['reports_per_sec']:>8} báo cáo/giây "
+              f"(lần đầu {res['first_run_seconds']}s)")
+    return results
+
+
+def bench_report(count):
+    import excel_utils
+    notes = "Lò 1 chạy ổn định\nĐổi ca lúc 14h"
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_utils.REPORT_TEMPLATE = report_template_copy(tmp)
+        excel_utils.create_excel_report('01/10/2026', 'Ca 1', '0', notes)  # nạp + biên dịch mẫu 1 lần
+        results['excel_legacy'] = time_reports(
+            lambda i: excel_utils.create_excel_report_openpyxl(excel_utils.REPORT_TEMPLATE, '01/10/2026', f'Ca {i}', str(i), notes), count)
+        results['excel_compiled'] = time_reports(
+            lambda i: excel_utils.create_excel_report('01/10/2026', f'Ca {i}', str(i), notes), count)
+
+    # PDF: mỗi lần 1 nội dung khác (phải render), và lặp lại cùng nội dung (lấy từ cache)
+    def pdf_uncached(i):
+        try:
+            return excel_utils.render_pdf_report('01/10/2026', f'Ca {i}', str(i), notes), None
+        except RuntimeError as e:
+            return None, str(e)
+    results['pdf_render'] = time_reports(pdf_uncached, count)
+    results['pdf_cached'] = time_reports(
+        lambda i: excel_utils.create_pdf_report('01/10/2026', 'Ca 1', '0', notes), count)
+
+    for name, res in results.items():
+        print(f"{name:<15} | {res['count']:>6} báo cáo | {res['seconds']:>7}s | {res['reports_per_sec']:>8} báo cáo/giây")
+    return results
+
+
+def run_tickets(db_url, count, chunk, workers):
+    # In `count` phiếu ra 1 PDF qua /print_rows; cỡ lô và số process đặt trước khi nạp app (excel_utils đọc lúc import)
+    os.environ['TICKET_PDF_CHUNK'] = str(chunk)
+    os.environ['REPORT_WORKERS'] = str(workers)
+    m = load_app(db_url)
+    with m.app.app_context():
+        table_id = m.AppTable.query.first().id
+        ids = [row_id for (row_id,) in m.db.session.query(m.DataRow.id).order_by(m.DataRow.id).limit(count)]
+    client = m.app.test_client()
+    login(client)
+    base_rss = peak_rss_mb()
+
+    started = time.perf_counter()
+    size = run_job_request(client, f'/print_rows/{table_id}', method='post', json={'ids': ids})
+    elapsed = time.perf_counter() - started
+    return {'seconds': round(elapsed, 2), 'tickets_per_sec': round(count / elapsed, 1), 'bytes': size,
+            'base_rss_mb': base_rss, 'peak_rss_mb': peak_rss_mb()}
+
+
+def bench_tickets(counts, chunks, workers_list):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = sqlite_url(os.path.join(tmp, 'bench.db'))
+        run_child('_seed', db_url, str(max(counts)))
+        for count in counts:
+            for chunk in chunks:
+                for workers in workers_list:
+                    res = run_child('_tickets', db_url, str(count), str(chunk), str(workers))
+                    res.update({'tickets': count, 'chunk': chunk, 'workers': workers})
+                    results.append(res)
+                    print(f"{count:>5} phiếu | lô {chunk:>5} | {workers:>2} process | {res['seconds']:>7}s | "
+                          f"{res['tickets_per_sec']:>6} phiếu/giây | RAM đỉnh {res['peak_rss_mb']:>7} MB "
+                          f"(process chính) | {res['bytes'] // 1024} KB")
+    return results
+
+
+# --- BỘ ĐO TỔNG HỢP (suite) ---
+# Dựng database giả giống xưởng thép (nhiều user, nhiều bảng, nhiều cột, ô nhiều dòng) rồi đo các route chính
+# qua Flask test client: thời gian (min / trung vị / max), số câu SQL, RAM đỉnh. Kết quả ghi JSON để so giữa các lần.
+SUITE_TABLES = ["DATA XƯỞNG THÉP", "LÒ NUNG", "CÁN NGUỘI", "KIỂM TRA CHẤT LƯỢNG", "KHO THÀNH PHẨM", "BẢO TRÌ"]
+SUITE_EXTRA_COLUMNS = ["Ca", "Người đo", "Độ dày (mm)", "Khổ rộng (mm)", "Trọng lượng (kg)", "Số cuộn", "Khách hàng",
+                       "Ghi chú", "Độ cứng HRB", "Độ giãn dài (%)", "Lô sản xuất", "Máy cán"]
+SUITE_SCENARIOS = ['index', 'index_all', 'export_excel', 'backup_json', 'restore_json', 'batch_update_columns',
+                   'generate_report_excel', 'generate_report_pdf', 'stats', 'stats_cold',
+                   'export_excel_cached', 'backup_json_cached']
+
+
+def suite_columns(n_columns):
+    names = (BENCH_COLUMNS + SUITE_EXTRA_COLUMNS)[:n_columns]
+    names += [f"Cột {k}" for k in range(len(names) + 1, n_columns + 1)]
+    return names
+
+
+def suite_cell(rng, name, i, multiline):
+    # Giá trị giống dữ liệu thật; 1 phần ô là list (ô nhiều dòng như nhập tay nhiều dòng)
+    if rng.random() < multiline:
+        return [f"{name} {rng.randint(1, 99)}" for _ in range(rng.randint(2, 4))]
+    if name == "Sản phẩm":
+        return f"Thép cuộn {rng.randint(0, 60)} #{i}"
+    if name == "Mác thép":
+        return f"SAE{1006 + rng.randint(0, 12)}"
+    if name in ("Nhiệt lò nung", "Trọng lượng (kg)", "Số cuộn", "Độ cứng HRB"):
+        return str(rng.randint(50, 1300))
+    if name == "Ghi chú":
+        return rng.choice(["", "Đạt", "Bề mặt rỉ nhẹ", "Cong mép, cần kiểm tra lại", "Giao gấp cho khách"])
+    return f"{name[:3].upper()}-{rng.randint(0, 999)}"
+
+
+def seed_suite(db_url, users, tables, columns, rows, multiline, batch=5000):
+    # Mỗi user có `rows` dòng trong mỗi bảng. User đầu tiên là BENCH_USER (dùng để đo).
+    import random
+    m = load_app(db_url)
+    from werkzeug.security import generate_password_hash
+    rng = random.Random(20261018)  # cố định để các lần đo so được với nhau
+    col_names = suite_columns(columns)
+    password = generate_password_hash(BENCH_PASS)
+    with m.app.app_context():
+        if m.AppTable.query.first() is not None:
+            raise SystemExit("Database đã có dữ liệu - chỉ chạy benchmark trên database trống!")
+        user_objs = [m.User(username=BENCH_USER if u == 0 else f"{BENCH_USER}{u + 1}", password=password) for u in range(users)]
+        table_objs = [m.AppTable(name=SUITE_TABLES[t] if t < len(SUITE_TABLES) else f"BẢNG {t + 1}") for t in range(tables)]
+        m.db.session.add_all(user_objs + table_objs)
+        m.db.session.commit()
+        insert = m.db.insert(m.DataRow)
+        for user in user_objs:
+            for table in table_objs:
+                m.db.session.add_all([m.TableColumn(name=name, order_index=idx, user_id=user.id, table_id=table.id)
+                                      for idx, name in enumerate(col_names)])
+                for start in range(0, rows, batch):
+                    values = []
+                    for i in range(start, min(start + batch, rows)):
+                        content = {name: suite_cell(rng, name, i, multiline) for name in col_names}
+                        values.append({'content': content, 'created_by': user.id, 'table_id': table.id,
+                                       **m.build_row_keys(content, col_names)})
+                    m.db.session.execute(insert, values)
+                m.db.session.commit()
+    return {'users': users, 'tables': tables, 'columns': columns, 'rows_per_table': rows,
+            'total_rows': users * tables * rows}
+
+
+def fetch_job_file(client, url, method='get', **kwargs):
+    # Như run_job_request nhưng trả về nội dung file (cần cho restore)
+    resp = getattr(client, method)(url, headers={'Accept': 'application/json'}, **kwargs)
+    job = resp.get_json()['job']
+    if job['state'] != 'done':
+        raise RuntimeError(job.get('error') or job['state'])
+    resp = client.get(job['download_url'])
+    data = b''.join(resp.response)
+    resp.close()
+    return data
+
+
+def run_suite_scenario(db_url, scenario, repeat):
+    # Chạy trong process riêng: RAM đỉnh là của riêng kịch bản này. Job chạy luôn trong request (JOB_WORKERS=0)
+    # để thời gian và số câu SQL gồm cả phần việc nặng.
+    os.environ['JOB_WORKERS'] = '0'
+    m = load_app(db_url)
+    import excel_utils
+    from werkzeug.security import generate_password_hash
+    client = m.app.test_client()
+    login(client)
+    with m.app.app_context():
+        user = m.User.query.filter_by(username=BENCH_USER).first()
+        table_id = m.AppTable.query.order_by(m.AppTable.id).first().id
+        columns = m.TableColumn.query.filter_by(user_id=user.id, table_id=table_id).order_by(m.TableColumn.order_index).all()
+        col_payload = [{'id': c.id, 'name': c.name, 'order': c.order_index, 'width': c.width} for c in columns]
+        # Cột Mác thép (cột thứ 2 lúc dựng dữ liệu) tìm theo id: kịch bản khác có đổi tên / thứ tự cột thì vẫn đúng cột
+        grade_column = sorted(columns, key=lambda c: c.id)[1].name
+
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+    with m.app.app_context():
+        m.event.listen(m.db.engine, 'after_cursor_execute', count_query)
+
+    tmp = tempfile.mkdtemp()
+    excel_utils.REPORT_TEMPLATE = report_template_copy(tmp)
+    backup = fetch_job_file(client, '/backup_json') if scenario == 'restore_json' else None
+
+    def step(k):
+        # 1 lần chạy kịch bản, trả về số byte nhận được
+        if scenario == 'index':
+            return len(client.get(f'/table/{table_id}').data)
+        if scenario == 'index_all':
+            return len(client.get(f'/table/{table_id}?view=all').data)
+        if scenario == 'export_excel':
+            return run_job_request(client, f'/export_excel/{table_id}')
+        if scenario == 'backup_json':
+            return run_job_request(client, '/backup_json')
+        if scenario in ('export_excel_cached', 'backup_json_cached'):
+            # Tải lại khi dữ liệu chưa đổi: trình duyệt nhận luôn file trong cache, không qua job
+            url = f'/export_excel/{table_id}' if scenario == 'export_excel_cached' else '/backup_json'
+            resp = client.get(url)
+            assert resp.status_code == 200, resp.status_code
+            size = sum(len(chunk) for chunk in resp.response)
+            resp.close()
+            return size
+        if scenario == 'restore_json':
+            # Mỗi lần khôi phục vào 1 user trống mới, để không bị bỏ qua vì trùng
+            with m.app.app_context():
+                m.db.session.add(m.User(username=f'restore{k}', password=generate_password_hash(BENCH_PASS)))
+                m.db.session.commit()
+            restore_client = m.app.test_client()
+            restore_client.post('/login', data={'username': f'restore{k}', 'password': BENCH_PASS})
+            queries[0] = 0  # không tính phần tạo user / đăng nhập
+            resp = restore_client.post('/restore_json', data={'file': (io.BytesIO(backup), 'backup.json')})
+            assert resp.status_code == 302, resp.status_code
+            return len(backup)
+        if scenario == 'batch_update_columns':
+            # Đổi tên 1 cột + đảo thứ tự 2 cột đầu (phải tính lại sort_key mọi dòng)
+            payload = [dict(c) for c in col_payload]
+            payload[1]['name'] = col_payload[1]['name'] + (' *' if k % 2 == 0 else '')
+            if k % 2 == 0:
+                payload[0]['order'], payload[1]['order'] = payload[1]['order'], payload[0]['order']
+            data = client.post('/batch_update_columns', json={'table_id': table_id, 'columns': payload}).get_json()
+            assert data['status'] == 'success', data
+            return 0
+        if scenario in ('stats', 'stats_cold'):
+            # Thống kê mọi cột số + gom theo cột Mác thép; stats_cold bỏ mảng đã rút để đo cả lượt rút số từ các dòng
+            if scenario == 'stats_cold':
+                m.table_arrays_cache.clear()
+            data = client.get(f'/api/stats/{table_id}', query_string={'group_by': grade_column}).get_json()
+            assert data['status'] == 'success', data
+            return len(json.dumps(data))
+        action = 'excel' if scenario == 'generate_report_excel' else 'pdf'
+        return run_job_request(client, '/generate_report', method='post', data={
+            'report_date': '2026-10-18', 'supervisor': f'Ca {k}', 'total_output': str(100 + k),
+            'notes': f'Lần đo {k}\nLò 2 dừng 15 phút', 'action_type': action})
+
+    if scenario in ('export_excel_cached', 'backup_json_cached'):
+        # Cache trống thì route trả job (302 / 202), chạy job 1 lần cho có file trong cache trước khi đo
+        run_job_request(client, f'/export_excel/{table_id}' if scenario == 'export_excel_cached' else '/backup_json')
+    step(-1)  # chạy nháp 1 lần: nạp template, cache cột, kết nối database
+    if scenario == 'batch_update_columns':
+        step(-1)  # lần nháp đổi tên lẻ -> đưa cột về tên gốc
+    base_rss = peak_rss_mb()
+    timings, counts, size = [], [], 0
+    for k in range(repeat):
+        queries[0] = 0
+        if scenario in ('export_excel', 'backup_json'):
+            m.file_cache.clear()  # đo lần tạo file thật, không phải lần lấy lại từ cache
+        started = time.perf_counter()
+        size = step(k)
+        timings.append((time.perf_counter() - started) * 1000)
+        counts.append(queries[0])
+    if scenario == 'batch_update_columns':
+        # Số lần đo lẻ thì cột còn mang tên đổi / thứ tự đảo: trả lại như cũ cho các kịch bản chạy sau trên cùng database
+        data = client.post('/batch_update_columns', json={'table_id': table_id, 'columns': col_payload}).get_json()
+        assert data['status'] == 'success', data
+    shutil.rmtree(tmp, ignore_errors=True)
+    timings.sort()
+    return {'scenario': scenario, 'repeat': repeat,
+            'min_ms': round(timings[0], 1), 'median_ms': round(timings[len(timings) // 2], 1), 'max_ms': round(timings[-1], 1),
+            'queries': round(sum(counts) / len(counts), 1), 'bytes': size,
+            'base_rss_mb': base_rss, 'peak_rss_mb': peak_rss_mb()}
+
+
+def compare_suite(results, baseline_path):
+    # So với file kết quả lần trước: in % thay đổi của thời gian trung vị và số câu SQL
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {res['scenario']: res for res in json.load(f)['results']}
+    print(f"\nSo với {baseline_path}:")
+    for res in results:
+        old = baseline.get(res['scenario'])
+        if not old:
+            continue
+        change = (res['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+        flag = '  <-- CHẬM HƠN' if change > 20 else ''
+        print(f"{res['scenario']:<22} | {old['median_ms']:>9} -> {res['median_ms']:>9} ms ({change:+6.1f}%) | "
+              f"SQL {old['queries']} -> {res['queries']}{flag}")
+
+
+def bench_suite(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = args.database_url or sqlite_url(os.path.join(tmp, 'bench.db'))
+        started = time.perf_counter()
+        dataset = run_child('_seed_suite', db_url, str(args.users), str(args.tables), str(args.columns),
+                            str(args.rows), str(args.multiline))
+        dataset['seed_seconds'] = round(time.perf_counter() - started, 1)
+        print(f"Dữ liệu: {args.users} user x {args.tables} bảng x {args.rows} dòng, {args.columns} cột "
+              f"({dataset['total_rows']} dòng, dựng trong {dataset['seed_seconds']}s)")
+        results = []
+        for scenario in args.scenarios:
+            res = run_child('_suite', db_url, scenario, str(args.repeat))
+            results.append(res)
+            print(f"{scenario:<22} | trung vị {res['median_ms']:>9} ms (min {res['min_ms']}, max {res['max_ms']}) | "
+                  f"{res['queries']:>7} câu SQL | RAM đỉnh {res['peak_rss_mb']:>7} MB | {res['bytes'] // 1024} KB")
+    if args.compare:
+        compare_suite(results, args.compare)
+    return {'dataset': dataset, 'dialect': db_url.split(':', 1)[0], 'python': sys.version.split()[0],
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+
+
+# --- TẢI ĐỒNG THỜI (load) ---
+# Chạy gunicorn thật (gunicorn.conf.py) trên database giả, N người dùng cùng mở trang chính liên tục (mỗi người 1 kết nối keep-alive,
+# không nghỉ giữa 2 lần trừ khi có --think-ms). Đo số request/giây và độ trễ p50/p95/p99, so cấu hình cũ (1 process sync)
+# với gthread, có / không nén. Máy đo và server chạy chung CPU nên con số chỉ để so giữa các cấu hình với nhau.
+HERE = os.path.dirname(os.path.abspath(__file__))
+LOAD_ENCODINGS = {'off': None, 'on': 'br, gzip'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_url, job_dir, config, workers, threads, compress):
+    # config 'sync' = Procfile cũ (gunicorn app:app: 1 process, mỗi lúc 1 request); 'gthread' / 'gevent' = gunicorn.conf.py
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=db_url, JOB_DIR=job_dir, GUNICORN_BIND=f'127.0.0.1:{port}', WEB_WORKER_CLASS=config,
+               WEB_CONCURRENCY=str(1 if config == 'sync' else workers), WEB_THREADS=str(threads), COMPRESS='1' if compress else '0')
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(HERE, 'gunicorn.conf.py'), 'app:app'],
+                            cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("gunicorn không chạy được (đã cài chưa? pip install gunicorn)")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/login')
+            ready = conn.getresponse().status == 200
+            conn.close()
+            if ready:
+                return proc, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("gunicorn khởi động quá lâu")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def login_session(conn, username):
+    body = urllib.parse.urlencode({'username': username, 'password': BENCH_PASS})
+    conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    resp = conn.getresponse()
+    resp.read()
+    cookies = [c.split(';', 1)[0] for c in resp.msg.get_all('Set-Cookie') or [] if c.startswith('session=')]
+    if resp.status != 302 or not cookies:
+        raise RuntimeError(f"Đăng nhập {username} không được (mã {resp.status})")
+    headers = {'Cookie': cookies[-1]}
+    conn.request('GET', '/', headers=headers)  # trang chính chuyển sang bảng đầu tiên
+    resp = conn.getresponse()
+    resp.read()
+    return headers, urllib.parse.urlsplit(resp.getheader('Location') or '/table/1').path
+
+
+def load_user(port, username, encoding, think, start, stop, samples, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers, path = login_session(conn, username)
+    if encoding:
+        headers['Accept-Encoding'] = encoding
+    start.wait()
+    while not stop.is_set():
+        started = time.perf_counter()
+        ok = False
+        for attempt in range(2):
+            try:
+                conn.request('GET', path, headers=headers)
+                resp = conn.getresponse()
+                size = len(resp.read())
+                ok = resp.status == 200
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                # Server đóng kết nối keep-alive đúng lúc mình gửi: gửi lại 1 lần như trình duyệt
+                if not isinstance(e, http.client.RemoteDisconnected):
+                    break
+        if stop.is_set():
+            break  # request vắt qua lúc hết giờ không tính
+        if ok:
+            samples.append((time.perf_counter() - started, size))
+        else:
+            errors.append(1)
+        if think:
+            time.sleep(think / 1000)
+    conn.close()
+
+
+def run_load(port, users, accounts, duration, encoding, think):
+    samples, errors = [], []
+    start, stop = threading.Barrier(users + 1), threading.Event()
+    names = [BENCH_USER if k % accounts == 0 else f"{BENCH_USER}{k % accounts + 1}" for k in range(users)]
+    workers = [threading.Thread(target=load_user, args=(port, name, encoding, think, start, stop, samples, errors), daemon=True)
+               for name in names]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join(timeout=60)
+    latencies = sorted(t for t, _ in samples)
+
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+    return {'requests': len(samples), 'errors': len(errors), 'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': pct(0.50), 'p95_ms': pct(0.95), 'p99_ms': pct(0.99),
+            'page_kb': round(sum(size for _, size in samples) / max(len(samples), 1) / 1024, 1)}
+
+
+def bench_load(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = args.database_url or sqlite_url(os.path.join(tmp, 'bench.db'))
+        run_child('_seed_suite', db_url, str(args.accounts), str(args.tables), str(args.columns), str(args.rows), '0.15')
+        print(f"{args.users} người dùng ({args.accounts} tài khoản) mở trang chính liên tục trong {args.duration}s, "
+              f"bảng {args.rows} dòng x {args.columns} cột")
+        for config in args.configs:
+            for compress in args.compress:
+                proc, port = start_server(db_url, os.path.join(tmp, 'jobs'), config, args.workers, args.threads, compress == 'on')
+                try:
+                    res = run_load(port, args.users, args.accounts, args.duration, LOAD_ENCODINGS[compress], args.think_ms)
+                finally:
+                    stop_server(proc)
+                workers = 1 if config == 'sync' else args.workers
+                res.update({'config': config, 'workers': workers, 'threads': args.threads if config == 'gthread' else 1,
+                            'compress': compress})
+                results.append(res)
+                print(f"{config:<8} {workers} process x {res['threads']:>2} thread | nén {compress:<3} | {res['rps']:>7} request/giây | "
+                      f"p50 {res['p50_ms']:>7} ms | p95 {res['p95_ms']:>7} ms | p99 {res['p99_ms']:>7} ms | "
+                      f"{res['page_kb']:>6} KB/trang | {res['errors']} lỗi")
+    return results
+
+
+HEAVY_MODULES = ('openpyxl', 'xhtml2pdf', 'reportlab', 'pypdf', 'html5lib')
+
+
+def run_startup(db_url):
+    # Process mới tinh: thời gian import app.py, request đầu tiên, và thư viện nặng nào đã bị nạp sẵn
+    started = time.perf_counter()
+    m = load_app(db_url)
+    imported = time.perf_counter() - started
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    client = m.app.test_client()
+    started = time.perf_counter()
+    client.get('/login')
+    first_request = time.perf_counter() - started
+    return {'import_seconds': round(imported, 3), 'app_startup_seconds': round(m.STARTUP_SECONDS, 3),
+            'first_request_ms': round(first_request * 1000, 1), 'heavy_modules': heavy, 'peak_rss_mb': peak_rss_mb()}
+
+
+def bench_startup(repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = sqlite_url(os.path.join(tmp, 'bench.db'))
+        run_child('_seed', db_url, '1000')  # lần đầu: tạo + nâng cấp database, không tính
+        for k in range(repeat):
+            started = time.perf_counter()
+            res = run_child('_startup', db_url)
+            res['process_seconds'] = round(time.perf_counter() - started, 3)  # gồm cả khởi động Python
+            results.append(res)
+            print(f"lần {k + 1}: import app {res['import_seconds']:>6}s | cả process {res['process_seconds']:>6}s | "
+                  f"request đầu {res['first_request_ms']:>7} ms | RAM {res['peak_rss_mb']:>6} MB | "
+                  f"thư viện nặng đã nạp: {', '.join(res['heavy_modules']) or 'không'}")
+    imports = sorted(res['import_seconds'] for res in results)
+    print(f"Trung vị import app: {imports[len(imports) // 2]}s")
+    return results
+
+
+def run_child(*args):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), *args],
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_export(sizes, modes):
+    results = []
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = sqlite_url(os.path.join(tmp, 'bench.db'))
+            run_child('_seed', db_url, str(n_rows))
+            for mode in modes:
+                res = run_child('_export', db_url, mode)
+                res['rows'] = n_rows
+                results.append(res)
+                print(f"{n_rows:>9} dòng | {mode:<7} | {res['seconds']:>7}s | RAM đỉnh {res['peak_rss_mb']:>8} MB "
+                      f"(lúc khởi động {res['base_rss_mb']} MB) | {res['bytes'] // 1024} KB")
+    return results
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '_seed':
+        seed(sys.argv[2], int(sys.argv[3]))
+        print(json.dumps({'ok': True}))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_export':
+        print(json.dumps(run_export(sys.argv[2], sys.argv[3])))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_search':
+        print(json.dumps(run_search(sys.argv[2])))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_import':
+        print(json.dumps(run_import(sys.argv[2], sys.argv[3], sys.argv[4])))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_rename':
+        print(json.dumps(run_rename(sys.argv[2])))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_tickets':
+        print(json.dumps(run_tickets(sys.argv[2], *map(int, sys.argv[3:6]))))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_startup':
+        print(json.dumps(run_startup(sys.argv[2])))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_seed_suite':
+        print(json.dumps(seed_suite(sys.argv[2], *map(int, sys.argv[3:7]), float(sys.argv[7]))))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '_suite':
+        print(json.dumps(run_suite_scenario(sys.argv[2], sys.argv[3], int(sys.argv[4]))))
+        return
+
+    parser = argparse.ArgumentParser(description="Đo hiệu năng web xưởng thép")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_export = sub.add_parser('export', help="Xuất Excel: thời gian và RAM đỉnh")
+    p_export.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    p_export.add_argument('--modes', nargs='+', default=['stream', 'legacy'], choices=['stream', 'legacy'])
+    p_export.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_rename = sub.add_parser('rename', help="Đổi tên cột: UPDATE 1 câu so với sửa từng dòng")
+    p_rename.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    p_rename.add_argument('--database-url', help="Postgres TRỐNG để đo (mặc định: SQLite tạm)")
+    p_rename.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_search = sub.add_parser('search', help="Tìm kiếm phía server (index) so với lọc JSON từng cột")
+    p_search.add_argument('--rows', type=int, nargs='+', default=[100000])
+    p_search.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_import = sub.add_parser('import', help="Nhập Excel/CSV theo lô so với nhập từng dòng qua save_row")
+    p_import.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    p_import.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_report = sub.add_parser('report', help="Báo cáo Excel/PDF: số báo cáo mỗi giây trước và sau khi dùng mẫu biên dịch sẵn")
+    p_report.add_argument('--count', type=int, default=200)
+    p_report.add_argument('--days', type=int, default=31, help="Số ngày cho phép đo báo cáo nhiều ngày")
+    p_report.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    p_report.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_tickets = sub.add_parser('tickets', help="In nhiều phiếu ra 1 PDF: thời gian và RAM đỉnh theo cỡ lô / số process")
+    p_tickets.add_argument('--count', type=int, nargs='+', default=[500, 1000])
+    p_tickets.add_argument('--chunk', type=int, nargs='+', default=[50, 1000], help="Số phiếu mỗi lô render (TICKET_PDF_CHUNK)")
+    p_tickets.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    p_tickets.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_suite = sub.add_parser('suite', help="Dựng dữ liệu giả rồi đo các route chính (thời gian, số câu SQL, RAM đỉnh)")
+    p_suite.add_argument('--users', type=int, default=3)
+    p_suite.add_argument('--tables', type=int, default=2)
+    p_suite.add_argument('--columns', type=int, default=8)
+    p_suite.add_argument('--rows', type=int, default=5000, help="Số dòng mỗi user trong mỗi bảng")
+    p_suite.add_argument('--multiline', type=float, default=0.15, help="Tỉ lệ ô nhiều dòng (list)")
+    p_suite.add_argument('--repeat', type=int, default=3)
+    p_suite.add_argument('--scenarios', nargs='+', default=SUITE_SCENARIOS, choices=SUITE_SCENARIOS)
+    p_suite.add_argument('--database-url', help="Postgres TRỐNG để đo (mặc định: SQLite tạm)")
+    p_suite.add_argument('--compare', help="File JSON kết quả lần trước để so sánh")
+    p_suite.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_load = sub.add_parser('load', help="Nhiều người cùng mở trang chính trên gunicorn thật: request/giây, p95")
+    p_load.add_argument('--users', type=int, default=50, help="Số người dùng đồng thời")
+    p_load.add_argument('--accounts', type=int, default=5, help="Số tài khoản (người dùng chia đều)")
+    p_load.add_argument('--duration', type=float, default=20, help="Số giây đo mỗi cấu hình")
+    p_load.add_argument('--think-ms', type=float, default=0, help="Nghỉ giữa 2 lần mở trang của 1 người")
+    p_load.add_argument('--configs', nargs='+', default=['sync', 'gthread'], choices=['sync', 'gthread', 'gevent'])
+    p_load.add_argument('--compress', nargs='+', default=['off', 'on'], choices=['off', 'on'])
+    p_load.add_argument('--workers', type=int, default=2, help="Số process gunicorn (gthread / gevent)")
+    p_load.add_argument('--threads', type=int, default=8, help="Số thread mỗi process (gthread)")
+    p_load.add_argument('--tables', type=int, default=2)
+    p_load.add_argument('--columns', type=int, default=8)
+    p_load.add_argument('--rows', type=int, default=500, help="Số dòng mỗi tài khoản trong mỗi bảng")
+    p_load.add_argument('--database-url', help="Postgres TRỐNG để đo (mặc định: SQLite tạm)")
+    p_load.add_argument('--out', help="Ghi kết quả ra file JSON")
+    p_startup = sub.add_parser('startup', help="Thời gian khởi động process (import app + request đầu tiên)")
+    p_startup.add_argument('--repeat', type=int, default=5)
+    p_startup.add_argument('--out', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        results = bench_export(args.rows, args.modes)
+    elif args.command == 'rename':
+        results = bench_rename(args.rows, args.database_url)
+    elif args.command == 'search':
+        results = bench_search(args.rows)
+    elif args.command == 'import':
+        results = bench_import(args.rows)
+    elif args.command == 'report':
+        results = bench_report(args.count)
+        results.update(bench_batch_report(args.days, sorted(set(args.workers))))
+    elif args.command == 'tickets':
+        results = bench_tickets(args.count, args.chunk, sorted(set(args.workers)))
+    elif args.command == 'startup':
+        results = bench_startup(args.repeat)
+    elif args.command == 'load':
+        results = bench_load(args)
+    elif args.command == 'suite':
+        results = bench_suite(args)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
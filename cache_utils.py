@@ -0,0 +1,198 @@
+# File: cache_utils.py
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+# Cache LRU trong 1 process: mỗi key sống tối đa `ttl` giây, đầy thì bỏ key lâu không dùng nhất.
+# Dùng được từ nhiều thread cùng lúc (gunicorn gthread).
+# Mỗi lần invalidate/clear tăng số thế hệ: giá trị đang nạp dở mà có invalidate chen vào giữa (đọc database trước lúc
+# đổi tên cột chẳng hạn) thì vẫn trả cho người gọi nhưng không cất vào cache, không bị dùng lại suốt ttl giây.
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        # Có trong cache và chưa hết hạn thì trả luôn, không thì gọi loader() rồi lưu lại
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, key=_MISSING, match=None):
+        # invalidate(key) xóa 1 key; invalidate(match=hàm) xóa mọi key mà hàm trả True
+        with self._lock:
+            self._generation += 1
+            if key is not _MISSING:
+                self._data.pop(key, None)
+            if match is not None:
+                for k in [k for k in self._data if match(k)]:
+                    del self._data[k]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+# Cache file kết quả (xuất Excel, backup, báo cáo) trên đĩa, giới hạn theo TỔNG dung lượng; đầy thì bỏ file lâu không dùng nhất.
+# Tên file = "<nhóm>.<mã băm của khóa>": khóa gồm mọi thứ quyết định nội dung (loại file, user, bảng, phiên bản dữ liệu, tham số)
+# nên cùng khóa là cùng nội dung, mã băm dùng luôn làm ETag. Nhóm (vd "u3_t5") để xóa cả loạt khi dữ liệu bảng đổi.
+# Không giữ danh sách trong RAM (lúc nào cũng xem thư mục) nên nhiều process dùng chung 1 thư mục được.
+# Lần dùng gần nhất ghi vào atime của file (đặt bằng os.utime, không phụ thuộc mount noatime), mtime = lúc tạo file.
+class FileCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def digest(key):
+        raw = json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    def path(self, group, digest):
+        return os.path.join(self.directory, f'{group}.{digest}')
+
+    def get(self, group, digest):
+        # Trả về đường dẫn file nếu có (và đánh dấu vừa dùng), không có thì None
+        if not self.enabled:
+            return None
+        path = self.path(group, digest)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, group, digest, src_path):
+        # Cất 1 bản của src_path (hard link nếu được, không thì chép) rồi dọn bớt nếu quá dung lượng
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(group, digest)
+        tmp = os.path.join(self.directory, f'.tmp-{uuid.uuid4().hex}')
+        try:
+            try:
+                os.link(src_path, tmp)
+            except OSError:
+                shutil.copyfile(src_path, tmp)
+            os.replace(tmp, path)  # process khác đang đọc bản cũ (cùng nội dung) vẫn đọc tiếp được
+        except OSError:
+            self._remove(tmp)
+            return None
+        with self._lock:
+            self.stores += 1
+        self.evict()
+        return path
+
+    def entries(self):
+        # (nhóm, đường dẫn, stat) của mọi file trong cache, bỏ file tạm đang ghi dở
+        try:
+            items = list(os.scandir(self.directory))
+        except OSError:
+            return []
+        result = []
+        for item in items:
+            if item.name.startswith('.') or '.' not in item.name:
+                continue
+            try:
+                result.append((item.name.rsplit('.', 1)[0], item.path, item.stat()))
+            except OSError:
+                pass  # process khác vừa xóa
+        return result
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(st.st_size for _, _, st in entries)
+        for _, path, st in sorted(entries, key=lambda entry: entry[2].st_atime):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= st.st_size
+            with self._lock:
+                self.evictions += 1
+
+    def invalidate(self, match):
+        # Xóa mọi file có nhóm mà match(nhóm) trả True
+        for group, path, _ in self.entries():
+            if match(group):
+                self._remove(path)
+
+    def clear(self):
+        self.invalidate(lambda group: True)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        entries = self.entries()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'files': len(entries),
+                'bytes': sum(st.st_size for _, _, st in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
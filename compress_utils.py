@@ -0,0 +1,52 @@
+# File: compress_utils.py
+import zlib
+
+# Nén response chữ (HTML, JSON...) theo Accept-Encoding của trình duyệt: brotli nếu có cài thư viện Brotli, không thì gzip.
+# Ảnh, Excel, PDF, zip đã nén sẵn nên không nén lại.
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/json', 'application/x-ndjson', 'application/javascript',
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # mức 4: nhỏ hơn gzip 6 khoảng 40% mà nén nhanh hơn, hợp với trang tạo mỗi request (mức 11 chậm hàng chục lần)
+
+_brotli = False  # chưa thử import
+
+def brotli_module():
+    # Brotli là thư viện tùy chọn: thiếu thì chỉ nén gzip
+    global _brotli
+    if _brotli is False:
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        _brotli = brotli
+    return _brotli
+
+def choose_encoding(accept_encodings):
+    # accept_encodings: request.accept_encodings của werkzeug (trả về độ ưu tiên q, 0 = không nhận)
+    if brotli_module() is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_bytes(data, encoding):
+    if encoding == 'br':
+        return brotli_module().compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, encoding):
+    # Nén dần từng khối (file backup lớn, response stream): không phải giữ cả nội dung trong RAM
+    if encoding == 'br':
+        compressor = brotli_module().Compressor(quality=BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
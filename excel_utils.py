@@ -1,145 +1,540 @@
 # File: excel_utils.py
 import os
 import io
-from openpyxl import load_workbook
-from xhtml2pdf import pisa 
+import re
+import atexit
+import html
+import zipfile
+import tempfile
+import threading
+import posixpath
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape as xml_escape
+from cache_utils import TTLCache
+from metrics_utils import metrics
 
-# 1. HÀM TẠO EXCEL (Giữ nguyên)
-def create_excel_report(date, supervisor, output, notes):
-    filename = 'mau_bao_cao.xlsx'
+# openpyxl, xhtml2pdf (kéo theo reportlab, html5lib, pyhanko...), pypdf import ngay trong hàm dùng tới:
+# process khởi động nhanh, chỉ request xuất file đầu tiên mới phải nạp
+
+REPORT_TEMPLATE = 'mau_bao_cao.xlsx'
+# Ô cần điền trong file mẫu, theo thứ tự tham số: ngày, người phụ trách, sản lượng, ghi chú
+REPORT_CELLS = ('A5', 'C4', 'C5', 'B8')
+
+# 1. HÀM TẠO EXCEL
+# File mẫu được đọc và "biên dịch" 1 lần mỗi process: giữ sẵn các file trong gói .xlsx và
+# cắt XML của sheet thành từng đoạn quanh các ô cần điền. Mỗi lần xuất chỉ việc ghép chuỗi
+# rồi nén lại, không phải parse lại cả workbook bằng openpyxl. Sửa file mẫu (mtime đổi) thì tự nạp lại.
+_template_lock = threading.Lock()
+_template_cache = {}
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def load_report_template(filename=REPORT_TEMPLATE):
+    mtime = os.stat(filename).st_mtime_ns
+    with _template_lock:
+        template = _template_cache.get(filename)
+        if template is None or template['mtime'] != mtime:
+            template = compile_report_template(filename, mtime)
+            _template_cache[filename] = template
+        return template
+
+def compile_report_template(filename, mtime=None):
+    from openpyxl.utils.cell import range_boundaries, coordinate_to_tuple
+    with zipfile.ZipFile(filename) as zf:
+        entries = [(info, zf.read(info)) for info in zf.infolist()]
+    files = {info.filename: data for info, data in entries}
+    sheet_path = active_sheet_path(files)
+    sheet_xml = files[sheet_path].decode('utf-8')
+
+    # Ô nằm giữa vùng gộp (không phải ô đầu) thì Excel không hiện được -> báo lỗi như openpyxl
+    for merged in re.findall(r'<mergeCell ref="([A-Z]+[0-9]+:[A-Z]+[0-9]+)"', sheet_xml):
+        min_col, min_row, max_col, max_row = range_boundaries(merged)
+        for ref in REPORT_CELLS:
+            row, col = coordinate_to_tuple(ref)
+            if min_row <= row <= max_row and min_col <= col <= max_col and (row, col) != (min_row, min_col):
+                return {'mtime': mtime, 'error': f"Ô {ref} nằm trong vùng gộp {merged} của file mẫu, không điền được"}
+
+    found = []
+    for ref in REPORT_CELLS:
+        match = re.search(r'<c r="%s"(?P<attrs>[^>]*?)(?:/>|>.*?</c>)' % ref, sheet_xml, re.S)
+        if not match:
+            # Ô không có sẵn trong XML -> dùng cách openpyxl cho chắc
+            return {'mtime': mtime, 'parts': None, 'error': None}
+        attrs = re.sub(r'\s+t="[^"]*"', '', match.group('attrs')).rstrip()
+        found.append((match.start(), match.end(), ref, attrs))
+
+    parts = []
+    pos = 0
+    for start, end, ref, attrs in sorted(found):
+        parts.append(sheet_xml[pos:start])
+        parts.append((ref, attrs))
+        pos = end
+    parts.append(sheet_xml[pos:])
+    template = {'mtime': mtime, 'entries': entries, 'sheet_path': sheet_path, 'parts': parts, 'error': None}
+    error = check_report_template(filename, template)
+    if error:
+        return {'mtime': mtime, 'error': error}
+    return template
+
+def check_report_template(filename, template):
+    # Cắt ghép XML bằng regex dễ lệch khi file mẫu được lưu lại kiểu khác, nên lúc nạp mẫu điền thử rồi mở lại bằng openpyxl:
+    # 4 ô điền phải đọc ra đúng giá trị, mọi ô khác giữ nguyên như file mẫu. Lệch thì báo lỗi ngay, không xuất file sai.
+    from openpyxl import load_workbook
+    probe = {ref: f'__{ref}__' for ref in REPORT_CELLS}
+    filled = load_workbook(write_report_package(template, fill_report_sheet(template, *probe.values()))).active
+    expected = dict(sheet_values(load_workbook(filename).active), **probe)
+    wrong = sorted(ref for ref in expected.keys() | sheet_values(filled).keys() if filled[ref].value != expected.get(ref))
+    if wrong:
+        return f"Điền thử file mẫu bị sai ô {', '.join(wrong[:10])}, kiểm tra lại file mẫu"
+    return None
+
+def sheet_values(ws):
+    return {cell.coordinate: cell.value for row in ws.iter_rows() for cell in row if cell.value is not None}
+
+def active_sheet_path(files):
+    ns = {'m': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+    rel_ns = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+    workbook = ET.fromstring(files['xl/workbook.xml'])
+    view = workbook.find('m:bookViews/m:workbookView', ns)
+    active = int(view.get('activeTab', 0)) if view is not None else 0
+    sheet = workbook.findall('m:sheets/m:sheet', ns)[active]
+    rels = ET.fromstring(files['xl/_rels/workbook.xml.rels'])
+    target = next(rel.get('Target') for rel in rels if rel.get('Id') == sheet.get(rel_ns))
+    return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+
+def render_cell(ref, attrs, value):
+    if value is None or value == '':
+        return f'<c r="{ref}"{attrs}/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"{attrs}><v>{value}</v></c>'
+    text = xml_escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c r="{ref}"{attrs} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+@metrics.timer('report_render_seconds', kind='excel')
+def create_excel_report(date, supervisor, output, notes, filename=None):
+    filename = filename or REPORT_TEMPLATE
     if not os.path.exists(filename):
         return None, "Lỗi: Không tìm thấy file mẫu 'mau_bao_cao.xlsx'!"
     try:
-        wb = load_workbook(filename)
-        ws = wb.active
+        template = load_report_template(filename)
+        if template['error']:
+            return None, f"Lỗi Excel: {template['error']}"
+        if template['parts'] is None:
+            return create_excel_report_openpyxl(filename, date, supervisor, output, notes)
+
+        return write_report_package(template, fill_report_sheet(template, date, supervisor, output, notes)), None
+    except Exception as e:
+        return None, f"Lỗi Excel: {str(e)}"
+
+def write_report_package(template, sheet_xml):
+    output_stream = io.BytesIO()
+    with zipfile.ZipFile(output_stream, 'w') as zf:
+        for info, data in template['entries']:
+            if info.filename == template['sheet_path']:
+                data = sheet_xml.encode('utf-8')
+            zf.writestr(info, data)
+    output_stream.seek(0)
+    return output_stream
+
+def fill_report_sheet(template, date, supervisor, output, notes):
+    values = dict(zip(REPORT_CELLS, (date, supervisor, output, notes)))
+    return ''.join(
+        part if isinstance(part, str) else render_cell(part[0], part[1], values[part[0]])
+        for part in template['parts']
+    )
+
+def create_excel_report_openpyxl(filename, date, supervisor, output, notes):
+    from openpyxl import load_workbook
+    wb = load_workbook(filename)
+    ws = wb.active
+    
+    # Điền dữ liệu
+    ws['A5'] = date
+    ws['C4'] = supervisor
+    ws['C5'] = output
+    ws['B8'] = notes
+    
+    output_stream = io.BytesIO()
+    wb.save(output_stream)
+    output_stream.seek(0)
+    return output_stream, None
+
+# 2. HÀM TẠO PDF (Đã sửa giao diện giống Excel)
+# Khung HTML + CSS dựng sẵn 1 lần; mỗi lần chỉ điền 4 giá trị (đã escape).
+# Anh có thể chỉnh sửa độ rộng (width), chiều cao (height) ở đây
+PDF_REPORT_HTML = """
+<html>
+<head>
+    <style>
+        body {{ 
+            font-family: Arial, sans-serif; 
+            padding: 40px; 
+            font-size: 14px;
+        }}
+        /* Tiêu đề báo cáo */
+        h1 {{ 
+            text-align: center; 
+            text-transform: uppercase; 
+            margin-bottom: 30px;
+            color: #000;
+        }}
+        
+        /* Cái bảng mô phỏng Excel */
+        table {{
+            width: 100%;
+            border-collapse: collapse; /* Gom đường viền lại cho mỏng */
+            margin-bottom: 20px;
+        }}
+        
+        /* Kẻ khung cho từng ô */
+        td, th {{
+            border: 1px solid black; /* Viền đen 1px */
+            padding: 10px; /* Khoảng cách chữ cách viền */
+            vertical-align: middle;
+        }}
+        
+        /* Cột tiêu đề (Bên trái) */
+        .label-col {{
+            background-color: #f0f0f0; /* Tô màu xám nhẹ giống header Excel */
+            font-weight: bold;
+            width: 30%; /* Chiếm 30% chiều rộng */
+        }}
         
-        # Điền dữ liệu
-        ws['A5'] = date
-        ws['C4'] = supervisor
-        ws['C5'] = output
-        ws['B8'] = notes
+        /* Cột dữ liệu (Bên phải) */
+        .data-col {{
+            width: 70%;
+            font-weight: bold;
+            color: #333;
+        }}
         
+        /* Phần ghi chú (Merge cells) */
+        .note-header {{
+            background-color: #f0f0f0;
+            font-weight: bold;
+            text-align: left;
+        }}
+        .note-content {{
+            height: 100px; /* Chiều cao cố định cho ô ghi chú */
+            vertical-align: top; /* Chữ nằm trên cùng */
+        }}
+        
+        /* Phần chữ ký */
+        .footer {{
+            margin-top: 40px;
+            text-align: right;
+            width: 100%;
+        }}
+    </style>
+</head>
+<body>
+    <h1>BÁO CÁO SẢN XUẤT</h1>
+
+    <table>
+        <tr>
+            <td class="label-col">Ngày báo cáo</td>
+            <td class="data-col">{date}</td>
+        </tr>
+        <tr>
+            <td class="label-col">Người phụ trách</td>
+            <td class="data-col">{supervisor}</td>
+        </tr>
+        <tr>
+            <td class="label-col">Tổng sản lượng (Tấn)</td>
+            <td class="data-col">{output}</td>
+        </tr>
+        
+        <tr>
+            <td colspan="2" class="note-header">Ghi chú / Sự cố trong ca trực:</td>
+        </tr>
+        <tr>
+            <td colspan="2" class="note-content">
+                {notes}
+            </td>
+        </tr>
+    </table>
+
+    <div class="footer">
+        <p><i>Ngày......tháng......năm......</i></p>
+        <p><b>Người lập biểu</b></p>
+        <br><br><br>
+        <p>{supervisor}</p>
+    </div>
+</body>
+</html>
+"""
+
+# PDF vừa tạo được giữ lại theo đúng bộ dữ liệu nhập: bấm tải lại / in lại không phải dựng lại
+pdf_report_cache = TTLCache(maxsize=32, ttl=600)
+
+@metrics.timer('report_render_seconds', kind='pdf')  # chỉ tính lần render thật, lần trúng cache không vào đây
+def render_pdf_report(date, supervisor, output, notes):
+    from xhtml2pdf import pisa
+    html_content = PDF_REPORT_HTML.format(
+        date=html.escape(str(date or '')),
+        supervisor=html.escape(str(supervisor or '')),
+        output=html.escape(str(output or '')),
+        notes=html.escape(str(notes or '')).replace(chr(10), '<br>')
+    )
+    pdf_out = io.BytesIO()
+    pisa_status = pisa.CreatePDF(io.StringIO(html_content), dest=pdf_out)
+    if pisa_status.err:
+        raise RuntimeError("Lỗi thư viện tạo PDF")
+    return pdf_out.getvalue()
+
+def create_pdf_report(date, supervisor, output, notes):
+    try:
+        pdf_bytes = pdf_report_cache.get(('pdf', date, supervisor, output, notes),
+                                         lambda: render_pdf_report(date, supervisor, output, notes))
+        return io.BytesIO(pdf_bytes), None
+
+    except RuntimeError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"Lỗi PDF: {str(e)}"
+
+# File xuất nhỏ hơn mức này giữ trong RAM, lớn hơn thì tự tràn xuống file tạm trên đĩa
+EXPORT_SPOOL_MAX = 8 * 1024 * 1024
+
+# 3. HÀM XUẤT BẢNG RA EXCEL (write-only: ghi từng dòng, không giữ cả bảng trong RAM)
+@metrics.timer('report_render_seconds', kind='export_excel')  # gồm cả thời gian đọc dòng từ database
+def write_rows_to_excel(headers, rows, sheet_title="Du Lieu"):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+
+    output_stream = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX)
+    wb.save(output_stream)
+    output_stream.seek(0)
+    return output_stream
+
+# 4. BÁO CÁO NHIỀU NGÀY
+# Mỗi ngày 1 báo cáo, render song song trên pool process (xhtml2pdf tốn CPU, thread không chạy song song được vì GIL).
+# Pool tạo 1 lần rồi dùng lại; process con khởi động kiểu "spawn" cho an toàn khi process cha đang có nhiều thread.
+# Process thoát (gunicorn nạp lại / tắt worker: hook worker_exit trong gunicorn.conf.py, còn lại atexit) thì dừng pool,
+# không để process con mồ côi nằm chờ việc.
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', os.cpu_count() or 1))
+REPORT_POOL_MIN = 4  # ít báo cáo hơn số này thì render luôn, không đáng chuyển qua pool
+_report_pool = None
+_report_pool_lock = threading.Lock()
+
+def get_report_pool():
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is None:
+            _report_pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _report_pool
+
+def shutdown_report_pool():
+    global _report_pool
+    with _report_pool_lock:
+        pool, _report_pool = _report_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+atexit.register(shutdown_report_pool)
+
+def render_report(fmt, report, template=None):
+    # Chạy trong process con: trả về bytes để gửi ngược về được (BytesIO không pickle gọn)
+    args = (report.get('date'), report.get('supervisor'), report.get('output'), report.get('notes'))
+    if fmt == 'excel':
+        file_stream, err = create_excel_report(*args, filename=template)
+    else:
+        file_stream, err = create_pdf_report(*args)
+    return (file_stream.getvalue() if file_stream else None), err
+
+def pool_map(func, *args, min_items=REPORT_POOL_MIN):
+    # Như map(func, *args) nhưng chạy trên pool process khi đủ nhiều việc; func phải ở cấp module (pickle được)
+    n = len(args[0])
+    if REPORT_WORKERS <= 1 or n < min_items:
+        return list(map(func, *args))
+    try:
+        return list(get_report_pool().map(func, *args))
+    except BrokenProcessPool:
+        # Process con chết (hết RAM, bị kill...): bỏ pool hỏng (dừng nốt process còn sống), lần này render tuần tự
+        shutdown_report_pool()
+        return list(map(func, *args))
+
+def render_reports(fmt, reports):
+    n = len(reports)
+    return pool_map(render_report, [fmt] * n, reports, [REPORT_TEMPLATE] * n)
+
+def unique_name(name, used):
+    candidate = name
+    n = 2
+    while candidate in used:
+        candidate = f"{name} ({n})"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+def create_batch_report(fmt, reports, bundle='zip'):
+    # bundle='zip': mỗi ngày 1 file trong 1 file .zip; bundle='merged': gộp thành 1 workbook nhiều sheet / 1 PDF nhiều trang
+    if not reports:
+        return None, "Chưa có ngày nào để làm báo cáo!"
+    # Process con của pool ghi số liệu vào bộ riêng của chúng, nên đo cả lô ở process cha
+    with metrics.timer('report_render_seconds', kind=f'batch_{fmt}_{bundle}'):
+        if fmt == 'excel' and bundle == 'merged':
+            return create_merged_excel_report(reports)
+        return bundle_batch_report(fmt, reports, bundle)
+
+def bundle_batch_report(fmt, reports, bundle):
+    results = render_reports(fmt, reports)
+    for report, (_, err) in zip(reports, results):
+        if err:
+            return None, f"Ngày {report.get('date')}: {err}"
+
+    output_stream = io.BytesIO()
+    if bundle == 'merged':
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for data, _ in results:
+            writer.append(io.BytesIO(data))
+        writer.write(output_stream)
+    else:
+        ext = 'xlsx' if fmt == 'excel' else 'pdf'
+        used = set()
+        with zipfile.ZipFile(output_stream, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for report, (data, _) in zip(reports, results):
+                name = re.sub(r'[\\/:*?"<>|]', '-', f"BaoCao_{report.get('date')}")
+                zf.writestr(unique_name(name, used) + f".{ext}", data)
+    output_stream.seek(0)
+    return output_stream, None
+
+def report_sheet_name(report, used):
+    # Tên sheet Excel: tối đa 31 ký tự, không chứa []:*?/\
+    name = re.sub(r"[\[\]:*?/\\]", '-', str(report.get('date') or 'Sheet')).strip("'")[:25] or 'Sheet'
+    return unique_name(name, used)
+
+def create_merged_excel_report(reports):
+    # Nhân bản sheet mẫu đã biên dịch thành N sheet ngay trên XML (sheet 1 dùng lại phần gốc,
+    # sheet 2..N chép sheet + drawing/ảnh đi kèm), không phải mở workbook bằng openpyxl
+    filename = REPORT_TEMPLATE
+    if not os.path.exists(filename):
+        return None, "Lỗi: Không tìm thấy file mẫu 'mau_bao_cao.xlsx'!"
+    try:
+        template = load_report_template(filename)
+        if template['error']:
+            return None, f"Lỗi Excel: {template['error']}"
+        files = {info.filename: data for info, data in template.get('entries', [])}
+        workbook_xml = files.get('xl/workbook.xml', b'').decode('utf-8')
+        if template['parts'] is None or len(re.findall(r'<sheet\b', workbook_xml)) != 1:
+            return None, "Lỗi Excel: File mẫu này chỉ xuất được dạng ZIP (mỗi ngày 1 file)"
+
+        sheet_path = template['sheet_path']
+        sheet_dir, sheet_file = posixpath.split(sheet_path)
+        sheet_rels_path = f"{sheet_dir}/_rels/{sheet_file}.rels"
+        sheet_tag = re.search(r'<sheet\b[^>]*/>', workbook_xml).group(0)
+        sheet_id = int(re.search(r'\bsheetId="(\d+)"', sheet_tag).group(1))
+        old_name = html.unescape(re.search(r'\bname="([^"]*)"', sheet_tag).group(1))
+        content_types = files['[Content_Types].xml'].decode('utf-8')
+        overrides = dict(re.findall(r'<Override PartName="([^"]+)" ContentType="([^"]+)"/>', content_types))
+
+        used = set()
+        names = [report_sheet_name(report, used) for report in reports]
+        new_files = {}
+        sheet_tags = [re.sub(r'\bname="[^"]*"', 'name="%s"' % xml_escape(names[0], {'"': '&quot;'}), sheet_tag)]
+        sheet_rels = []
+        new_overrides = []
+        for k, report in enumerate(reports[1:], start=2):
+            part = f"{sheet_dir}/report{k}.xml"
+            rid = f"rIdReport{k}"
+            sheet_tags.append('<sheet name="%s" sheetId="%d" r:id="%s"/>' % (xml_escape(names[k - 1], {'"': '&quot;'}), sheet_id + k - 1, rid))
+            sheet_rels.append(f'<Relationship Id="{rid}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="/{part}"/>')
+            new_overrides.append((f"/{part}", overrides[f"/{sheet_path}"]))
+            new_files[part] = fill_report_sheet(template, report.get('date'), report.get('supervisor'),
+                                                report.get('output'), report.get('notes')).replace(' tabSelected="1"', '').encode('utf-8')
+            if sheet_rels_path in files:
+                rels_xml = files[sheet_rels_path].decode('utf-8')
+                # Chép các phần sheet trỏ tới (drawing, comment...) để mỗi sheet có bản riêng
+                for target in set(re.findall(r'<Relationship\b(?![^>]*TargetMode="External")[^>]*\bTarget="([^"]+)"', rels_xml)):
+                    src = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(sheet_dir, target))
+                    src_dir, src_file = posixpath.split(src)
+                    dst = f"{src_dir}/report{k}_{src_file}"
+                    new_files[dst] = files[src]
+                    if f"{src_dir}/_rels/{src_file}.rels" in files:
+                        new_files[f"{src_dir}/_rels/report{k}_{src_file}.rels"] = files[f"{src_dir}/_rels/{src_file}.rels"]
+                    if f"/{src}" in overrides:
+                        new_overrides.append((f"/{dst}", overrides[f"/{src}"]))
+                    rels_xml = rels_xml.replace(f'Target="{target}"', f'Target="/{dst}"')
+                new_files[f"{sheet_dir}/_rels/report{k}.xml.rels"] = rels_xml.encode('utf-8')
+
+        # Vùng in (definedName theo sheet) nhân ra cho từng sheet mới
+        def rename_ref(text, new_name):
+            quoted = "'" + new_name.replace("'", "''") + "'"
+            return re.sub(r"(?:&apos;|')?%s(?:&apos;|')?!" % re.escape(xml_escape(old_name)), lambda m: xml_escape(quoted) + '!', text)
+
+        def expand_defined_name(match):
+            attrs, text = match.group(1), match.group(2)
+            if 'localSheetId="0"' not in attrs:
+                return f'<definedName{attrs}>{rename_ref(text, names[0])}</definedName>'
+            return ''.join(
+                '<definedName%s>%s</definedName>' % (attrs.replace('localSheetId="0"', f'localSheetId="{idx}"'), rename_ref(text, name))
+                for idx, name in enumerate(names)
+            )
+
+        workbook_xml = workbook_xml.replace(sheet_tag, ''.join(sheet_tags))
+        workbook_xml = re.sub(r'<definedName\b([^>]*)>(.*?)</definedName>', expand_defined_name, workbook_xml, flags=re.S)
+        new_files['xl/workbook.xml'] = workbook_xml.encode('utf-8')
+        new_files['xl/_rels/workbook.xml.rels'] = files['xl/_rels/workbook.xml.rels'].decode('utf-8') \
+            .replace('</Relationships>', ''.join(sheet_rels) + '</Relationships>').encode('utf-8')
+        new_files['[Content_Types].xml'] = content_types.replace(
+            '</Types>', ''.join(f'<Override PartName="{name}" ContentType="{ctype}"/>' for name, ctype in new_overrides) + '</Types>'
+        ).encode('utf-8')
+        new_files[sheet_path] = fill_report_sheet(template, reports[0].get('date'), reports[0].get('supervisor'),
+                                                  reports[0].get('output'), reports[0].get('notes')).encode('utf-8')
+
         output_stream = io.BytesIO()
-        wb.save(output_stream)
+        with zipfile.ZipFile(output_stream, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for info, data in template['entries']:
+                zf.writestr(info, new_files.pop(info.filename, data))
+            for name, data in new_files.items():
+                zf.writestr(name, data)
         output_stream.seek(0)
         return output_stream, None
     except Exception as e:
         return None, f"Lỗi Excel: {str(e)}"
 
-# 2. HÀM TẠO PDF (Đã sửa giao diện giống Excel)
-def create_pdf_report(date, supervisor, output, notes):
-    try:
-        # Tèo dùng HTML để vẽ lại cái bảng y chang Excel
-        # Anh có thể chỉnh sửa độ rộng (width), chiều cao (height) ở đây
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ 
-                    font-family: Arial, sans-serif; 
-                    padding: 40px; 
-                    font-size: 14px;
-                }}
-                /* Tiêu đề báo cáo */
-                h1 {{ 
-                    text-align: center; 
-                    text-transform: uppercase; 
-                    margin-bottom: 30px;
-                    color: #000;
-                }}
-                
-                /* Cái bảng mô phỏng Excel */
-                table {{
-                    width: 100%;
-                    border-collapse: collapse; /* Gom đường viền lại cho mỏng */
-                    margin-bottom: 20px;
-                }}
-                
-                /* Kẻ khung cho từng ô */
-                td, th {{
-                    border: 1px solid black; /* Viền đen 1px */
-                    padding: 10px; /* Khoảng cách chữ cách viền */
-                    vertical-align: middle;
-                }}
-                
-                /* Cột tiêu đề (Bên trái) */
-                .label-col {{
-                    background-color: #f0f0f0; /* Tô màu xám nhẹ giống header Excel */
-                    font-weight: bold;
-                    width: 30%; /* Chiếm 30% chiều rộng */
-                }}
-                
-                /* Cột dữ liệu (Bên phải) */
-                .data-col {{
-                    width: 70%;
-                    font-weight: bold;
-                    color: #333;
-                }}
-                
-                /* Phần ghi chú (Merge cells) */
-                .note-header {{
-                    background-color: #f0f0f0;
-                    font-weight: bold;
-                    text-align: left;
-                }}
-                .note-content {{
-                    height: 100px; /* Chiều cao cố định cho ô ghi chú */
-                    vertical-align: top; /* Chữ nằm trên cùng */
-                }}
-                
-                /* Phần chữ ký */
-                .footer {{
-                    margin-top: 40px;
-                    text-align: right;
-                    width: 100%;
-                }}
-            </style>
-        </head>
-        <body>
-            <h1>BÁO CÁO SẢN XUẤT</h1>
-
-            <table>
-                <tr>
-                    <td class="label-col">Ngày báo cáo</td>
-                    <td class="data-col">{date}</td>
-                </tr>
-                <tr>
-                    <td class="label-col">Người phụ trách</td>
-                    <td class="data-col">{supervisor}</td>
-                </tr>
-                <tr>
-                    <td class="label-col">Tổng sản lượng (Tấn)</td>
-                    <td class="data-col">{output}</td>
-                </tr>
-                
-                <tr>
-                    <td colspan="2" class="note-header">Ghi chú / Sự cố trong ca trực:</td>
-                </tr>
-                <tr>
-                    <td colspan="2" class="note-content">
-                        {notes.replace(chr(10), '<br>')}
-                    </td>
-                </tr>
-            </table>
-
-            <div class="footer">
-                <p><i>Ngày......tháng......năm......</i></p>
-                <p><b>Người lập biểu</b></p>
-                <br><br><br>
-                <p>{supervisor}</p>
-            </div>
-        </body>
-        </html>
-        """
-        
-        pdf_out = io.BytesIO()
-        pisa_status = pisa.CreatePDF(io.StringIO(html_content), dest=pdf_out)
-        
-        if pisa_status.err:
-            return None, "Lỗi thư viện tạo PDF"
-            
-        pdf_out.seek(0)
-        return pdf_out, None
+# 5. IN NHIỀU PHIẾU RA 1 FILE PDF
+# app.py dựng sẵn HTML theo từng lô TICKET_PDF_CHUNK phiếu (mỗi phiếu 1 trang). Mỗi lô render PDF riêng
+# (song song trên pool báo cáo) rồi nối lại bằng pypdf: RAM của xhtml2pdf chỉ tỉ lệ với 1 lô chứ không phải cả trăm trang.
+TICKET_PDF_CHUNK = int(os.environ.get('TICKET_PDF_CHUNK', 50))
+# Font mặc định của xhtml2pdf (Helvetica) không có chữ có dấu tiếng Việt: dùng file .ttf có đủ dấu, mặc định
+# fonts/DejaVuSans.ttf đi kèm dự án (đổi bằng PDF_FONT_PATH, vd arial.ttf). Thiếu file thì báo lỗi chứ không in phiếu mất dấu.
+PDF_FONT_PATH = os.path.abspath(os.environ.get('PDF_FONT_PATH') or os.path.join('fonts', 'DejaVuSans.ttf'))
 
+def render_html_pdf(html_content):
+    from xhtml2pdf import pisa
+    pdf_out = io.BytesIO()
+    # xhtml2pdf chỉ đọc file trong thư mục của tài liệu (mặc định thư mục đang chạy): lấy thư mục chứa font làm
+    # thư mục tài liệu để font để đâu cũng đọc được, đọc không được nó lặng lẽ dùng Helvetica
+    pisa_status = pisa.CreatePDF(io.StringIO(html_content), dest=pdf_out, path=PDF_FONT_PATH)
+    if pisa_status.err:
+        raise RuntimeError("Lỗi thư viện tạo PDF")
+    return pdf_out.getvalue()
+
+@metrics.timer('report_render_seconds', kind='tickets_pdf')
+def create_tickets_pdf(html_chunks):
+    # html_chunks: danh sách HTML, mỗi cái 1 lô phiếu. Trả về (file PDF gộp, lỗi)
+    if not html_chunks:
+        return None, "Không có phiếu nào để in!"
+    if not os.path.isfile(PDF_FONT_PATH):
+        return None, f"Không tìm thấy font PDF {PDF_FONT_PATH} (đặt lại PDF_FONT_PATH), in ra sẽ mất dấu tiếng Việt!"
+    try:
+        parts = pool_map(render_html_pdf, html_chunks, min_items=2)
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for data in parts:
+            writer.append(io.BytesIO(data))
+        output_stream = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX)
+        writer.write(output_stream)
+        output_stream.seek(0)
+        return output_stream, None
+    except RuntimeError as e:
+        return None, str(e)
     except Exception as e:
-        return None, f"Lỗi PDF: {str(e)}"
\ No newline at end of file
+        return None, f"Lỗi PDF: {str(e)}"
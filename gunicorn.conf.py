@@ -0,0 +1,39 @@
+# File: gunicorn.conf.py
+# Cấu hình chạy web bằng gunicorn (Procfile: gunicorn -c gunicorn.conf.py app:app). Chỉnh bằng biến môi trường, xem lenh_thuong_dung.md.
+#
+# Mặc định: WEB_CONCURRENCY process x WEB_THREADS thread (worker gthread). 1 request chờ database / gửi file không chặn
+# các request khác, RAM chỉ tốn theo số process. Kiểu cũ (1 process sync, mỗi lúc 1 request): WEB_WORKER_CLASS=sync WEB_CONCURRENCY=1.
+# WEB_WORKER_CLASS=gevent: hàng trăm kết nối chậm / chờ lâu trên 1 process, cần cài thêm "gevent psycogreen";
+# việc nặng tốn CPU (xuất Excel, báo cáo) chạy trên greenlet sẽ chặn các request khác trong lúc chạy, nên gthread vẫn là lựa chọn chính.
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('WEB_THREADS', 8)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('WEB_CONNECTIONS', 100))  # chỉ dùng cho gevent
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))  # việc lâu đã chạy thành job nền, request không nên quá số giây này
+graceful_timeout = 30
+keepalive = 5  # giữ kết nối với proxy của Render giữa các request
+
+# Không preload: lúc import app.py mở kết nối database và tạo thread chạy job, fork sau đó thì process con dùng chung kết nối hỏng.
+preload_app = False
+
+# app.py đọc WEB_THREADS để đặt cỡ pool kết nối database (mỗi thread 1 kết nối)
+os.environ['WEB_THREADS'] = str(threads)
+
+def post_fork(server, worker):
+    # gevent: psycopg2 gọi C chặn cả process khi chờ Postgres, psycogreen cho nó nhường greenlet khác
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("Chạy gevent mà chưa cài psycogreen: mỗi câu SQL sẽ chặn cả process")
+        return
+    patch_psycopg()
+
+def worker_exit(server, worker):
+    # Worker thoát (nạp lại, tắt, quá max_requests): dừng pool process render báo cáo của worker đó
+    import excel_utils
+    excel_utils.shutdown_report_pool()
@@ -0,0 +1,137 @@
+# File: import_utils.py
+import io
+import csv
+from datetime import datetime, date, time as dt_time
+from search_utils import normalize_search_text
+
+IMPORT_EXTENSIONS = ('.xlsx', '.xlsm', '.csv', '.txt')
+# Dòng tiêu đề không nhất thiết là dòng 1 (file cũ hay có tên bảng / ngày tháng ở trên): dò trong chừng này dòng đầu
+IMPORT_HEADER_SCAN = 20
+# Cột có sẵn trong file Xuất Excel, không phải cột của bảng
+IMPORT_ID_HEADER = 'id'
+IMPORT_CREATED_HEADER = 'ngay tao'
+EXCEL_ERRORS = {'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'}
+CREATED_AT_FORMATS = ('%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+# Tách ô nhiều dòng thành list giống hệt form nhập (save_row): bỏ dòng trống, cắt khoảng trắng 2 đầu
+def split_cell_value(raw_val):
+    if '\n' in raw_val:
+        return [line.strip() for line in raw_val.split('\n') if line.strip()]
+    return raw_val.strip()
+
+# Giá trị ô Excel -> chuỗi như người dùng gõ tay (ngày kiểu dd/mm/yyyy, 12.0 -> "12")
+def cell_to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y' if value.time() == dt_time() else '%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, dt_time):
+        return value.strftime('%H:%M')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def iter_xlsx_rows(stream):
+    from openpyxl import load_workbook  # nạp lúc nhập file đầu tiên, không làm chậm lúc khởi động
+    # Chế độ read_only: đọc XML từng dòng, không dựng cả sheet trong RAM
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        ws.reset_dimensions()  # file do phần mềm khác xuất hay ghi sai kích thước sheet -> mất cột
+        for line_no, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            yield line_no, list(values)
+    finally:
+        wb.close()
+
+def iter_csv_rows(stream):
+    # CSV phải là UTF-8 (Excel: "CSV UTF-8"); dấu phân cách , ; hoặc tab tự nhận
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(64 * 1024)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    for values in reader:
+        yield reader.line_num, values
+
+def iter_import_rows(file):
+    # Trả về (số dòng trong file, list giá trị các ô) cho từng dòng của file .xlsx hoặc .csv
+    name = (file.filename or '').lower()
+    if name.endswith('.xlsx') or name.endswith('.xlsm'):
+        return iter_xlsx_rows(file.stream)
+    return iter_csv_rows(file.stream)
+
+def map_headers(headers, col_names):
+    # Khớp tiêu đề file với tên cột: đúng y chang trước, không được thì so kiểu không dấu / không hoa thường.
+    # Trả về ({vị trí: tên cột}, vị trí cột "Ngày tạo" hoặc None, danh sách tiêu đề không khớp cột nào)
+    exact = {name: name for name in col_names}
+    loose = {}
+    for name in col_names:
+        loose.setdefault(normalize_search_text(name), name)
+
+    mapping = {}
+    created_idx = None
+    unknown = []
+    for idx, header in enumerate(headers):
+        header = cell_to_text(header).strip()
+        if not header:
+            continue
+        key = normalize_search_text(header)
+        name = exact.get(header) or loose.get(key)
+        if name and name not in mapping.values():
+            mapping[idx] = name
+        elif key == IMPORT_CREATED_HEADER and created_idx is None:
+            created_idx = idx
+        elif key != IMPORT_ID_HEADER:
+            unknown.append(header)
+    return mapping, created_idx, unknown
+
+def find_header_row(rows, col_names):
+    # Lấy dòng đầu tiên (trong IMPORT_HEADER_SCAN dòng) có ít nhất 1 tiêu đề khớp tên cột.
+    # width = số ô tới tiêu đề cuối cùng, ô có dữ liệu nằm ngoài khoảng này là dòng hỏng.
+    for line_no, values in rows:
+        mapping, created_idx, unknown = map_headers(values, col_names)
+        if mapping:
+            width = max(i for i, v in enumerate(values) if cell_to_text(v).strip()) + 1
+            return line_no, mapping, created_idx, unknown, width
+        if line_no >= IMPORT_HEADER_SCAN:
+            break
+    return None
+
+def parse_created_at(value):
+    if isinstance(value, datetime):
+        return value
+    text = cell_to_text(value).strip()
+    for fmt in CREATED_AT_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f'Ngày tạo "{text}" không đúng dạng dd/mm/yyyy hh:mm')
+
+def parse_import_row(values, mapping, created_idx, width):
+    # 1 dòng trong file -> (content, created_at theo giờ VN hoặc None). Dòng trống trả None.
+    # Dòng hỏng thì raise ValueError kèm lý do, dòng khác vẫn nhập bình thường.
+    if not any(cell_to_text(v).strip() for v in values):
+        return None
+    extra = [v for v in values[width:] if cell_to_text(v).strip()]
+    if extra:
+        raise ValueError(f'Dư {len(extra)} ô nằm ngoài các cột tiêu đề (sai dấu phân cách / dấu ngoặc kép?)')
+
+    content = {}
+    for idx, name in mapping.items():
+        raw_val = cell_to_text(values[idx] if idx < len(values) else None)
+        if raw_val.strip() in EXCEL_ERRORS:
+            raise ValueError(f'Ô "{name}" bị lỗi công thức {raw_val.strip()}')
+        content[name] = split_cell_value(raw_val)
+    if not any(content.values()):
+        return None
+
+    created_at = None
+    if created_idx is not None and created_idx < len(values) and cell_to_text(values[created_idx]).strip():
+        created_at = parse_created_at(values[created_idx])
+    return content, created_at
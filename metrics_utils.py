@@ -0,0 +1,151 @@
+# File: metrics_utils.py
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Mốc histogram (giây) cho thời gian request / câu SQL / render file
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Mốc cho số câu SQL mỗi request và số byte trả về
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ô cuối = lớn hơn mốc cuối (+Inf)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Ước lượng phân vị từ các ô (nội suy tuyến tính trong ô), đủ để so route nhanh / chậm
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (target - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+# Số liệu trong 1 process (mỗi worker gunicorn có bộ riêng). Dùng được từ nhiều thread cùng lúc.
+class MetricsRegistry:
+    def __init__(self, warning_keep=50):
+        self._lock = threading.Lock()
+        self._counters = {}    # (tên, nhãn) -> số
+        self._histograms = {}  # (tên, nhãn) -> Histogram
+        self._gauges = {}      # (tên, nhãn) -> giá trị hiện tại
+        self._help = {}
+        self.warnings = deque(maxlen=warning_keep)
+        self.started_at = time.time()
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def warn(self, message, **info):
+        with self._lock:
+            self.warnings.appendleft(dict(info, message=message, time=time.time()))
+
+    def histograms(self, name):
+        # [(dict nhãn, Histogram)] của 1 metric, để trang admin tự tính bảng
+        with self._lock:
+            return [(dict(labels), hist) for (n, labels), hist in self._histograms.items() if n == name]
+
+    def counters(self, name):
+        with self._lock:
+            return [(dict(labels), value) for (n, labels), value in self._counters.items() if n == name]
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.warnings.clear()
+            self.started_at = time.time()
+
+    def render_prometheus(self):
+        # Định dạng text của Prometheus (text/plain; version=0.0.4)
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            lines = []
+            written = set()
+
+            def header(name, kind):
+                if name in written:
+                    return
+                written.add(name)
+                help_kind, text = self._help.get(name, (kind, ''))
+                if text:
+                    lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {help_kind}')
+
+            for (name, labels), value in counters:
+                header(name, 'counter')
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+            for (name, labels), value in sorted(self._gauges.items()):
+                header(name, 'gauge')
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+            for (name, labels), hist in histograms:
+                header(name, 'histogram')
+                cumulative = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", format_value(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {hist.count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(hist.sum)}')
+                lines.append(f'{name}_count{format_labels(labels)} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def format_value(value):
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(round(value, 6))
+    return str(value)
+
+# Bộ số liệu chung của process: app.py ghi request / SQL, excel_utils ghi thời gian render file
+metrics = MetricsRegistry()
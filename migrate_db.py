@@ -0,0 +1,14 @@
+# File: migrate_db.py
+# Nâng cấp cấu trúc database (tạo bảng / cột / index còn thiếu, index tìm kiếm, điền cột mới).
+# Chạy 1 lần mỗi lần deploy, trước khi khởi động web. Chạy lại nhiều lần vẫn an toàn.
+import os
+import time
+
+os.environ['APP_SKIP_STARTUP'] = '1'  # chỉ nâng cấp, không nhận job như worker web
+from app import app, upgrade_schema
+
+with app.app_context():
+    started = time.perf_counter()
+    print("⏳ Đang nâng cấp cấu trúc database...")
+    upgrade_schema()
+    print(f"✅ Xong trong {time.perf_counter() - started:.1f}s")
@@ -1,5 +1,8 @@
 # File: reset_db.py
-from app import app, db
+import os
+
+os.environ['APP_SKIP_STARTUP'] = '1'  # bảng cũ sắp bị xóa, không cần nâng cấp / nhận job
+from app import app, db, upgrade_schema
 
 # Chạy trong ngữ cảnh của ứng dụng Flask
 with app.app_context():
@@ -7,6 +10,6 @@ with app.app_context():
     db.drop_all()  # Lệnh này sẽ xóa sạch bách các bảng cũ bị lỗi
     
     print("🔨 Đang xây dựng lại cấu trúc bảng mới (có Menu, Admin)...")
-    db.create_all() # Tạo lại từ đầu đầy đủ: User, AppTable, DataRow...
+    upgrade_schema() # Tạo lại từ đầu đầy đủ: User, AppTable, DataRow... (kèm index tìm kiếm)
     
     print("✅ Xong rồi anh hai ơi! Giờ web chạy ngon lành rồi đó.")
\ No newline at end of file
@@ -0,0 +1,31 @@
+# File: search_utils.py
+import re
+import unicodedata
+
+# Ngăn cách giá trị các cột trong search_text, để 1 từ khóa không khớp "dính" qua 2 ô cạnh nhau
+SEARCH_SEP = '\x1f'
+
+# Chuẩn hóa để tìm không dấu, không phân biệt hoa thường: "Thép Cuộn  ĐỎ" -> "thep cuon do"
+def normalize_search_text(text):
+    text = str(text).lower().replace('đ', 'd')
+    text = ''.join(ch for ch in unicodedata.normalize('NFD', text) if unicodedata.category(ch) != 'Mn')
+    return re.sub(r'[ \t\r\n]+', ' ', text).strip()
+
+# Chuỗi dùng để tìm của 1 dòng: giá trị các cột (theo thứ tự cột), ô nhiều dòng gộp bằng dấu cách
+def build_search_text(content, col_names):
+    content = content or {}
+    values = []
+    for name in col_names:
+        val = content.get(name, '')
+        if isinstance(val, list):
+            val = " ".join(str(v) for v in val)
+        values.append(normalize_search_text(val))
+    return SEARCH_SEP.join(values)
+
+# Tách ô tìm kiếm thành các từ đã chuẩn hóa; dòng nào chứa đủ mọi từ thì khớp
+def search_terms(q):
+    terms = []
+    for term in normalize_search_text(q or '').split(' '):
+        if term and term not in terms:
+            terms.append(term)
+    return terms
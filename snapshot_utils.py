@@ -0,0 +1,108 @@
+# File: snapshot_utils.py
+import time
+import bisect
+import threading
+from collections import OrderedDict, namedtuple
+
+# 1 dòng trong ảnh chụp: đủ cho trang chính (row.id / row.content), xuất Excel, backup, in phiếu
+SnapshotRow = namedtuple('SnapshotRow', 'id created_at content sort_key')
+
+# Ảnh chụp 1 bảng của 1 user ở phiên bản `version`: các dòng đã sắp theo (sort_key, id) như trang chính.
+# Không sửa tại chỗ (request khác có thể đang đọc): có thay đổi thì apply_changes() tạo ảnh mới.
+# rows = None: bảng quá lớn, không giữ trong RAM (nơi gọi tự đọc database).
+class TableSnapshot:
+    def __init__(self, version, col_names, rows, built_at=None):
+        self.version = version
+        self.col_names = col_names
+        self.rows = rows
+        self.built_at = built_at if built_at is not None else time.monotonic()  # lúc chụp từ đầu (vá không tính)
+        self.keys = [(row.sort_key, row.id) for row in rows] if rows is not None else None
+        self._by_id = None
+
+    def age(self):
+        return time.monotonic() - self.built_at
+
+    @property
+    def size(self):
+        return len(self.rows) if self.rows is not None else 0
+
+    def get(self, row_id):
+        if self._by_id is None:
+            self._by_id = {row.id: row for row in self.rows}
+        return self._by_id.get(row_id)
+
+    def page(self, after=None, limit=100):
+        # Cắt trang theo khóa (sort_key, id) giống query_row_page: trả về (các dòng, còn nữa không)
+        start = bisect.bisect_right(self.keys, tuple(after)) if after else 0
+        page = self.rows[start:start + limit]
+        return page, start + limit < len(self.rows)
+
+    def rows_by_id(self, reverse=False):
+        return sorted(self.rows, key=lambda row: row.id, reverse=reverse)
+
+    def apply_changes(self, version, changed_rows, deleted_ids):
+        # Ảnh mới = ảnh cũ bỏ dòng đã xóa / đã sửa, thêm bản mới của dòng đã sửa, sắp lại
+        # (danh sách gần như đã có thứ tự nên sort gần O(n))
+        drop = set(deleted_ids)
+        drop.update(row.id for row in changed_rows)
+        rows = [row for row in self.rows if row.id not in drop]
+        rows.extend(changed_rows)
+        rows.sort(key=lambda row: (row.sort_key, row.id))
+        return TableSnapshot(version, self.col_names, rows, self.built_at)
+
+# Giữ ảnh chụp của nhiều bảng, giới hạn theo TỔNG số dòng (không phải số bảng); đầy thì bỏ bảng lâu không xem nhất.
+class SnapshotCache:
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self._data = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.patches = 0
+        self.rebuilds = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            snapshot = self._data.get(key)
+            if snapshot is not None:
+                self._data.move_to_end(key)
+            return snapshot
+
+    def put(self, key, snapshot):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._rows -= old.size
+            self._data[key] = snapshot
+            self._rows += snapshot.size
+            while self._rows > self.max_rows and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self._rows -= evicted.size
+                self.evictions += 1
+
+    def count(self, kind):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    def invalidate(self, match):
+        with self._lock:
+            for key in [k for k in self._data if match(k)]:
+                self._rows -= self._data.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._rows = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tables': len(self._data),
+                'rows': self._rows,
+                'max_rows': self.max_rows,
+                'hits': self.hits,
+                'patches': self.patches,
+                'rebuilds': self.rebuilds,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,176 @@
+# File: stats_utils.py
+import re
+import math
+from datetime import datetime
+
+# numpy import ngay trong hàm dùng tới (giống openpyxl bên excel_utils): chỉ request thống kê đầu tiên mới phải nạp
+
+# Số trong ô là chữ do người gõ: "850", "12,5", "1.234,5", "1,234.5", "1 200", "850°C", "12 tấn".
+# Phần đuôi (đơn vị) không được có chữ số: "12-15", "08:30", "2026-10-01" không tính là số.
+NUMBER_RE = re.compile(r'^\s*([+-]?\d(?:[\d.,\s]*\d)?)\s*([^\d]{0,10})$')
+# Cột được coi là cột số khi ít nhất bấy nhiêu phần ô có dữ liệu đọc ra số
+NUMERIC_MIN_SHARE = 0.8
+GROUP_LIMIT = 100
+EMPTY_GROUP = '(trống)'
+
+def parse_number(value):
+    if isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, list):
+        return parse_number(value[0]) if len(value) == 1 else math.nan
+    if not isinstance(value, str):
+        return math.nan
+    value = value.strip()
+    if not value or not (value[0].isdigit() or value[0] in '+-'):
+        return math.nan  # đa số ô chữ loại được ngay ở đây, khỏi chạy regex
+    try:
+        result = float(value)  # ô chỉ có số "850", "12.5": nhanh nhất
+        return result if math.isfinite(result) else math.nan
+    except ValueError:
+        pass
+    match = NUMBER_RE.match(value)
+    if not match:
+        return math.nan
+    text = re.sub(r'\s', '', match.group(1))
+    if ',' in text and '.' in text:
+        # Dấu đứng sau cùng là dấu thập phân, dấu còn lại ngăn cách hàng nghìn
+        point = max(text.rfind(','), text.rfind('.'))
+        text = text[:point].replace(',', '').replace('.', '') + '.' + text[point + 1:]
+    elif text.count(',') == 1:
+        text = text.replace(',', '.')  # 12,5 kiểu Việt
+    elif text.count(',') > 1 or text.count('.') > 1:
+        text = text.replace(',', '').replace('.', '')  # 1.200.000 / 1,200,000
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+def cell_text(value):
+    if isinstance(value, list):
+        value = ', '.join(str(v).strip() for v in value if str(v).strip())
+    return str(value).strip() if value is not None else ''
+
+# Số liệu của 1 bảng dạng mảng NumPy, rút ra trong 1 lượt qua các dòng:
+# numeric[tên cột] = mảng float (ô trống / không phải số = NaN), text[tên cột] = chữ trong ô (để gom nhóm),
+# created = thời điểm tạo dòng (UTC, datetime64)
+class TableArrays:
+    def __init__(self, size, created, numeric, text):
+        self.size = size
+        self.created = created
+        self.numeric = numeric
+        self.text = text
+
+    @property
+    def numeric_names(self):
+        return list(self.numeric)
+
+def extract_arrays(rows, col_names):
+    # rows: các dòng có .created_at và .content (ảnh chụp hoặc kết quả query)
+    import numpy as np
+    created = []
+    values = {name: [] for name in col_names}
+    texts = {name: [] for name in col_names}
+    for row in rows:
+        created.append(row.created_at or datetime(1970, 1, 1))
+        content = row.content or {}
+        for name in col_names:
+            value = content.get(name)
+            values[name].append(parse_number(value))
+            texts[name].append(cell_text(value))
+
+    numeric = {}
+    for name in col_names:
+        array = np.array(values[name], dtype=np.float64)
+        filled = sum(1 for text in texts[name] if text)
+        parsed = int(np.count_nonzero(~np.isnan(array)))
+        if parsed and parsed >= NUMERIC_MIN_SHARE * filled:
+            numeric[name] = array
+    text = {name: np.array(texts[name], dtype=object) for name in col_names}
+    return TableArrays(len(created), np.array(created, dtype='datetime64[s]'), numeric, text)
+
+def number(value):
+    # float của NumPy -> số JSON gọn
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 6)
+
+def column_stats(values, percentiles=(5, 25, 50, 75, 95), bins=10):
+    import numpy as np
+    data = values[~np.isnan(values)]
+    result = {'count': int(data.size), 'missing': int(values.size - data.size)}
+    if not data.size:
+        return result
+    counts, edges = np.histogram(data, bins=bins)
+    result.update({
+        'sum': number(data.sum()),
+        'min': number(data.min()),
+        'max': number(data.max()),
+        'mean': number(data.mean()),
+        'std': number(data.std()),
+        'percentiles': {f'p{p:g}': number(v) for p, v in zip(percentiles, np.percentile(data, percentiles))},
+        'histogram': {'edges': [number(e) for e in edges], 'counts': counts.tolist()}
+    })
+    return result
+
+def group_stats(numeric, groups, limit=GROUP_LIMIT):
+    # Gom theo giá trị cột chữ (vd Mác thép): mỗi nhóm có số dòng + count/sum/mean/min/max từng cột số.
+    # Nhiều dòng nhất lên đầu, tối đa `limit` nhóm.
+    import numpy as np
+    if not groups.size:
+        return []
+    keys, inverse = np.unique(groups, return_inverse=True)
+    rows = np.bincount(inverse, minlength=keys.size)
+    per_column = {}
+    for name, values in numeric.items():
+        valid = ~np.isnan(values)
+        index = inverse[valid]
+        data = values[valid]
+        counts = np.bincount(index, minlength=keys.size)
+        sums = np.bincount(index, weights=data, minlength=keys.size)
+        mins = np.full(keys.size, np.inf)
+        maxs = np.full(keys.size, -np.inf)
+        np.minimum.at(mins, index, data)
+        np.maximum.at(maxs, index, data)
+        per_column[name] = (counts, sums, mins, maxs)
+
+    result = []
+    for i in np.argsort(-rows, kind='stable')[:limit]:
+        stats = {}
+        for name, (counts, sums, mins, maxs) in per_column.items():
+            n = int(counts[i])
+            stats[name] = {'count': n, 'sum': number(sums[i])} if not n else {
+                'count': n, 'sum': number(sums[i]), 'mean': number(sums[i] / n), 'min': number(mins[i]), 'max': number(maxs[i])
+            }
+        result.append({'value': keys[i] or EMPTY_GROUP, 'rows': int(rows[i]), 'columns': stats})
+    return result
+
+def local_days(arrays, offset_hours=0):
+    # Ngày (giờ địa phương = UTC + offset_hours) của từng dòng
+    import numpy as np
+    return (arrays.created + np.timedelta64(offset_hours, 'h')).astype('datetime64[D]')
+
+def day_mask(arrays, start=None, end=None, offset_hours=0):
+    # Lọc dòng tạo trong khoảng ngày [start, end] (date, bỏ trống = không giới hạn)
+    import numpy as np
+    days = local_days(arrays, offset_hours)
+    mask = np.ones(arrays.size, dtype=bool)
+    if start is not None:
+        mask &= days >= np.datetime64(start, 'D')
+    if end is not None:
+        mask &= days <= np.datetime64(end, 'D')
+    return mask
+
+def daily_sums(arrays, name, start, end, offset_hours=0):
+    # Tổng 1 cột số theo từng ngày [start, end]: {'YYYY-MM-DD': tổng}; ngày không có số liệu thì không có trong dict
+    import numpy as np
+    values = arrays.numeric.get(name)
+    if values is None or not arrays.size:
+        return {}
+    first = np.datetime64(start, 'D')
+    index = (local_days(arrays, offset_hours) - first).astype(np.int64)
+    days = int((np.datetime64(end, 'D') - first).astype(np.int64)) + 1
+    mask = (index >= 0) & (index < days) & ~np.isnan(values)
+    counts = np.bincount(index[mask], minlength=days)
+    sums = np.bincount(index[mask], weights=values[mask], minlength=days)
+    return {str(first + i): number(sums[i]) for i in np.flatnonzero(counts)}
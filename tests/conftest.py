@@ -0,0 +1,104 @@
+# File: tests/conftest.py
+# Chạy: python -m pytest -q  (database SQLite tạm, job chạy luôn trong request, không đụng dữ liệu thật)
+import os
+import re
+import sys
+import uuid
+import zipfile
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix='ghichu_test_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ['JOB_DIR'] = os.path.join(_tmp, 'jobs')
+os.environ['JOB_WORKERS'] = '0'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as app_module  # noqa: E402  (phải đặt biến môi trường trước khi nạp app)
+import excel_utils  # noqa: E402
+
+
+@pytest.fixture
+def m():
+    return app_module
+
+
+@pytest.fixture
+def client(m):
+    # Mỗi test 1 user mới + 1 bảng mới có 2 cột, đã đăng nhập
+    username = f'u{uuid.uuid4().hex[:8]}'
+    c = login_client(m, username)
+    with m.app.app_context():
+        user = m.User.query.filter_by(username=username).one()
+        table = m.AppTable(name=f'BẢNG {username}')
+        m.db.session.add(table)
+        m.db.session.commit()
+        m.invalidate_tables()
+        c.user_id, c.table_id = user.id, table.id
+    resp = c.post('/add_column', data={'table_id': c.table_id, 'col_name[]': ['Sản phẩm', 'Mác thép']})
+    assert resp.status_code == 302
+    return c
+
+
+@pytest.fixture
+def admin(m):
+    username = f'admin{uuid.uuid4().hex[:8]}'
+    with m.app.app_context():
+        m.db.session.add(m.User(username=username, password=m.generate_password_hash('x'), role='admin'))
+        m.db.session.commit()
+    return login_client(m, username, register=False)
+
+
+def login_client(m, username, register=True):
+    c = m.app.test_client()
+    if register:
+        c.post('/login', data={'username': username, 'password': 'x', 'action': 'register'})
+    c.post('/login', data={'username': username, 'password': 'x'})
+    return c
+
+
+@pytest.fixture
+def template(tmp_path):
+    # File mẫu thật gộp ô A4:M4 / A5:M5 nên C4, C5 không điền được: dùng bản sao bỏ 2 vùng gộp đó
+    src_path = os.path.join(ROOT, excel_utils.REPORT_TEMPLATE)
+    dst_path = str(tmp_path / 'mau_bao_cao.xlsx')
+    with zipfile.ZipFile(src_path) as src, zipfile.ZipFile(dst_path, 'w', zipfile.ZIP_DEFLATED) as dst:
+        sheet_path = excel_utils.active_sheet_path({name: src.read(name) for name in src.namelist()})
+        for info in src.infolist():
+            data = src.read(info.filename)
+            if info.filename == sheet_path:
+                data = re.sub(rb'<mergeCell ref="A[45]:M[45]"/>', b'', data)
+            dst.writestr(info, data)
+    return dst_path
+
+
+def columns(m, client):
+    with m.app.app_context():
+        return m.load_columns(client.user_id, client.table_id)
+
+
+def rows(m, client):
+    with m.app.app_context():
+        return [r.content for r in m.DataRow.query.filter_by(created_by=client.user_id, table_id=client.table_id).order_by(m.DataRow.id)]
+
+
+def download(client, url, **headers):
+    resp = client.get(url, headers=headers)
+    body = b''.join(resp.response)
+    resp.close()
+    return resp, body
+
+
+def run_job(client, url):
+    job = client.get(url, headers={'Accept': 'application/json'}).get_json()['job']
+    assert job['state'] == 'done', job  # JOB_WORKERS=0: job chạy xong ngay trong request
+    return download(client, job['download_url'])
+
+
+def add_rows(client, contents):
+    # Thêm nhiều dòng 1 lần qua API batch, trả về id theo đúng thứ tự gửi
+    data = client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [{'content': c, 'ref': i} for i, c in enumerate(contents)]}).get_json()
+    assert data['status'] == 'success', data
+    return [row['id'] for row in sorted(data['rows'], key=lambda row: row['ref'])]
@@ -0,0 +1,37 @@
+# File: tests/test_backup.py
+import gzip
+import json
+
+import pytest
+
+from conftest import add_rows, run_job
+
+
+@pytest.fixture
+def backup_rows(m, client, monkeypatch):
+    # Đọc database từng lô 2 dòng (không dùng ảnh chụp) để chắc chắn đi qua nhiều lô
+    monkeypatch.setattr(m, 'BACKUP_BATCH_SIZE', 2)
+    monkeypatch.setattr(m, 'SNAPSHOT_MAX_ROWS', 0)
+    contents = [{'Sản phẩm': f'Thép {i}', 'Mác thép': 'SAE1006'} for i in range(5)] + [{'Sản phẩm': ['Cuộn 1', 'Cuộn 2'], 'Mác thép': ''}]
+    add_rows(client, contents)
+    return contents
+
+
+def test_backup_json_has_every_row(client, backup_rows):
+    resp, body = run_job(client, '/backup_json')
+    assert resp.mimetype == 'application/json'
+    data = json.loads(body)
+    assert data['version'] == '2.0'
+    [table] = data['tables']
+    assert [col['name'] for col in table['columns']] == ['Sản phẩm', 'Mác thép']
+    assert [row['content'] for row in table['rows']] == backup_rows
+    assert all(row['created_at'] for row in table['rows'])
+
+
+def test_backup_ndjson_gzip(client, backup_rows):
+    resp, body = run_job(client, '/backup_json?format=ndjson&gzip=1')
+    assert resp.mimetype == 'application/gzip'
+    records = [json.loads(line) for line in gzip.decompress(body).decode('utf-8').splitlines()]
+    assert [r['type'] for r in records] == ['backup', 'table'] + ['row'] * len(backup_rows)
+    assert [r['content'] for r in records[2:]] == backup_rows
+    assert {r['table'] for r in records[2:]} == {records[1]['name']}
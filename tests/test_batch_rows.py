@@ -0,0 +1,63 @@
+# File: tests/test_batch_rows.py
+import uuid
+
+from conftest import add_rows, login_client, rows
+
+
+def batch(client, **body):
+    return client.post(f'/api/rows/{client.table_id}/batch', json=body).get_json()
+
+
+def test_batch_edit_copy_delete_in_one_request(m, client):
+    a, b, c = add_rows(client, [{'Sản phẩm': 'Thép cuộn', 'Mác thép': 'SAE1006'},
+                                {'Sản phẩm': 'Thép tấm', 'Mác thép': 'SS400'},
+                                {'Sản phẩm': 'Phôi', 'Mác thép': 'CB300'}])
+    data = batch(client,
+                 upserts=[{'id': a, 'content': {'Mác thép': 'SAE1008'}}, {'content': {'Sản phẩm': 'Cuộn 1\n\n Cuộn 2 '}, 'ref': 'moi'}],
+                 copies=[a, {'id': b, 'content': {'Sản phẩm': 'Thép tấm dày'}}],
+                 deletes=[c])
+    assert data['status'] == 'success', data
+    assert data['deleted'] == [c]
+    assert len(data['created']) == 3
+    by_id = {row['id']: row for row in data['rows']}
+    assert list(by_id) == [a] + data['created']  # sửa trước, rồi các dòng mới theo thứ tự gửi
+    assert by_id[a]['content'] == {'Sản phẩm': 'Thép cuộn', 'Mác thép': 'SAE1008'}  # cột không gửi giữ nguyên
+    new, copy_a, copy_b = data['created']
+    assert by_id[new]['ref'] == 'moi' and 'ref' not in by_id[copy_a]
+    assert by_id[new]['content'] == {'Sản phẩm': ['Cuộn 1', 'Cuộn 2'], 'Mác thép': ''}
+    assert by_id[copy_a]['content'] == by_id[a]['content']  # sao chép thấy nội dung vừa sửa
+    assert by_id[copy_b]['content'] == {'Sản phẩm': 'Thép tấm dày', 'Mác thép': 'SS400'}
+    assert len(rows(m, client)) == 5
+
+
+def test_batch_errors_write_nothing(m, client):
+    a, b = add_rows(client, [{'Sản phẩm': 'Thép cuộn'}, {'Sản phẩm': 'Thép tấm'}])
+    username = f'u{uuid.uuid4().hex[:8]}'
+    other = login_client(m, username)
+    with m.app.app_context():
+        other.user_id = m.User.query.filter_by(username=username).one().id
+    other.table_id = client.table_id
+    [foreign] = add_rows(other, [{'Sản phẩm': 'Của người khác'}])
+    before = rows(m, client)
+
+    errors = [
+        {'upserts': [{'id': a, 'content': {'Sản phẩm': 'X'}}], 'deletes': [foreign]},  # dòng của user khác
+        {'upserts': [{'id': a, 'content': {'Sản phẩm': 'X'}}], 'deletes': [a]},  # vừa sửa vừa xóa
+        {'upserts': [{'id': a}, {'id': a}]},
+        {'deletes': ['abc']},
+        {'upserts': [{'id': b, 'content': {'Sản phẩm': 'X'}}, {'content': ['không phải object']}]},
+        {'copies': {'id': a}},
+    ]
+    for body in errors:
+        data = batch(client, **body)
+        assert data['status'] == 'error', (body, data)
+    assert rows(m, client) == before
+    assert len(rows(m, other)) == 1
+
+
+def test_batch_size_limit(m, client, monkeypatch):
+    monkeypatch.setattr(m, 'BATCH_ROWS_MAX', 2)
+    data = batch(client, upserts=[{'content': {'Sản phẩm': str(i)}} for i in range(3)])
+    assert data['status'] == 'error' and '2' in data['message']
+    assert rows(m, client) == []
+    assert client.post(f'/api/rows/{client.table_id}/batch', data='không phải json').get_json()['status'] == 'error'
@@ -0,0 +1,46 @@
+# File: tests/test_cache_utils.py
+from cache_utils import TTLCache
+
+
+def test_ttl_cache_hit_expire_and_invalidate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('cache_utils.time.monotonic', lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=30)
+    loads = []
+
+    def loader(value):
+        return lambda: loads.append(value) or value
+
+    assert cache.get('a', loader(1)) == 1
+    assert cache.get('a', loader(2)) == 1  # còn hạn: không nạp lại
+    now[0] += 31
+    assert cache.get('a', loader(3)) == 3  # hết hạn
+    cache.invalidate('a')
+    assert cache.get('a', loader(4)) == 4
+    cache.get(('columns', 1, 5), loader(5))
+    cache.invalidate(match=lambda k: k[0] == 'columns')
+    assert cache.get(('columns', 1, 5), loader(6)) == 6
+    cache.get('b', loader(7))  # đầy (maxsize=2): bỏ key lâu không dùng nhất là 'a'
+    assert cache.get('a', loader(8)) == 8
+    assert loads == [1, 3, 4, 5, 6, 7, 8]
+    assert cache.stats()['evictions'] == 2
+
+
+def test_ttl_cache_drops_value_loaded_across_invalidate():
+    # Đang nạp (đã đọc giá trị cũ) thì process này đổi tên cột và xóa cache: giá trị cũ không được cất lại
+    cache = TTLCache()
+
+    def stale_loader():
+        cache.invalidate(('columns', 1, 1))
+        return ['Mác thép']
+
+    assert cache.get(('columns', 1, 1), stale_loader) == ['Mác thép']
+    assert cache.get(('columns', 1, 1), lambda: ['Mác']) == ['Mác']
+    assert cache.get(('columns', 1, 1), lambda: ['khác']) == ['Mác']  # lần nạp không bị chen thì cất bình thường
+
+    def cleared_loader():
+        cache.clear()
+        return 'cũ'
+
+    assert cache.get('x', cleared_loader) == 'cũ'
+    assert cache.get('x', lambda: 'mới') == 'mới'
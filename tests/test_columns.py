@@ -0,0 +1,92 @@
+# File: tests/test_columns.py
+import re
+import json
+
+from conftest import columns, rows
+
+
+def other_worker(m, statement, **params):
+    # Worker khác sửa cột: database đổi nhưng cache cột của process này không được báo
+    with m.app.app_context():
+        m.db.session.execute(m.db.text(statement), params)
+        m.db.session.commit()
+
+
+def test_save_row_after_rename_in_other_worker(m, client):
+    sp, mac = columns(m, client)
+    client.get(f'/table/{client.table_id}')  # cache cột (tên cũ) trong process này
+    other_worker(m, "UPDATE table_column SET name = 'Mác thép mới' WHERE id = :id", id=mac.id)
+
+    resp = client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'Thép cuộn', f'field_{mac.id}': 'SAE1006'})
+    assert resp.status_code == 302
+    assert rows(m, client) == [{'Sản phẩm': 'Thép cuộn', 'Mác thép mới': 'SAE1006'}]
+
+
+def test_save_row_after_add_column_in_other_worker(m, client):
+    sp, mac = columns(m, client)
+    client.get(f'/table/{client.table_id}')
+    other_worker(m, "INSERT INTO table_column (name, width, order_index, user_id, table_id) VALUES ('Bộ gap', '150px', 3, :u, :t)",
+                 u=client.user_id, t=client.table_id)
+    gap = columns(m, client)[2]
+
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'A', f'field_{mac.id}': 'B', f'field_{gap.id}': 'G1'})
+    assert rows(m, client) == [{'Sản phẩm': 'A', 'Mác thép': 'B', 'Bộ gap': 'G1'}]
+
+
+def test_edit_row_and_batch_rows_after_rename(m, client):
+    sp, mac = columns(m, client)
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'A', f'field_{mac.id}': 'B'})
+    client.get(f'/table/{client.table_id}')
+    resp = client.post('/batch_update_columns', json={'table_id': client.table_id, 'columns': [
+        {'id': sp.id, 'name': 'Sản phẩm', 'order': 1, 'width': '150px'},
+        {'id': mac.id, 'name': 'Mác', 'order': 2, 'width': '150px'}]})
+    assert resp.get_json()['status'] == 'success'
+    assert rows(m, client) == [{'Sản phẩm': 'A', 'Mác': 'B'}]
+
+    # Đổi tên lần nữa từ "worker khác", rồi sửa dòng qua form và qua API nhiều dòng
+    other_worker(m, "UPDATE table_column SET name = 'Mác 2' WHERE id = :id", id=mac.id)
+    other_worker(m, "UPDATE data_row SET content = :c WHERE table_id = :t", c='{"Sản phẩm": "A", "Mác 2": "B"}', t=client.table_id)
+    with m.app.app_context():
+        row_id = m.DataRow.query.filter_by(table_id=client.table_id).one().id
+    client.post('/save_row', data={'table_id': client.table_id, 'row_id': row_id, f'field_{sp.id}': 'A2', f'field_{mac.id}': 'B2'})
+    assert rows(m, client) == [{'Sản phẩm': 'A2', 'Mác 2': 'B2'}]
+
+    resp = client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [{'content': {'Sản phẩm': 'C', 'Mác 2': 'D'}}]})
+    assert resp.get_json()['status'] == 'success', resp.get_json()
+    assert rows(m, client)[-1] == {'Sản phẩm': 'C', 'Mác 2': 'D'}
+
+
+def test_column_edit_errors_roll_back(m, client):
+    sp, mac = columns(m, client)
+    with m.app.app_context():
+        version = m.get_table_version(client.user_id, client.table_id).version
+    resp = client.post('/batch_update_columns', json={'table_id': client.table_id, 'columns': [
+        {'id': sp.id, 'name': 'Trùng', 'order': 1, 'width': '150px'},
+        {'id': mac.id, 'name': 'Trùng', 'order': 2, 'width': '150px'}]})
+    assert resp.get_json() == {'status': 'error', 'message': 'Tên "Trùng" bị trùng!'}
+    client.post('/add_column', data={'table_id': client.table_id, 'col_name[]': ['Sản phẩm']})  # trùng tên: không thêm gì
+    assert columns(m, client) == [sp, mac]
+    with m.app.app_context():
+        assert m.get_table_version(client.user_id, client.table_id).version == version  # khóa phiên bản đã lấy thì được trả lại
+
+
+def test_dashboard_form_posts_column_ids(m, client):
+    sp, mac = columns(m, client)
+    page = client.get(f'/table/{client.table_id}').get_data(as_text=True)
+    meta = json.loads(re.search(r'<script id="column-meta-script" type="text/plain">(.*?)</script>', page, re.S).group(1))
+    assert [(col['id'], col['name']) for col in meta] == [(sp.id, 'Sản phẩm'), (mac.id, 'Mác thép')]
+
+    # Trang mở từ trước khi cột bị đổi tên ở nơi khác: form gửi theo id cột nên vẫn ghi đúng cột
+    other_worker(m, "UPDATE table_column SET name = 'Mác mới' WHERE id = :id", id=mac.id)
+    data = client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [
+        {'fields': {str(sp.id): 'Thép cuộn', str(mac.id): 'SAE1006'}}]}).get_json()
+    assert data['status'] == 'success', data
+    row_id = data['rows'][0]['id']
+    assert rows(m, client) == [{'Sản phẩm': 'Thép cuộn', 'Mác mới': 'SAE1006'}]
+
+    # Sửa: cột không gửi giữ giá trị cũ, id cột đã bị xóa thì bỏ qua
+    data = client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [
+        {'id': row_id, 'fields': {str(mac.id): 'SS400', '999999': 'x'}}]}).get_json()
+    assert data['status'] == 'success', data
+    assert rows(m, client) == [{'Sản phẩm': 'Thép cuộn', 'Mác mới': 'SS400'}]
+    assert client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [{'fields': ['x']}]}).get_json()['status'] == 'error'
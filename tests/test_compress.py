@@ -0,0 +1,52 @@
+# File: tests/test_compress.py
+import gzip
+
+import pytest
+
+import compress_utils
+from conftest import columns, download
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_page_compressed_by_accept_encoding(m, client, encoding):
+    if encoding == 'br' and compress_utils.brotli_module() is None:
+        pytest.skip('chưa cài Brotli')
+    sp, mac = columns(m, client)
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'Thép cuộn', f'field_{mac.id}': 'SAE1006'})
+    url = f'/table/{client.table_id}'
+    client.get(url)  # hiện hết thông báo flash, 2 lần tải sau ra cùng 1 trang
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+
+    resp = client.get(url, headers={'Accept-Encoding': encoding})
+    assert resp.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    body = gzip.decompress(resp.data) if encoding == 'gzip' else compress_utils.brotli_module().decompress(resp.data)
+    assert body == plain.data
+
+
+def test_cached_file_stream_compressed_with_weak_etag(m, client):
+    sp, mac = columns(m, client)
+    for i in range(30):
+        client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': f'Thép cuộn {i}', f'field_{mac.id}': 'SAE1006'})
+    run = client.get('/backup_json', headers={'Accept': 'application/json'}).get_json()['job']
+    _, plain_body = download(client, run['download_url'])
+    assert len(plain_body) >= m.COMPRESS_MIN_BYTES
+
+    # File từ cache (send_file, gửi dạng stream): nén dần, bỏ Content-Length, ETag thành W/"..."
+    resp, body = download(client, '/backup_json', **{'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+    assert gzip.decompress(body) == plain_body
+    etag = resp.headers['ETag']
+    assert etag.startswith('W/')
+    # Trình duyệt gửi lại ETag yếu vẫn nhận 304
+    assert client.get('/backup_json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+
+
+def test_small_and_binary_responses_not_compressed(m, client):
+    resp = client.get(f'/api/rows/{client.table_id}', headers={'Accept-Encoding': 'gzip'})
+    assert len(resp.data) < m.COMPRESS_MIN_BYTES and 'Content-Encoding' not in resp.headers
+    resp = client.get(f'/export_excel/{client.table_id}', headers={'Accept': 'application/json'})
+    xlsx, _ = download(client, resp.get_json()['job']['download_url'], **{'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in xlsx.headers  # xlsx đã là zip
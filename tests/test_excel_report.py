@@ -0,0 +1,75 @@
+# File: tests/test_excel_report.py
+import os
+
+from openpyxl import load_workbook
+
+import excel_utils
+from conftest import ROOT
+
+REPORT = {'date': '18/10/2026', 'supervisor': 'Nguyễn Văn A', 'output': '1250', 'notes': 'Lò 2 dừng 15 phút\nThay trục cán'}
+
+
+def filled_cells(ws):
+    return {ref: ws[ref].value for ref in excel_utils.REPORT_CELLS}
+
+
+def test_excel_report_fills_cells(template):
+    stream, err = excel_utils.create_excel_report(REPORT['date'], REPORT['supervisor'], REPORT['output'], REPORT['notes'], filename=template)
+    assert err is None
+    ws = load_workbook(stream).active
+    assert filled_cells(ws) == dict(zip(excel_utils.REPORT_CELLS, REPORT.values()))
+
+    # Các ô khác giữ nguyên như file mẫu
+    original = excel_utils.sheet_values(load_workbook(template).active)
+    others = {ref: value for ref, value in excel_utils.sheet_values(ws).items() if ref not in excel_utils.REPORT_CELLS}
+    assert others == {ref: value for ref, value in original.items() if ref not in excel_utils.REPORT_CELLS}
+
+
+def test_excel_report_empty_values_and_xml_chars(template):
+    stream, err = excel_utils.create_excel_report('', 'A & <B>', None, 'x\x01y', filename=template)
+    assert err is None
+    assert filled_cells(load_workbook(stream).active) == {'A5': None, 'C4': 'A & <B>', 'C5': None, 'B8': 'xy'}
+
+
+def test_template_with_merged_target_cell_is_rejected():
+    stream, err = excel_utils.create_excel_report(*REPORT.values(), filename=os.path.join(ROOT, excel_utils.REPORT_TEMPLATE))
+    assert stream is None
+    assert 'vùng gộp' in err
+
+
+def test_broken_splice_fails_on_template_load(template, monkeypatch):
+    # Ghép XML lệch (ở đây: ô điền bị ghi sang chỗ khác) phải bị phát hiện lúc nạp mẫu, không xuất file sai
+    render_cell = excel_utils.render_cell
+    monkeypatch.setattr(excel_utils, 'render_cell', lambda ref, attrs, value: render_cell(ref, attrs, None if ref == 'B8' else value))
+    monkeypatch.setattr(excel_utils, '_template_cache', {})
+    stream, err = excel_utils.create_excel_report(*REPORT.values(), filename=template)
+    assert stream is None
+    assert 'B8' in err
+
+
+def test_merged_excel_report_one_sheet_per_day(template, monkeypatch):
+    monkeypatch.setattr(excel_utils, 'REPORT_TEMPLATE', template)
+    reports = [dict(REPORT, date=f'{day}/10/2026', supervisor=f'Ca {day}', output=str(100 + day)) for day in (16, 17)]
+    reports.append(dict(reports[0], notes='Chạy lại ngày 16'))  # trùng ngày -> tên sheet phải khác
+    stream, err = excel_utils.create_batch_report('excel', reports, bundle='merged')
+    assert err is None
+
+    wb = load_workbook(stream)
+    assert wb.sheetnames == ['16-10-2026', '17-10-2026', '16-10-2026 (2)']
+    original = load_workbook(template).active
+    template_values = {ref: value for ref, value in excel_utils.sheet_values(original).items() if ref not in excel_utils.REPORT_CELLS}
+    for ws, report in zip(wb.worksheets, reports):
+        assert filled_cells(ws) == {'A5': report['date'], 'C4': report['supervisor'], 'C5': report['output'], 'B8': report['notes']}
+        assert {ref: value for ref, value in excel_utils.sheet_values(ws).items() if ref not in excel_utils.REPORT_CELLS} == template_values
+        # Mỗi sheet có bản riêng ảnh, vùng gộp, vùng in của sheet mẫu
+        assert len(ws._images) == len(original._images)
+        assert sorted(map(str, ws.merged_cells.ranges)) == sorted(map(str, original.merged_cells.ranges))
+        assert str(ws.print_area) == str(original.print_area).replace('Canhang', ws.title)
+    assert [bool(ws.sheet_view.tabSelected) for ws in wb.worksheets] == [bool(original.sheet_view.tabSelected), False, False]
+
+
+def test_merged_excel_report_rejects_bad_template(monkeypatch):
+    monkeypatch.setattr(excel_utils, 'REPORT_TEMPLATE', os.path.join(ROOT, excel_utils.REPORT_TEMPLATE))
+    stream, err = excel_utils.create_merged_excel_report([REPORT])
+    assert stream is None
+    assert 'vùng gộp' in err
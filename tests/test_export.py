@@ -0,0 +1,28 @@
+# File: tests/test_export.py
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from conftest import add_rows, run_job
+
+
+@pytest.mark.parametrize('snapshot', [True, False])
+def test_export_excel_streams_every_row(m, client, monkeypatch, snapshot):
+    # Không có ảnh chụp thì đọc database từng lô: lô 2 dòng để chắc chắn đi qua nhiều lô
+    monkeypatch.setattr(m, 'EXPORT_BATCH_SIZE', 2)
+    if not snapshot:
+        monkeypatch.setattr(m, 'SNAPSHOT_MAX_ROWS', 0)
+    contents = [{'Sản phẩm': f'Thép {i}', 'Mác thép': f'SAE{1000 + i}'} for i in range(5)]
+    contents.append({'Sản phẩm': ['Cuộn 1', 'Cuộn 2']})  # ô nhiều dòng, thiếu cột
+    ids = add_rows(client, contents)
+
+    resp, body = run_job(client, f'/export_excel/{client.table_id}')
+    assert resp.mimetype == m.XLSX_MIMETYPE
+    sheet = load_workbook(io.BytesIO(body), read_only=True).active
+    values = [list(row) for row in sheet.iter_rows(values_only=True)]
+    assert values[0] == ['ID', 'Ngày tạo', 'Sản phẩm', 'Mác thép']
+    # Dòng mới nhất lên đầu, ô danh sách nối bằng xuống dòng, ô thiếu để trống
+    assert [row[0] for row in values[1:]] == ids[::-1]
+    assert values[1][2:] == ['Cuộn 1\nCuộn 2', None]
+    assert values[-1][2:] == ['Thép 0', 'SAE1000']
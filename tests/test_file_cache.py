@@ -0,0 +1,73 @@
+# File: tests/test_file_cache.py
+import os
+
+from cache_utils import FileCache
+from conftest import columns, download, run_job
+
+
+def test_export_excel_cache_round_trip(m, client):
+    sp, mac = columns(m, client)
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'Thép cuộn', f'field_{mac.id}': 'SAE1006'})
+    url = f'/export_excel/{client.table_id}'
+
+    # Lần đầu: cache trống -> trình duyệt được chuyển sang trang chờ job
+    assert client.get(url).status_code == 302
+    _, first = run_job(client, url)
+
+    # Dữ liệu chưa đổi: trả luôn file trong cache, có ETag
+    resp, body = download(client, url)
+    assert resp.status_code == 200
+    assert body == first
+    etag = resp.headers['ETag']
+    assert etag
+
+    resp, body = download(client, url, **{'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert body == b''
+
+    # Sửa dữ liệu -> khóa cache đổi: ETag cũ không còn khớp, phải chạy job lại
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'Thép tấm', f'field_{mac.id}': 'SS400'})
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 302
+    _, second = run_job(client, url)
+    resp, body = download(client, url)
+    assert resp.status_code == 200
+    assert body == second
+    assert resp.headers['ETag'] != etag
+
+
+def test_backup_json_cache_hit_for_json_client(m, client):
+    sp, mac = columns(m, client)
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'A', f'field_{mac.id}': 'B'})
+    _, first = run_job(client, '/backup_json')
+    # Trúng cache: client chờ job kiểu fetch vẫn nhận job "đã xong" trỏ tới cùng file
+    _, again = run_job(client, '/backup_json')
+    assert again == first
+    assert 'Sản phẩm'.encode() in first
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    cache = FileCache(str(tmp_path / 'cache'), max_bytes=25)
+
+    def put(group, digest, used_at=None):
+        src = tmp_path / digest  # file kết quả của job (cache giữ hard link)
+        src.write_bytes(b'x' * 10)
+        path = cache.put(group, digest, str(src))
+        if used_at is not None:
+            os.utime(path, (used_at, used_at))
+        return path
+
+    put('u1_t1', 'd0', 1000)
+    put('u1_t2', 'd1', 1001)
+    assert cache.stats()['files'] == 2
+    put('u2', 'd2')  # 30 byte > 25: bỏ file lâu không dùng nhất
+    assert cache.get('u1_t1', 'd0') is None
+    assert cache.get('u1_t2', 'd1') is not None  # vừa dùng lại -> giờ u2 cũ hơn
+    os.utime(cache.path('u2', 'd2'), (1002, 1002))
+    put('u3', 'd3')
+    assert cache.get('u2', 'd2') is None
+    assert cache.stats()['files'] == 2 and cache.stats()['bytes'] == 20
+
+    # Xóa theo nhóm (dữ liệu bảng đổi), không đụng nhóm khác
+    cache.invalidate(lambda group: group.startswith('u1_'))
+    assert cache.get('u1_t2', 'd1') is None and cache.get('u3', 'd3') is not None
+    assert FileCache(str(tmp_path / 'off'), 0).put('u1', 'd', str(tmp_path / 'd3')) is None  # FILE_CACHE_MAX_MB=0: tắt
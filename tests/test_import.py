@@ -0,0 +1,69 @@
+# File: tests/test_import.py
+import io
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from conftest import rows
+
+JSON = {'Accept': 'application/json'}
+
+
+def import_file(client, data, filename):
+    resp = client.post(f'/import_rows/{client.table_id}', data={'file': (io.BytesIO(data), filename)},
+                       headers=JSON, content_type='multipart/form-data')
+    return resp.get_json()
+
+
+def test_import_csv_batches_and_rejects_bad_rows(m, client, monkeypatch):
+    monkeypatch.setattr(m, 'IMPORT_BATCH_SIZE', 2)
+    csv_text = ('Bảng thép tháng 10;;\n'
+                'san pham;MÁC THÉP;Ghi chú\n'  # tiêu đề ở dòng 2, khớp không dấu / không hoa thường
+                'Thép cuộn;SAE1006;x\n'
+                '"Cuộn 1\nCuộn 2";CB300;\n'
+                'Thép tấm;SS400;;dư ô\n'
+                ';;\n'
+                'Thép cuộn;SAE1006;y\n'  # trùng dòng trên (cột Ghi chú không có trong bảng)
+                'Phôi;#N/A;\n'
+                'Thép hình;SS540;\n')
+    data = import_file(client, csv_text.encode('utf-8'), 'thep.csv')
+    assert data['status'] == 'success', data
+    assert data['header_line'] == 2
+    assert data['columns'] == ['Sản phẩm', 'Mác thép']
+    assert data['unknown_headers'] == ['Ghi chú']
+    assert (data['added'], data['duplicates'], data['rejected']) == (3, 1, 2)
+    assert [e['line'] for e in data['errors']] == [6, 9]
+    assert rows(m, client) == [
+        {'Sản phẩm': 'Thép cuộn', 'Mác thép': 'SAE1006'},
+        {'Sản phẩm': ['Cuộn 1', 'Cuộn 2'], 'Mác thép': 'CB300'},
+        {'Sản phẩm': 'Thép hình', 'Mác thép': 'SS540'},
+    ]
+
+    # Nhập lại cùng file: mọi dòng đã có, không thêm gì
+    data = import_file(client, csv_text.encode('utf-8'), 'thep.csv')
+    assert (data['added'], data['duplicates']) == (0, 4)
+
+
+def test_import_xlsx_keeps_created_at(m, client):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['ID', 'Ngày tạo', 'Sản phẩm', 'Mác thép'])
+    ws.append([7, '05/10/2026 08:30', 'Thép cuộn', 1006])
+    ws.append([8, None, 'Thép tấm', 'SS400'])
+    buf = io.BytesIO()
+    wb.save(buf)
+    data = import_file(client, buf.getvalue(), 'thep.xlsx')
+    assert data['status'] == 'success', data
+    assert data['added'] == 2 and data['unknown_headers'] == []
+    with m.app.app_context():
+        saved = m.DataRow.query.filter_by(table_id=client.table_id, created_by=client.user_id).order_by(m.DataRow.id).all()
+        assert saved[0].content == {'Sản phẩm': 'Thép cuộn', 'Mác thép': '1006'}
+        assert saved[0].created_at == datetime(2026, 10, 5, 1, 30)  # giờ VN -> UTC
+
+
+def test_import_errors(client):
+    assert import_file(client, b'a,b\n1,2\n', 'thep.pdf')['status'] == 'error'
+    data = import_file(client, b'Khong,Khop\n1,2\n', 'thep.csv')
+    assert data['status'] == 'error' and 'tiêu đề' in data['message']
+    data = import_file(client, 'Mác thép\nThép'.encode('cp1252'), 'thep.csv')
+    assert data['status'] == 'error' and 'UTF-8' in data['message']
@@ -0,0 +1,77 @@
+# File: tests/test_jobs.py
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import download, login_client
+
+JSON = {'Accept': 'application/json'}
+
+
+@pytest.fixture
+def calls(m, monkeypatch):
+    # Thay việc xuất Excel bằng hàm ghi file nhỏ, đếm số lần chạy
+    calls = []
+
+    def handler(user_id, params, path):
+        calls.append(params)
+        if params.get('fail'):
+            raise RuntimeError('Hỏng giữa chừng')
+        with open(path, 'w') as f:
+            f.write(f"ok {params['n']}")
+    monkeypatch.setitem(m.JOB_HANDLERS, 'export_excel', handler)
+    return calls
+
+
+def add_job(m, client, status='queued', started_at=None, **params):
+    with m.app.app_context():
+        job = m.Job(id=uuid.uuid4().hex, kind='export_excel', user_id=client.user_id, params=params, status=status,
+                    started_at=started_at, filename='a.txt', mimetype='text/plain')
+        m.db.session.add(job)
+        m.db.session.commit()
+        return job.id
+
+
+def job_status(m, job_id):
+    with m.app.app_context():
+        return m.db.session.get(m.Job, job_id).status
+
+
+def test_job_claimed_once(m, client, calls):
+    job_id = add_job(m, client, n=1)
+    m.run_job(job_id)
+    m.run_job(job_id)  # process khác submit trùng: không giành được, không chạy lại
+    assert len(calls) == 1
+    job = client.get(f'/api/jobs/{job_id}', headers=JSON).get_json()['job']
+    assert job['state'] == 'done'
+    resp, body = download(client, job['download_url'])
+    assert resp.status_code == 200 and body == b'ok 1'
+
+
+def test_resume_jobs_requeues_only_stale(m, client, calls):
+    old = datetime.utcnow() - timedelta(minutes=m.JOB_STALE_MINUTES + 5)
+    stale = add_job(m, client, 'running', old, n=1)
+    busy = add_job(m, client, 'running', datetime.utcnow(), n=2)
+    queued = add_job(m, client, n=3)
+    with m.app.app_context():
+        m.resume_jobs()
+    assert job_status(m, stale) == 'done'
+    assert job_status(m, queued) == 'done'
+    assert job_status(m, busy) == 'running'  # process khác đang chạy, để yên
+    assert sorted(params['n'] for params in calls) == [1, 3]
+
+
+def test_job_error_and_other_user(m, client, calls):
+    job_id = add_job(m, client, n=1, fail=True)
+    m.run_job(job_id)
+    job = client.get(f'/api/jobs/{job_id}', headers=JSON).get_json()['job']
+    assert job['state'] == 'error' and job['error'] == 'Hỏng giữa chừng'
+    assert job['download_url'] is None
+    assert not os.path.exists(os.path.join(m.JOB_DIR, job_id))
+    assert client.get(f'/jobs/{job_id}/download').status_code == 302  # chưa có file: về trang chờ job
+
+    other = login_client(m, f'u{uuid.uuid4().hex[:8]}')
+    assert other.get(f'/api/jobs/{job_id}', headers=JSON).status_code == 404
+    assert other.get(f'/jobs/{job_id}/download').status_code == 404
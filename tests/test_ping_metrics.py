@@ -0,0 +1,81 @@
+# File: tests/test_ping_metrics.py
+JSON = {'Accept': 'application/json'}
+
+
+def test_ping_db_hides_pool_from_public(m, admin, monkeypatch):
+    anonymous = m.app.test_client()
+    data = anonymous.get('/ping_db', headers=JSON).get_json()
+    assert data['status'] == 'success' and 'pool' not in data
+    assert set(data) == {'status', 'connect_ms', 'query_ms', 'total_ms'}
+    assert anonymous.get('/ping_db').get_data(as_text=True).startswith('Hello Robot!')
+    assert 'pool' in admin.get('/ping_db', headers=JSON).get_json()
+
+    monkeypatch.setattr(m, 'METRICS_TOKEN', 'bi-mat')
+    assert 'pool' in anonymous.get('/ping_db', headers=dict(JSON, Authorization='Bearer bi-mat')).get_json()
+    assert 'pool' not in anonymous.get('/ping_db', headers=dict(JSON, Authorization='Bearer sai')).get_json()
+
+
+def test_engine_options_for_direct_and_pooler(m, monkeypatch):
+    monkeypatch.delenv('DB_PGBOUNCER', raising=False)
+    assert set(m.build_engine_options('sqlite:///x.db')) == {'json_serializer'}
+
+    direct = m.build_engine_options('postgresql://u:p@db.example.com:5432/app')
+    assert direct['pool_size'] == m.DB_POOL_SIZE and direct['pool_pre_ping'] == m.DB_PRE_PING
+    assert direct['pool_recycle'] == m.DB_POOL_RECYCLE
+    assert direct['connect_args']['options'] == f'-c statement_timeout={m.DB_STATEMENT_TIMEOUT_MS}'
+
+    # Cổng 6543 (pooler chế độ transaction): không gửi tham số session, psycopg 3 không tự prepare
+    pooled = m.build_engine_options('postgresql+psycopg://u:p@pooler.example.com:6543/app')
+    assert 'options' not in pooled['connect_args']
+    assert pooled['connect_args']['prepare_threshold'] is None
+    assert 'prepare_threshold' not in m.build_engine_options('postgresql+psycopg2://u:p@pooler.example.com:6543/app')['connect_args']
+
+    monkeypatch.setenv('DB_PGBOUNCER', '1')
+    assert 'options' not in m.build_engine_options('postgresql://u:p@db.example.com:5432/app')['connect_args']
+    monkeypatch.setenv('DB_PGBOUNCER', '0')
+    assert 'options' in m.build_engine_options('postgresql+psycopg2://u:p@pooler.example.com:6543/app')['connect_args']
+
+
+def test_metrics_requires_token_or_admin(m, client, admin, monkeypatch):
+    client.get(f'/api/rows/{client.table_id}')
+    assert m.app.test_client().get('/metrics').status_code == 403
+    assert client.get('/metrics').status_code == 403  # user thường
+
+    body = admin.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{' in body and 'endpoint="api_rows"' in body
+    assert 'http_request_duration_seconds_bucket{' in body
+    assert 'db_queries_per_request_bucket{' in body
+
+    monkeypatch.setattr(m, 'METRICS_TOKEN', 'bi-mat')
+    anonymous = m.app.test_client()
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer sai'}).status_code == 403
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer bi-mat'}).status_code == 200
+
+
+def render_count(m, kind):
+    return sum(hist.count for labels, hist in m.metrics.histograms('report_render_seconds') if labels['kind'] == kind)
+
+
+def test_sql_counts_n_plus_one_and_render_time(m, client, admin, monkeypatch):
+    monkeypatch.setattr(m, 'N_PLUS_ONE_THRESHOLD', 3)
+    with m.app.test_request_context():
+        m.start_sql_tracking()
+        for _ in range(3):
+            m.db.session.execute(m.db.text('SELECT 1')).scalar()
+        m.db.session.execute(m.db.text('SELECT 2')).scalar()
+        m.record_sql_usage('thu_n_plus_one')
+    assert dict((labels['endpoint'], value) for labels, value in m.metrics.counters('n_plus_one_warnings_total'))['thu_n_plus_one'] == 1
+    warning = next(w for w in m.metrics.warnings if w['endpoint'] == 'thu_n_plus_one')
+    assert (warning['repeats'], warning['queries'], warning['message']) == (3, 4, 'SELECT 1')
+    [(_, hist)] = [item for item in m.metrics.histograms('db_queries_per_request') if item[0]['endpoint'] == 'thu_n_plus_one']
+    assert (hist.count, hist.sum) == (1, 4)
+
+    before = render_count(m, 'export_excel')
+    client.get(f'/export_excel/{client.table_id}', headers={'Accept': 'application/json'})
+    assert render_count(m, 'export_excel') == before + 1
+
+    page = admin.get('/admin/metrics')
+    assert page.status_code == 200
+    html = page.get_data(as_text=True)
+    assert 'thu_n_plus_one' in html and 'export_excel' in html
+    assert client.get('/admin/metrics').status_code != 200
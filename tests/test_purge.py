@@ -0,0 +1,56 @@
+# File: tests/test_purge.py
+import pytest
+
+from conftest import add_rows, columns, login_client
+
+
+@pytest.fixture(autouse=True)
+def small_batches(m, monkeypatch):
+    # Lô nhỏ, không nghỉ: vài dòng cũng phải xóa qua nhiều lô
+    monkeypatch.setattr(m, 'PURGE_BATCH_SIZE', 2)
+    monkeypatch.setattr(m, 'PURGE_PAUSE_MS', 0)
+
+
+def count(m, model, **filters):
+    with m.app.app_context():
+        return model.query.filter_by(**filters).count()
+
+
+def last_purge(m, kind):
+    with m.app.app_context():
+        return m.Job.query.filter_by(kind=kind).order_by(m.Job.created_at.desc()).first()
+
+
+def test_delete_table_hides_then_purges_in_batches(m, client, admin):
+    add_rows(client, [{'Sản phẩm': f'Cuộn {i}'} for i in range(5)])
+    with m.app.app_context():
+        name = m.db.session.get(m.AppTable, client.table_id).name
+
+    admin.get(f'/admin/delete_table/{client.table_id}')
+    assert client.get(f'/api/rows/{client.table_id}').status_code == 404
+    job = last_purge(m, 'purge_table')
+    assert (job.status, job.progress, job.progress_total) == ('done', 5, 5)  # JOB_WORKERS=0: job chạy xong trong request
+    assert count(m, m.DataRow, table_id=client.table_id) == 0
+    assert count(m, m.TableColumn, table_id=client.table_id) == 0
+    assert count(m, m.AppTable, id=client.table_id) == 0
+    # Tên bảng cũ dùng lại được ngay
+    admin.post('/admin/add_table', data={'table_name': name})
+    assert count(m, m.AppTable, name=name) == 1
+
+
+def test_delete_user_blocks_login_and_purges_rows(m, client, admin):
+    sp, _ = columns(m, client)
+    add_rows(client, [{'Sản phẩm': f'Cuộn {i}'} for i in range(3)])
+    with m.app.app_context():
+        username = m.db.session.get(m.User, client.user_id).username
+    other = login_client(m, f'khac{client.user_id}')
+    other.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'Của người khác'})
+
+    admin.get(f'/admin/delete_user/{client.user_id}')
+    assert client.get(f'/api/rows/{client.table_id}').headers['Location'].startswith('/login')  # phiên cũ hết hiệu lực
+    assert last_purge(m, 'purge_user').status == 'done'
+    assert count(m, m.DataRow, created_by=client.user_id) == 0
+    assert count(m, m.User, id=client.user_id) == 0
+    assert count(m, m.DataRow, table_id=client.table_id) == 1  # dòng của user khác trong cùng bảng còn nguyên
+    # Tên đăng nhập cũ đăng ký lại được
+    assert login_client(m, username).get(f'/api/rows/{client.table_id}').get_json()['rows'] == []
@@ -0,0 +1,37 @@
+# File: tests/test_report_pool.py
+import os
+import sys
+import subprocess
+
+import excel_utils
+from conftest import ROOT
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_shutdown_report_pool_stops_children(monkeypatch):
+    monkeypatch.setattr(excel_utils, 'REPORT_WORKERS', 2)
+    assert excel_utils.pool_map(abs, [-1, -2, -3, -4]) == [1, 2, 3, 4]
+    pids = list(excel_utils._report_pool._processes)
+    assert pids and all(alive(pid) for pid in pids)
+    excel_utils.shutdown_report_pool()
+    assert excel_utils._report_pool is None
+    assert not any(alive(pid) for pid in pids)
+    assert excel_utils.pool_map(abs, [-5, -6, -7, -8]) == [5, 6, 7, 8]  # dùng lại thì tạo pool mới
+    excel_utils.shutdown_report_pool()
+
+
+def test_report_pool_children_exit_with_process():
+    # Process dùng pool rồi thoát mà không tự dừng pool: atexit dọn, không còn process con mồ côi
+    code = ('import excel_utils; excel_utils.REPORT_WORKERS = 2; excel_utils.pool_map(abs, [-1, -2, -3, -4]); '
+            'print(" ".join(map(str, excel_utils._report_pool._processes)))')
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    pids = [int(pid) for pid in result.stdout.split()]
+    assert pids and not any(alive(pid) for pid in pids)
@@ -0,0 +1,44 @@
+# File: tests/test_restore.py
+import io
+
+from conftest import columns, login_client, rows, run_job
+
+
+def restore(client, backup):
+    client.post('/restore_json', data={'file': (io.BytesIO(backup), 'backup.json')})
+    with client.session_transaction() as session:
+        return session.pop('_flashes')[-1][1]  # các thông báo trước chưa hiện (không mở trang nào) nên lấy cái cuối
+
+
+def test_restore_skips_rows_after_column_rename(m, client):
+    sp, mac = columns(m, client)
+    for product, grade in (('Thép cuộn', 'SAE1006'), ('Thép tấm', 'SS400')):
+        client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': product, f'field_{mac.id}': grade})
+
+    # Chỉ đổi tên (không đổi thứ tự): content_hash phải được tính lại ngay trong lần đổi tên
+    resp = client.post('/batch_update_columns', json={'table_id': client.table_id, 'columns': [
+        {'id': sp.id, 'name': 'Sản phẩm', 'order': 1, 'width': '150px'},
+        {'id': mac.id, 'name': 'Mác', 'order': 2, 'width': '150px'}]})
+    assert resp.get_json()['status'] == 'success'
+    with m.app.app_context():
+        saved = m.DataRow.query.filter_by(table_id=client.table_id).all()
+        assert [r.content_hash for r in saved] == [m.build_content_hash(r.content) for r in saved]
+
+    _, backup = run_job(client, '/backup_json')
+    assert restore(client, backup) == 'Xong! Đã thêm 0 dòng. Bỏ qua 2 dòng trùng lặp.'
+    assert rows(m, client) == [{'Sản phẩm': 'Thép cuộn', 'Mác': 'SAE1006'}, {'Sản phẩm': 'Thép tấm', 'Mác': 'SS400'}]
+
+
+def test_restore_into_other_user_creates_columns_and_rows(m, client):
+    sp, mac = columns(m, client)
+    client.post('/save_row', data={'table_id': client.table_id, f'field_{sp.id}': 'Thép cuộn', f'field_{mac.id}': 'SAE1006'})
+    _, backup = run_job(client, '/backup_json')
+
+    other = login_client(m, f'khoiphuc{client.user_id}')
+    with m.app.app_context():
+        other.user_id, other.table_id = m.User.query.filter_by(username=f'khoiphuc{client.user_id}').one().id, client.table_id
+    since = other.get(f'/api/rows/{client.table_id}/changes?since=0').get_json()['version']
+    assert restore(other, backup) == 'Xong! Đã thêm 1 dòng. Bỏ qua 0 dòng trùng lặp.'
+    assert [c.name for c in columns(m, other)] == ['Sản phẩm', 'Mác thép']
+    assert rows(m, other) == [{'Sản phẩm': 'Thép cuộn', 'Mác thép': 'SAE1006'}]
+    assert other.get(f'/api/rows/{client.table_id}/changes?since={since}').get_json()['reload'] is True  # cột mới -> tải lại trang
@@ -0,0 +1,41 @@
+# File: tests/test_rows_api.py
+from conftest import add_rows, login_client
+
+GRADES = ['SS400', 'SAE1006', 'Q235', 'SAE1006', 'A36', 'ss400', 'Q195']
+
+
+def all_pages(client, limit, **params):
+    ids, after, pages = [], None, 0
+    while True:
+        query = dict(params, limit=limit, **({'after': after} if after else {}))
+        data = client.get(f'/api/rows/{client.table_id}', query_string=query).get_json()
+        assert data['status'] == 'success'
+        assert len(data['rows']) <= limit
+        ids += [row['id'] for row in data['rows']]
+        pages += 1
+        if not data['has_more']:
+            assert data['next_cursor'] is None
+            return ids, pages
+        after = data['next_cursor']
+
+
+def test_keyset_pages_cover_every_row_once(m, client):
+    ids = add_rows(client, [{'Sản phẩm': f'Cuộn {i}', 'Mác thép': grade} for i, grade in enumerate(GRADES)])
+    grade_of = dict(zip(ids, GRADES))
+
+    # Thứ tự mặc định (sort_key theo cột đầu) lấy từ ảnh chụp trong RAM
+    assert all_pages(client, 3) == (ids, 3)
+
+    # Theo id, giảm dần
+    assert all_pages(client, 2, sort='id', desc='1')[0] == sorted(ids, reverse=True)
+
+    # Theo 1 cột (không phân biệt hoa thường), giá trị trùng nhau thì theo id: không mất / lặp dòng ở chỗ cắt trang
+    expected = sorted(ids, key=lambda i: (grade_of[i].lower(), i))
+    assert all_pages(client, 2, sort='Mác thép')[0] == expected
+    assert all_pages(client, 2, sort='Mác thép', desc='1')[0] == expected[::-1]
+
+
+def test_rows_api_only_returns_own_rows(m, client):
+    add_rows(client, [{'Sản phẩm': 'A', 'Mác thép': 'B'}])
+    other = login_client(m, f'khac{client.user_id}')
+    assert other.get(f'/api/rows/{client.table_id}').get_json()['rows'] == []
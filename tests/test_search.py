@@ -0,0 +1,43 @@
+# File: tests/test_search.py
+from conftest import add_rows
+
+
+def search(client, q, **params):
+    data = client.get(f'/api/search/{client.table_id}', query_string=dict(params, q=q)).get_json()
+    assert data['status'] == 'success', data
+    return data
+
+
+def found(client, q):
+    return sorted(row['id'] for row in search(client, q)['rows'])
+
+
+def test_search_accent_insensitive_and_synced(m, client):
+    coil, plate, bar = add_rows(client, [
+        {'Sản phẩm': 'Thép cuộn', 'Mác thép': 'SAE1006'},
+        {'Sản phẩm': 'Thép tấm ĐỎ', 'Mác thép': 'SS400'},
+        {'Sản phẩm': 'Thép thanh', 'Mác thép': ['A36', 'SS400']},  # ô nhiều dòng
+    ])
+    assert search(client, 'thep')['backend'] == 'fts5'
+    assert found(client, 'THEP') == [coil, plate, bar]
+    assert found(client, 'thép cuon') == [coil]
+    assert found(client, 'tam do') == [plate]
+    assert found(client, 'ss400') == [plate, bar]
+    assert found(client, 'a3') == [bar]  # từ < 3 ký tự: không qua FTS, lọc bằng LIKE
+    assert found(client, 'cuộn sae1006') == [coil]  # các từ ở 2 cột khác nhau
+
+    # Sửa / xóa dòng: bảng tìm kiếm cập nhật theo
+    resp = client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [{'id': coil, 'content': {'Mác thép': 'SPHC'}}], 'deletes': [plate]})
+    assert resp.get_json()['status'] == 'success'
+    assert found(client, 'sae1006') == []
+    assert found(client, 'sphc') == [coil]
+    assert found(client, 'ss400') == [bar]
+
+
+def test_search_pages_and_requires_terms(m, client):
+    ids = add_rows(client, [{'Sản phẩm': f'Cuộn {i}', 'Mác thép': 'Q235'} for i in range(5)])
+    first = search(client, 'q235', limit=3)
+    second = search(client, 'q235', limit=3, after=first['next_cursor'])
+    assert [row['id'] for row in first['rows'] + second['rows']] == ids
+    assert second['has_more'] is False
+    assert client.get(f'/api/search/{client.table_id}?q=%20').get_json()['status'] == 'error'
@@ -0,0 +1,64 @@
+# File: tests/test_snapshots.py
+from snapshot_utils import SnapshotCache, SnapshotRow, TableSnapshot
+from conftest import add_rows, columns
+
+
+def snapshot(m, client):
+    # (ảnh chụp, lần này là hits / patches / rebuilds)
+    with m.app.app_context():
+        before = m.table_snapshots.stats()
+        snap = m.get_table_snapshot(client.user_id, client.table_id)
+        after = m.table_snapshots.stats()
+        expected = [row.id for row in m.snapshot_query(client.user_id, client.table_id).order_by(m.DataRow.sort_key, m.DataRow.id)]
+    kind = next(k for k in ('hits', 'patches', 'rebuilds') if after[k] > before[k])
+    if snap is not None:
+        assert [row.id for row in snap.rows] == expected  # luôn khớp database, đúng thứ tự hiển thị
+    return snap, kind
+
+
+def test_snapshot_hit_patch_and_rebuild(m, client):
+    a, b, c = add_rows(client, [{'Sản phẩm': 'C'}, {'Sản phẩm': 'A'}, {'Sản phẩm': 'B'}])
+    first, kind = snapshot(m, client)
+    assert kind == 'rebuilds'
+    assert snapshot(m, client) == (first, 'hits')
+
+    # Sửa / thêm / xóa dòng: chỉ vá những dòng đổi vào ảnh cũ
+    data = client.post(f'/api/rows/{client.table_id}/batch', json={
+        'upserts': [{'id': a, 'content': {'Sản phẩm': 'Á'}}, {'content': {'Sản phẩm': 'D'}}], 'deletes': [b]}).get_json()
+    patched, kind = snapshot(m, client)
+    assert kind == 'patches' and patched.version == data['version']
+    assert patched.get(a).content['Sản phẩm'] == 'Á' and patched.get(b) is None
+    assert first.get(b) is not None  # ảnh cũ không bị sửa tại chỗ
+
+    # Đổi tên cột: chụp lại từ đầu
+    sp, mac = columns(m, client)
+    client.post('/batch_update_columns', json={'table_id': client.table_id, 'columns': [
+        {'id': sp.id, 'name': 'Hàng', 'order': 1, 'width': '150px'}, {'id': mac.id, 'name': 'Mác thép', 'order': 2, 'width': '150px'}]})
+    renamed, kind = snapshot(m, client)
+    assert kind == 'rebuilds'
+    assert renamed.col_names == ['Hàng', 'Mác thép'] and renamed.get(c).content['Hàng'] == 'B'
+
+
+def test_snapshot_skips_big_tables(m, client, monkeypatch):
+    monkeypatch.setattr(m, 'SNAPSHOT_TABLE_MAX_ROWS', 2)
+    add_rows(client, [{'Sản phẩm': str(i)} for i in range(3)])
+    assert snapshot(m, client) == (None, 'rebuilds')
+    # Nơi đọc tự lấy từ database, kết quả vẫn đủ
+    data = client.get(f'/api/rows/{client.table_id}').get_json()
+    assert len(data['rows']) == 3
+
+
+def test_snapshot_cache_limits_total_rows():
+    def snap(n):
+        return TableSnapshot(1, [], [SnapshotRow(i, None, {}, str(i)) for i in range(n)])
+    cache = SnapshotCache(max_rows=5)
+    cache.put('a', snap(2))
+    cache.put('b', snap(2))
+    cache.get('a')  # a vừa xem, b lâu nhất
+    cache.put('c', snap(1))
+    assert cache.stats()['rows'] == 5 and cache.evictions == 0
+    cache.put('d', snap(2))  # quá 5 dòng: bỏ b
+    assert cache.get('b') is None and cache.get('a') is not None
+    assert cache.stats()['rows'] == 5 and cache.evictions == 1
+    cache.invalidate(lambda key: key in ('a', 'd'))
+    assert cache.stats()['rows'] == 1 and cache.stats()['tables'] == 1
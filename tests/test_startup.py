@@ -0,0 +1,22 @@
+# File: tests/test_startup.py
+import os
+import sys
+import subprocess
+
+from conftest import ROOT
+
+
+def start_app(tmp_path, *code):
+    # Khởi động app trong process riêng (như 1 worker mới) trên cùng 1 database
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'khoidong.db'}", JOB_DIR=str(tmp_path / 'jobs'), JOB_WORKERS='0')
+    result = subprocess.run([sys.executable, '-c', '; '.join(code)], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_search_backend_detected_after_restart_and_migrate(tmp_path):
+    backend = 'import app; print(app.search_backend)'
+    assert start_app(tmp_path, backend) == 'fts5'  # lần đầu: tự nâng cấp, tạo bảng FTS
+    assert start_app(tmp_path, backend) == 'fts5'  # khởi động lại: cấu trúc đã mới, bỏ qua nâng cấp
+    start_app(tmp_path, 'import migrate_db', 'print()')
+    assert start_app(tmp_path, backend) == 'fts5'
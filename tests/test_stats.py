@@ -0,0 +1,49 @@
+# File: tests/test_stats.py
+from datetime import datetime
+
+from conftest import add_rows
+
+
+def stats(client, **params):
+    return client.get(f'/api/stats/{client.table_id}', query_string=params).get_json()
+
+
+def test_stats_group_by_and_date_filter(m, client):
+    client.post('/add_column', data={'table_id': client.table_id, 'col_name[]': ['Nhiệt lò nung']})
+    ids = add_rows(client, [
+        {'Sản phẩm': 'Cuộn 1', 'Mác thép': 'SAE1006', 'Nhiệt lò nung': '1200'},
+        {'Sản phẩm': 'Cuộn 2', 'Mác thép': 'SAE1006', 'Nhiệt lò nung': '1000'},
+        {'Sản phẩm': 'Cuộn 3', 'Mác thép': 'SS400', 'Nhiệt lò nung': '850,5'},
+        {'Sản phẩm': 'Cuộn 4', 'Mác thép': 'SS400', 'Nhiệt lò nung': ''},
+    ])
+    # Ngày tạo (UTC): 2 dòng đầu ngày 17/10 giờ VN, 2 dòng sau 18/10 giờ VN (18:00 UTC ngày 17 = 01:00 ngày 18 giờ VN)
+    created = [datetime(2026, 10, 17, 1), datetime(2026, 10, 17, 9), datetime(2026, 10, 17, 18), datetime(2026, 10, 18, 3)]
+    with m.app.app_context():
+        for row_id, at in zip(ids, created):
+            m.db.session.get(m.DataRow, row_id).created_at = at
+        m.bump_table_version(client.user_id, client.table_id)  # ảnh chụp / mảng đã rút nhận ra dữ liệu đổi
+        m.db.session.commit()
+
+    data = stats(client, group_by='Mác thép')
+    assert data['status'] == 'success', data
+    assert data['rows'] == 4 and data['numeric_columns'] == ['Nhiệt lò nung']
+    heat = data['columns']['Nhiệt lò nung']
+    assert (heat['count'], heat['missing'], heat['sum'], heat['min'], heat['max']) == (3, 1, 3050.5, 850.5, 1200)
+    assert data['groups'] == [
+        {'value': 'SAE1006', 'rows': 2, 'columns': {'Nhiệt lò nung': {'count': 2, 'sum': 2200, 'mean': 1100, 'min': 1000, 'max': 1200}}},
+        {'value': 'SS400', 'rows': 2, 'columns': {'Nhiệt lò nung': {'count': 1, 'sum': 850.5, 'mean': 850.5, 'min': 850.5, 'max': 850.5}}},
+    ]
+
+    day = stats(client, date_from='2026-10-18', date_to='2026-10-18')
+    assert day['rows'] == 2
+    assert day['columns']['Nhiệt lò nung']['sum'] == 850.5
+    assert stats(client, date_to='2026-10-17')['columns']['Nhiệt lò nung']['sum'] == 2200
+
+
+def test_stats_errors(m, client):
+    add_rows(client, [{'Sản phẩm': 'Cuộn 1', 'Mác thép': 'SAE1006'}])
+    assert stats(client, column='Mác thép') == {'status': 'error', 'message': 'Không phải cột số: Mác thép'}
+    assert stats(client, group_by='Không có') == {'status': 'error', 'message': 'Không có cột: Không có'}
+    assert stats(client, date_from='18/10/2026')['message'] == 'date_from phải có dạng YYYY-MM-DD!'
+    assert stats(client, bins='0')['status'] == 'error'
+    assert stats(client, percentiles='5,x')['message'] == 'percentiles / bins phải là số!'
@@ -0,0 +1,54 @@
+# File: tests/test_sync.py
+from datetime import datetime, timedelta
+
+from conftest import add_rows, columns
+
+
+def changes(client, since):
+    data = client.get(f'/api/rows/{client.table_id}/changes', query_string={'since': since}).get_json()
+    assert data['status'] == 'success', data
+    return data
+
+
+def test_changes_report_new_edited_and_deleted_rows(m, client):
+    start = changes(client, 0)['version']
+    keep, edit, drop = add_rows(client, [{'Sản phẩm': 'A'}, {'Sản phẩm': 'B'}, {'Sản phẩm': 'C'}])
+    after_add = changes(client, start)
+    assert [row['id'] for row in after_add['rows']] == [keep, edit, drop]
+    assert after_add['deleted'] == [] and after_add['reload'] is False
+
+    v = after_add['version']
+    client.post(f'/api/rows/{client.table_id}/batch', json={'upserts': [{'id': edit, 'content': {'Sản phẩm': 'B2'}}]})
+    client.get(f'/delete_row/{drop}')
+    delta = changes(client, v)
+    assert [(row['id'], row['content']['Sản phẩm']) for row in delta['rows']] == [(edit, 'B2')]
+    assert delta['deleted'] == [drop]
+    assert changes(client, delta['version']) == dict(delta, rows=[], deleted=[])
+
+    # Từ phiên bản đầu: dòng thêm rồi xóa chỉ còn dấu xóa
+    from_start = changes(client, start)
+    assert sorted(row['id'] for row in from_start['rows']) == [keep, edit]
+    assert from_start['deleted'] == [drop]
+
+
+def test_changes_ask_for_reload(m, client):
+    sp, mac = columns(m, client)
+    v = changes(client, 0)['version']
+    assert changes(client, v + 1)['reload'] is True  # phiên bản client lạ (mới hơn server)
+
+    # Đổi cột -> client phải tải lại trang
+    client.post('/batch_update_columns', json={'table_id': client.table_id, 'columns': [
+        {'id': sp.id, 'name': 'Sản phẩm', 'order': 2, 'width': '150px'},
+        {'id': mac.id, 'name': 'Mác thép', 'order': 1, 'width': '150px'}]})
+    assert changes(client, v)['reload'] is True
+
+    # Dấu xóa quá SYNC_KEEP_HOURS bị dọn -> client đứng trước lần dọn phải tải lại
+    v = changes(client, 0)['version']
+    row_id, = add_rows(client, [{'Sản phẩm': 'A'}])
+    client.get(f'/delete_row/{row_id}')
+    assert changes(client, v)['deleted'] == [row_id]
+    with m.app.app_context():
+        m.DeletedRow.query.filter_by(table_id=client.table_id).update({'deleted_at': datetime.utcnow() - timedelta(hours=m.SYNC_KEEP_HOURS + 1)})
+        m.prune_deleted_rows()
+        m.db.session.commit()
+    assert changes(client, v)['reload'] is True
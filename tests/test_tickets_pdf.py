@@ -0,0 +1,36 @@
+# File: tests/test_tickets_pdf.py
+import io
+
+from pypdf import PdfReader
+
+from conftest import add_rows, run_job
+
+JSON = {'Accept': 'application/json'}
+
+
+def print_rows(client, ids):
+    return client.post(f'/print_rows/{client.table_id}', json={'ids': ids}, headers=JSON).get_json()['job']['status_url']
+
+
+def pdf_fonts(reader):
+    return {str(font.get_object()['/BaseFont']) for page in reader.pages for font in page['/Resources']['/Font'].values()}
+
+
+def test_print_rows_pdf_keeps_vietnamese(client):
+    ids = add_rows(client, [{'Sản phẩm': 'Thép cuộn', 'Mác thép': 'SAE1006'}, {'Sản phẩm': 'Phôi vuông đường kính', 'Mác thép': 'CB300'}])
+    resp, body = run_job(client, print_rows(client, ids))
+    assert resp.status_code == 200 and resp.mimetype == 'application/pdf'
+    reader = PdfReader(io.BytesIO(body))
+    assert len(reader.pages) == 2  # mỗi phiếu 1 trang
+    text = '\n'.join(page.extract_text() for page in reader.pages)
+    assert 'Thép cuộn' in text and 'Phôi vuông đường kính' in text
+    assert any('DejaVuSans' in font for font in pdf_fonts(reader))
+
+
+def test_print_rows_missing_font_fails(client, monkeypatch):
+    import excel_utils
+    monkeypatch.setattr(excel_utils, 'PDF_FONT_PATH', '/khong/co/font.ttf')
+    ids = add_rows(client, [{'Sản phẩm': 'Thép cuộn'}])
+    job = client.get(print_rows(client, ids), headers=JSON).get_json()['job']
+    assert job['state'] == 'error'
+    assert 'Không tìm thấy font PDF' in job['error']